@@ -2,10 +2,28 @@
     The base_automata module contains a BaseAutomata class which provides a basic template for automata implementations
 """
 
+import array
+import bisect
 import random
 import math
+import hashlib
+import itertools
 from abc import ABC, abstractmethod
-from functools import reduce
+from collections import namedtuple
+from automata.stats_store import StatsStore
+from automata.profiler import PhaseProfiler
+from automata import checkpoint
+
+# a light description of a single generation - handed to observers and yielded by iter_generations
+# state_counts: number of cells in each state, events: per generation event counts (None if the automaton has none),
+# moves: dict of flat target index: flat source index of the cells moved by the transition (None if not tracked)
+GenerationSnapshot = namedtuple("GenerationSnapshot", ["generation", "state_counts", "events", "moves"])
+
+
+def derive_seed(seed, *keys):
+    """ returns a 64 bit seed derived from a seed and a path of keys - used to spawn independent child streams """
+    digest = hashlib.sha256(("%s|%s" % (seed, "|".join(str(key) for key in keys))).encode()).digest()
+    return int.from_bytes(digest[:8], "big")
 
 
 class BaseAutomaton(ABC):
@@ -15,22 +33,42 @@ class BaseAutomaton(ABC):
         will raise a NotImplementedError if required methods are not implemented
     """
 
-    def __init__(self, height, width, radius, num_of_states):
+    def __init__(self, height, width, radius, num_of_states, rng_seed=None, stats_store=None):
         """ :param height - how many rows in the world state grid
             :param width  - how many columns in the world state grid
             :param radius - the neighborhood radius of each cell (i.e distance in cells)
             :param num_of_states - the number of possible states for the automaton
+            :param rng_seed - seed of the automaton random streams, the same seed gives the same run (None - random)
+            :param stats_store - optional StatsStore (e.g a ring buffer for long runs), a growable store by default
 
          """
+        # each automaton owns its random streams - runs are reproducible and automatons can run side by side
+        self.rng_seed = rng_seed if rng_seed is not None else random.SystemRandom().getrandbits(64)
+        self.rng = random.Random(derive_seed(self.rng_seed, "main"))  # seeding and transition rule draws
+        self.neighbor_rng = random.Random(derive_seed(self.rng_seed, "neighbors"))  # neighbor order shuffles
+        self.spawn_count = 0  # number of child streams spawned so far
         self.height = height
         self.width = width
         self.radius = radius
-        self.neighbors = {}  # holds a list of neighbor coords for each cell - to avoid recalculating each time
+        # neighborhood index - see __build_neighborhood__, built on the first generation transition
+        self.neighbor_offsets = None  # (dy, dx) of every cell in the radius (the cell itself included)
+        self.neighbor_flat_offsets = None  # the same offsets in a row-major flat grid (dy * width + dx)
+        self.boundary_masks = None  # bit i is set if offset i is inside the grid - one mask per boundary class
+        self.boundary_class = None  # flat array - the boundary class of each cell (interior cells share one class)
+        self.class_neighbors = None  # the in-grid (dy, dx) offsets of each boundary class in this generation's order
+        self.class_flat_neighbors = None  # the same as class_neighbors as flat offsets
         self.num_of_states = num_of_states
 
         # used to generate stats
         self.generation_count = 0  # incremented after each generation transition
-        self.gen_state_count = {}  # a dict of (state, generation): count
+        self.state_counts = None  # number of cells in each state at the current generation
+        self.stats = stats_store if stats_store is not None else StatsStore()  # counts of recorded generations
+        self.stats.allocate(num_of_states, self.__get_num_of_event_columns__())
+        self.observers = []  # notified after every generation - see add_observer
+        self.profiler = None  # PhaseProfiler while profiling is enabled - see enable_profiling
+        self.back_grid = None  # the reusable grid buffer of the next generation - see __get_back_buffer__
+        self.static_rows = None  # template of the back buffer - the fill state with the static cells placed
+        self.static_fill = None  # the fill state of static_rows
 
         # IMPORTANT! seed generation happens during init!
         self.grid = self.__get_seed_grid__()
@@ -46,9 +84,39 @@ class BaseAutomaton(ABC):
         return self.width
 
     def get_grid(self):
-        """ returns the world state grid  """
+        """ returns the world state grid - a live buffer, reused for later generations (copy it to keep it) """
         return self.grid
 
+    def get_flat_grid(self):
+        """ returns the world state grid as row-major bytes - a byte per cell (e.g for recording or rendering) """
+        return bytes(itertools.chain.from_iterable(self.grid))
+
+    def get_rng_seed(self):
+        """ returns the seed of the automaton random streams - pass it to a new automaton to repeat the run """
+        return self.rng_seed
+
+    def spawn_rng_seeds(self, count):
+        """ returns seeds for independent child streams (e.g for replicates) - deterministic given the seed """
+        seeds = [derive_seed(self.rng_seed, "spawn", self.spawn_count + i) for i in range(0, count)]
+        self.spawn_count += count
+        return seeds
+
+    def spawn_rngs(self, count):
+        """ returns independent child random streams - see spawn_rng_seeds """
+        return [random.Random(seed) for seed in self.spawn_rng_seeds(count)]
+
+    def get_tiles(self, tile_height, tile_width):
+        """
+            returns a list of (y_start, y_end, x_start, x_end) tiles which partition the grid, in row-major tile order -
+            a tile's transition reads its cells and a one cell halo around them (see the tiled module)
+        """
+        return [(y, min(y + tile_height, self.height), x, min(x + tile_width, self.width))
+                for y in range(0, self.height, tile_height) for x in range(0, self.width, tile_width)]
+
+    def get_tile_seed(self, tile_idx):
+        """ returns the seed of a tile's random stream in the current generation - independent of who runs the tile """
+        return derive_seed(self.rng_seed, "tile", self.generation_count, tile_idx)
+
     def get_num_of_states(self):
         """ get the number of possible states for each cell in the automaton """
         return self.num_of_states
@@ -63,15 +131,72 @@ class BaseAutomaton(ABC):
                 cells_in_rad.append((y, x))  # add neighbor to list
         return cells_in_rad
 
+    @staticmethod
+    def __get_edge_classes__(size, radius):
+        """ returns (class of each coordinate, (near edge, far edge) distance of each class) along a grid axis """
+        classes, edges = [], []
+        for i in range(0, size):
+            edge = (min(i, radius), min(size - 1 - i, radius))  # coords farther than radius from both edges are alike
+            if edge not in edges:
+                edges.append(edge)
+            classes.append(edges.index(edge))
+        return classes, edges
+
+    def __build_neighborhood__(self):
+        """
+            Builds the neighborhood index - an offset table of the cells in the radius and a boundary class per cell.
+            Cells whose neighborhood is clipped by the same grid edges share a class (all interior cells share one),
+            the boundary mask of a class marks which offsets are inside the grid. O(cells) bytes, no per cell tuples.
+        """
+        radius = self.radius
+        axis = range(-radius, radius + 1)
+        self.neighbor_offsets = tuple((dy, dx) for dy in axis for dx in axis)  # the order of get_cells_in_radius
+        self.neighbor_flat_offsets = array.array("l", (dy * self.width + dx for dy, dx in self.neighbor_offsets))
+        row_classes, row_edges = self.__get_edge_classes__(self.height, radius)
+        col_classes, col_edges = self.__get_edge_classes__(self.width, radius)
+        self.boundary_masks = []
+        for top, bottom in row_edges:
+            for left, right in col_edges:
+                self.boundary_masks.append(sum(1 << i for i, (dy, dx) in enumerate(self.neighbor_offsets)
+                                               if -top <= dy <= bottom and -left <= dx <= right))
+        typecode = "B" if len(self.boundary_masks) <= 256 else "H"
+        # a row of classes per row class - the flat array is built by concatenating rows in C
+        row_templates = [array.array(typecode, (row_class * len(col_edges) + col_class for col_class in col_classes))
+                         for row_class in range(0, len(row_edges))]
+        self.boundary_class = array.array(typecode)
+        for row_class in row_classes:
+            self.boundary_class += row_templates[row_class]
+        self.__order_neighborhood__(range(0, len(self.neighbor_offsets)))
+
+    def __order_neighborhood__(self, order):
+        """ sets the neighbor order of every boundary class - the in-grid offsets of each class in the given order """
+        self.class_neighbors = [tuple(self.neighbor_offsets[i] for i in order if mask >> i & 1)
+                                for mask in self.boundary_masks]
+        self.class_flat_neighbors = [tuple(self.neighbor_flat_offsets[i] for i in order if mask >> i & 1)
+                                     for mask in self.boundary_masks]
+
+    def __permute_neighborhood__(self):
+        """ draws a new random neighbor order for the next generation - a single shuffle of the offset table """
+        if self.boundary_class is None:
+            self.__build_neighborhood__()
+        # IMPORTANT!!!!!!!!!! randomize the order of neighbors
+        # if you don't randomize the order, you might create a bias toward lower coords!
+        order = list(range(0, len(self.neighbor_offsets)))
+        self.neighbor_rng.shuffle(order)
+        self.__order_neighborhood__(order)
+
     def __get_neighbors_at__(self, pos):
-        """ returns a list of neighbors cell coordinates of the given position - default impl is for a square grid """
-        # if not in the dict: calculate it, add to dict, return it
-        if pos not in self.neighbors:
-            neighbors = self.get_cells_in_radius(pos, self.radius)
-            # IMPORTANT!!!!!!!!!! randomize the order of neighbors
-            random.shuffle(neighbors)  # if you don't randomize the order, you might create a bias toward lower coords!
-            self.neighbors[pos] = tuple(neighbors)  # add neighbors to dict
-        return self.neighbors[pos]
+        """ returns a list of neighbors cell coordinates of the given position - in this generation's random order """
+        if self.boundary_class is None:
+            self.__build_neighborhood__()
+        y, x = pos
+        return [(y + dy, x + dx) for dy, dx in self.class_neighbors[self.boundary_class[y * self.width + x]]]
+
+    def __get_flat_neighbors_at__(self, idx):
+        """ returns the flat grid indices of the neighbors of a flat grid index - in the same order as above """
+        if self.boundary_class is None:
+            self.__build_neighborhood__()
+        return [idx + offset for offset in self.class_flat_neighbors[self.boundary_class[idx]]]
 
     @abstractmethod
     def __get_seed_grid__(self):
@@ -85,31 +210,199 @@ class BaseAutomaton(ABC):
         # SUBCLASSES OF BASE AUTOMATA MUST IMPLEMENT THIS METHOD AND RETURN GRID OF STATES OF THE NEXT GENERATION
         raise NotImplementedError("this method must be overridden by a subclasses of BaseAutomata")
 
+    def __get_static_cells__(self):
+        """ returns a dict of (y, x): state of cells which never change (e.g exits) - placed in every back buffer """
+        return {}
+
+    def __get_back_buffer__(self, fill_state):
+        """
+            Returns a grid (list of rows) for the next generation - every cell set to fill_state except static cells.
+            The grid is one of two buffers which are swapped after each transition, so no grid is allocated per
+            generation - rows are reset from a template with a C level slice copy.
+        """
+        if self.static_rows is None or self.static_fill != fill_state:
+            self.static_rows = [[fill_state] * self.width for _ in range(0, self.height)]
+            self.static_fill = fill_state
+            for (y, x), state in self.__get_static_cells__().items():
+                self.static_rows[y][x] = state
+        if self.back_grid is None or self.back_grid is self.grid:
+            self.back_grid = [list(row) for row in self.static_rows]  # the second buffer - allocated once
+        else:
+            for row, static_row in zip(self.back_grid, self.static_rows):
+                row[:] = static_row
+        return self.back_grid
+
+    def __get_num_of_event_columns__(self):
+        """ returns the number of per generation event counters to record (e.g escapes per exit) - none by default """
+        return 0
+
+    def __get_gen_events__(self):
+        """ returns the event counts of the current generation (one per event column) - None if there are none """
+        return None
+
+    def __recount_states__(self):
+        """ returns a list of the number of cells in each state - counts every row (in C, no flattening) """
+        return [sum(row.count(state) for row in self.grid) for state in range(0, self.num_of_states)]
+
+    def __count_states__(self):
+        """ returns a list of the number of cells in each state - subclasses may count incrementally from changes """
+        return self.__recount_states__()
+
     def __update_stats__(self):
         """ records how many states of each kind were present at each generation"""
-        # flatten the grid into a 1d list of states
-        flat_grid = reduce(lambda x, y: x + y, self.grid)
-        # init a local dict count states
-        state_count = {state: 0 for state in range(0, self.num_of_states)}
-        # count the number of states per each generation
-        for state in flat_grid:
-            state_count[state] += 1
-        # IMPORTANT!!! THIS IS A MEMORY LEAK! LONG RUNNING AUTOMATONS MAY SUFFER!!!!
-        self.gen_state_count[self.generation_count] = state_count  # add the state count to generational dict
+        self.state_counts = self.__count_states__()
+        self.stats.record(self.generation_count, self.state_counts, self.__get_gen_events__())
+
+    def get_state_count(self, state):
+        """ returns the number of cells in a given state at the current generation """
+        return self.state_counts[state]
+
+    def get_stats(self):
+        """ returns the StatsStore holding the per generation statistics """
+        return self.stats
 
     def get_gen_state_count(self):
         """ returns a dict of generation_num:state_dict where state_dict:num number of states at given generation"""
-        return self.gen_state_count
+        # built from the stats store - only recorded generations are included (see StatsStore ring_size and every)
+        return {generation: dict(enumerate(counts)) for generation, counts, _ in self.stats.iter_rows()}
 
     def get_gen_count(self):
         """ returns the count of generations"""
         return self.generation_count
 
+    def __get_gen_moves__(self):
+        """ returns a dict of flat target index: flat source index of the moves of the last transition, if tracked """
+        return None
+
+    def get_snapshot(self):
+        """ returns a GenerationSnapshot of the current generation """
+        return GenerationSnapshot(self.generation_count, self.state_counts, self.__get_gen_events__(),
+                                  self.__get_gen_moves__())
+
+    def add_observer(self, observer):
+        """ attaches an observer (see observers module) - it's notified after every generation transition """
+        self.observers.append(observer)
+        observer.on_start(self)
+
+    def remove_observer(self, observer):
+        """ detaches an observer """
+        self.observers.remove(observer)
+
+    def enable_profiling(self, profiler=None):
+        """ times each phase of every following generation transition - returns the PhaseProfiler (see profiler) """
+        self.profiler = profiler if profiler is not None else PhaseProfiler()
+        return self.profiler
+
+    def disable_profiling(self):
+        """ stops timing generation transitions - returns the PhaseProfiler with the times collected so far """
+        profiler, self.profiler = self.profiler, None
+        return profiler
+
+    def __set_flat_grid__(self, flat_grid):
+        """ sets the world state grid from row-major bytes (see get_flat_grid) """
+        self.grid = [list(flat_grid[i:i + self.width]) for i in range(0, self.height * self.width, self.width)]
+        self.back_grid = None
+
+    def __get_checkpoint_state__(self):
+        """
+            returns (dict of json values, dict of name: bytes sections) of the dynamic state of the automaton - copies,
+            so they can be written while the automaton goes on. Subclasses with more state extend both.
+        """
+        rng_value, rng_section = checkpoint.get_rng_state(self.rng)
+        neighbor_rng_value, neighbor_rng_section = checkpoint.get_rng_state(self.neighbor_rng)
+        stats_state, sections = self.stats.__get_checkpoint_state__()
+        state = {"automaton": type(self).__name__, "height": self.height, "width": self.width,
+                 "num_of_states": self.num_of_states, "rng_seed": self.rng_seed, "spawn_count": self.spawn_count,
+                 "generation_count": self.generation_count, "state_counts": list(self.state_counts),
+                 "rng": rng_value, "neighbor_rng": neighbor_rng_value, "stats": stats_state}
+        sections.update({"grid": self.get_flat_grid(), "rng": rng_section, "neighbor_rng": neighbor_rng_section})
+        return state, sections
+
+    def __set_checkpoint_state__(self, state, sections):
+        """ restores the dynamic state of the automaton from __get_checkpoint_state__ values """
+        automaton = (type(self).__name__, self.height, self.width, self.num_of_states)
+        saved = (state["automaton"], state["height"], state["width"], state["num_of_states"])
+        if saved != automaton:
+            raise ValueError("checkpoint of a %s (%sx%s, %s states) doesn't match this %s (%sx%s, %s states)" %
+                             (saved + automaton))
+        self.rng_seed = state["rng_seed"]  # tile streams are derived from it
+        self.spawn_count = state["spawn_count"]
+        self.generation_count = state["generation_count"]
+        self.state_counts = list(state["state_counts"])
+        checkpoint.set_rng_state(self.rng, state["rng"], sections["rng"])
+        checkpoint.set_rng_state(self.neighbor_rng, state["neighbor_rng"], sections["neighbor_rng"])
+        self.stats.__set_checkpoint_state__(state["stats"], sections)
+        self.__set_flat_grid__(sections["grid"])
+
+    def get_checkpoint(self):
+        """ returns a (state, sections) checkpoint of the current generation - see the checkpoint module """
+        return self.__get_checkpoint_state__()
+
+    def save_checkpoint(self, path, compress_level=6):
+        """ atomically writes a checkpoint file of the current generation - see CheckpointWriter for periodic ones """
+        checkpoint.save_checkpoint(path, self.get_checkpoint(), compress_level)
+
+    def restore_checkpoint(self, path):
+        """
+            Restores the generation of a checkpoint file and returns the automaton - the automaton must have been
+            created with the same parameters as the checkpointed one, it then goes on with the same generations
+        """
+        self.__set_checkpoint_state__(*checkpoint.load_checkpoint(path))
+        return self
+
     def update_world_state(self):
         """ transitions the automaton to its next generation """
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start_generation()
+        self.__permute_neighborhood__()
+        if profiler is not None:
+            profiler.lap("permute")
+        front_grid = self.grid
         self.grid = self.__get_next_generation__()
+        if self.grid is self.back_grid:
+            self.back_grid = front_grid  # swap buffers - the previous generation's grid is reused next time
         self.generation_count += 1  # increment before recording stats
+        if profiler is not None:
+            profiler.lap("transition")  # the part of the transition which wasn't lapped by the automaton
         self.__update_stats__()  # handle statistics record here
+        if profiler is not None:
+            profiler.lap("stats")
+        if self.observers:
+            snapshot = self.get_snapshot()
+            for observer in self.observers:
+                observer.on_generation(self, snapshot)
+            if profiler is not None:
+                profiler.lap("observers")
+        if profiler is not None:
+            profiler.end_generation(self.generation_count)
+
+    def iter_generations(self, max_generations=None, until=None):
+        """
+            Generator - transitions the automaton and yields a GenerationSnapshot for each new generation.
+            Stops at a terminal state, after max_generations or once until(automaton, snapshot) returns True.
+        """
+        generations = 0
+        while not self.is_terminal() and (max_generations is None or generations < max_generations):
+            self.update_world_state()
+            generations += 1
+            snapshot = self.get_snapshot()
+            yield snapshot
+            if until is not None and until(self, snapshot):
+                return
+
+    def run(self, observers=(), max_generations=None, until=None):
+        """ runs the automaton (see iter_generations) with the given observers attached and returns it """
+        for observer in observers:
+            self.add_observer(observer)
+        try:
+            for _ in self.iter_generations(max_generations, until):
+                pass
+        finally:
+            for observer in observers:
+                self.remove_observer(observer)
+                observer.on_end(self)
+        return self
 
     def is_terminal(self):
         """ returns true if automaton has reached a quiescent state - this may never be True!!"""
@@ -128,14 +421,15 @@ class BaseStochasticAutomaton(BaseAutomaton):
         norm_factor = sum(list_of_weights)
         return list(map(lambda s: s / norm_factor, list_of_weights))  # normalize and subtract from 1
 
-    @staticmethod
-    def rand_prob_choice(choices, probabilities):
+    def rand_prob_choice(self, choices, probabilities, rand_prob=None):
         """
             Randomly choose an item from list of choices, with probability specified by probabilities list
             :param choices: list of items from which to choose a single item
             :param probabilities: a list of probabilities corresponding with list of items (same index)
+            :param rand_prob: an already drawn uniform float (see rand_uniforms), drawn here if not given
         """
-        rand_prob = random.random()  # generate random float between 0 and 1
+        if rand_prob is None:
+            rand_prob = self.rng.random()  # generate random float between 0 and 1
         prob_sum = 0
         for i in range(0, len(probabilities)):  # sum probabilities until random number is exceeded
             prob_sum += probabilities[i]
@@ -143,32 +437,72 @@ class BaseStochasticAutomaton(BaseAutomaton):
                 return choices[i]
         raise RuntimeError(" this should never happen! check choices and probabilities!")
 
-    @staticmethod
-    def rand_choice(choices):
+    def rand_weighted_index(self, cum_weights, rand_prob=None):
+        """
+            Randomly choose an index with probability proportional to its weight - an inverse CDF lookup by bisection,
+            O(log n) with no normalization (the draw is scaled to the total weight instead)
+            :param cum_weights: cumulative weights (e.g from itertools.accumulate), zero weight items are never chosen
+            :param rand_prob: an already drawn uniform float (see rand_uniforms), drawn here if not given
+        """
+        if rand_prob is None:
+            rand_prob = self.rng.random()
+        return bisect.bisect_right(cum_weights, rand_prob * cum_weights[-1], 0, len(cum_weights) - 1)
+
+    def rand_choice(self, choices):
         """ randomly choose an item with equal probability for each item """
-        return random.choice(choices)
+        return self.rng.choice(choices)
 
-    @staticmethod
-    def rand_int(range_s, range_e):
+    def rand_int(self, range_s, range_e):
         """ generate a random integer within given range """
-        return random.randint(range_s, range_e)
+        return self.rng.randint(range_s, range_e)
 
-    @staticmethod
-    def rand_seed(height, width, min_state, max_state, interval, fill_state, evenly_dist):
+    def rand_uniforms(self, count):
+        """ bulk draw - returns a list of count random floats between 0 and 1 (e.g one per person per generation) """
+        rand = self.rng.random
+        return [rand() for _ in range(0, count)]
+
+    def rand_states(self, count, min_state, max_state):
+        """
+            bulk draw - returns bytes of count uniformly random states between min_state and max_state (0-255 inclusive)
+            Random bytes are drawn with getrandbits - bytes at or above the largest multiple of the number of states are
+            rejected, the others are mapped to a state by their remainder (translated in C)
+        """
+        if not 0 <= min_state <= max_state <= 255:
+            raise ValueError("states must be between 0 and 255 - got %s to %s" % (min_state, max_state))
+        num_of_values = max_state - min_state + 1
+        limit = 256 - 256 % num_of_values  # bytes below the limit are uniform over the states
+        rejected = bytes(range(limit, 256))
+        to_state = bytes(min_state + b % num_of_values if b < limit else 0 for b in range(0, 256))
+        states = b""
+        while len(states) < count:
+            num_of_bytes = (count - len(states)) * 256 // limit + 16  # enough for the expected number of rejections
+            states += self.rng.getrandbits(8 * num_of_bytes).to_bytes(num_of_bytes, "little").translate(to_state,
+                                                                                                        rejected)
+        return states[:count]
+
+    def rand_seed(self, height, width, min_state, max_state, interval, fill_state, evenly_dist=True):
         """
             Generate a randomized a seed state grid
             Every grid cell at an interval position will get a random state between min_state and max_state(inclusive)
             Every grid cell between intervals will set to fill_state
         """
+        # the states of all interval cells are drawn in bulk - one state per interval cell in row-major order
+        interval_rows = range(0, height, interval)
+        row_draws = len(range(0, width, interval))
+        states = self.rand_states(len(interval_rows) * row_draws, min_state, max_state)
         seed_grid = []
         for y in range(0, height):
-            seed_grid.append([])
-            for x in range(0, width):
-                # generate a random state in every third row,column cell - all others will be left at state 0
-                state = random.randint(min_state, max_state) if (x % interval, y % interval) == (0, 0) else fill_state
-                # if not evenly distributed option is selected - people will be seeded on only a quarter of the grid
-                state = fill_state if not evenly_dist and (x > int(width / 2) or y > int(height / 2)) else state
-                seed_grid[y].append(state)
+            row = [fill_state] * width  # all others will be left at fill state
+            if y % interval == 0:
+                start = (y // interval) * row_draws
+                row[::interval] = states[start:start + row_draws]
+            # if not evenly distributed option is selected - people will be seeded on only a quarter of the grid
+            if not evenly_dist:
+                if y > int(height / 2):
+                    row = [fill_state] * width
+                else:
+                    row[int(width / 2) + 1:] = [fill_state] * (width - int(width / 2) - 1)
+            seed_grid.append(row)
         return seed_grid
 
     @staticmethod
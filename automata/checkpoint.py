@@ -0,0 +1,165 @@
+"""
+    The checkpoint module saves the dynamic state of a running automaton to a compact binary checkpoint and restores it,
+    so a long run can be resumed after a crash - a resumed run continues with the same generations as the original.
+    Create the automaton with the same parameters and call restore_checkpoint (see BaseAutomaton) before running it.
+    The state is the grid, the generation count, the statistics buffers and the random stream states (the neighbor
+    order of each generation is drawn from a random stream, so it's restored with it). Tables which only depend on
+    the parameters (the neighborhood index, exit areas, floor fields) aren't saved - they're rebuilt from them, and
+    the floor field key (a hash of the metric and floor plan) is saved so a checkpoint of another floor is rejected.
+
+    File layout (little endian header, section data in the machine's byte order):
+        header   - magic, version, length of a json blob of the state values and of the section names and lengths
+        sections - zlib compressed concatenation of the binary sections (the grid, random stream states, statistics)
+    Checkpoints are written to a temporary file which replaces the previous checkpoint only once it's complete, so a
+    crash while writing leaves the previous checkpoint intact. CheckpointWriter writes them on a background thread.
+"""
+
+import array
+import json
+import os
+import queue
+import struct
+import threading
+import zlib
+from automata.observers import Observer
+
+MAGIC = b"CACKPT01"
+VERSION = 1
+HEADER_FORMAT = "<8sII"  # magic, version, json length
+RNG_TYPECODE = "I"  # the 32 bit words of a mersenne twister state
+TEMP_SUFFIX = ".tmp"
+
+
+def get_rng_state(rng):
+    """ returns (json value, section bytes) of the state of a random.Random """
+    version, words, gauss_next = rng.getstate()
+    return [version, gauss_next], array.array(RNG_TYPECODE, words).tobytes()
+
+
+def set_rng_state(rng, value, section):
+    """ restores the state of a random.Random from get_rng_state values """
+    words = array.array(RNG_TYPECODE)
+    words.frombytes(section)
+    version, gauss_next = value
+    rng.setstate((version, tuple(words), gauss_next))
+
+
+def encode_checkpoint(state, sections, compress_level=6):
+    """
+        Returns checkpoint file data
+        :param state: dict of json values
+        :param sections: dict of name: bytes-like binary sections
+        :param compress_level: zlib compression level (1 fastest - 9 smallest)
+    """
+    names = sorted(sections)
+    description = json.dumps({"state": state, "sections": [[name, len(sections[name])] for name in names]}).encode()
+    compressor = zlib.compressobj(compress_level)
+    data = [struct.pack(HEADER_FORMAT, MAGIC, VERSION, len(description)), description]
+    data.extend(compressor.compress(sections[name]) for name in names)  # no joined copy of the sections
+    data.append(compressor.flush())
+    return b"".join(data)
+
+
+def decode_checkpoint(data):
+    """ returns (state, sections) of checkpoint file data - see encode_checkpoint """
+    magic, version, json_length = struct.unpack_from(HEADER_FORMAT, data)
+    if magic != MAGIC:
+        raise ValueError("not a checkpoint file")
+    if version != VERSION:
+        raise ValueError("unsupported checkpoint version: %s" % version)
+    offset = struct.calcsize(HEADER_FORMAT)
+    description = json.loads(data[offset:offset + json_length].decode())
+    section_data = zlib.decompress(data[offset + json_length:])
+    sections, start = {}, 0
+    for name, length in description["sections"]:
+        sections[name] = section_data[start:start + length]
+        start += length
+    if start != len(section_data):
+        raise ValueError("corrupt checkpoint file - expected %s section bytes, got %s" % (start, len(section_data)))
+    return description["state"], sections
+
+
+def write_atomic(path, data):
+    """ writes a file through a temporary file which replaces it once it's complete and flushed to disk """
+    temp_path = path + TEMP_SUFFIX
+    with open(temp_path, "wb") as temp_file:
+        temp_file.write(data)
+        temp_file.flush()
+        os.fsync(temp_file.fileno())
+    os.replace(temp_path, path)
+
+
+def save_checkpoint(path, checkpoint, compress_level=6):
+    """ atomically writes a (state, sections) checkpoint of an automaton (see BaseAutomaton.get_checkpoint) """
+    write_atomic(path, encode_checkpoint(checkpoint[0], checkpoint[1], compress_level))
+
+
+def load_checkpoint(path):
+    """ returns the (state, sections) of a checkpoint file """
+    with open(path, "rb") as checkpoint_file:
+        return decode_checkpoint(checkpoint_file.read())
+
+
+class CheckpointWriter(Observer):
+    """
+        observer which checkpoints an automaton every N generations - the state is copied between generations and
+        compressed and written on a background thread (zlib releases the GIL), so stepping goes on meanwhile
+    """
+
+    def __init__(self, path, every=1000, compress_level=6, on_end=True, max_pending=1):
+        """
+            :param path: checkpoint file path - each checkpoint atomically replaces the previous one
+            :param every: checkpoint every `every` generations
+            :param compress_level: zlib compression level (1 fastest - 9 smallest)
+            :param on_end: also checkpoint the last generation of a run
+            :param max_pending: checkpoints waiting to be written - the simulation waits when the writer falls behind
+        """
+        if every < 1:
+            raise ValueError("every must be a positive number of generations")
+        self.path = path
+        self.every = every
+        self.compress_level = compress_level
+        self.checkpoint_on_end = on_end
+        self.checkpoints = queue.Queue(max_pending)
+        self.writer = None
+        self.error = None  # an exception raised by the writer thread - re-raised by on_end
+        self.written = 0
+        self.last_generation = None  # generation of the last submitted checkpoint
+
+    def on_start(self, automaton):
+        self.writer = threading.Thread(target=self.__write_checkpoints__, name="checkpoint writer", daemon=True)
+        self.writer.start()
+
+    def on_generation(self, automaton, snapshot):
+        if snapshot.generation % self.every == 0:
+            self.__submit__(automaton)
+
+    def on_end(self, automaton):
+        """ checkpoints the last generation (if it wasn't) and waits until every submitted checkpoint is written """
+        if self.writer is not None:
+            if self.checkpoint_on_end and self.last_generation != automaton.get_gen_count():
+                self.__submit__(automaton)
+            self.checkpoints.put(None)
+            self.writer.join()
+            self.writer = None
+        if self.error is not None:
+            raise self.error
+
+    def __submit__(self, automaton):
+        """ hands a copy of the automaton state to the writer thread """
+        self.last_generation = automaton.get_gen_count()
+        self.checkpoints.put(automaton.get_checkpoint())
+
+    def __write_checkpoints__(self):
+        """ writer thread - encodes and writes checkpoints until the end of the run """
+        while True:
+            checkpoint = self.checkpoints.get()
+            if checkpoint is None:
+                return
+            if self.error is not None:
+                continue  # keep draining so the simulation never blocks
+            try:
+                save_checkpoint(self.path, checkpoint, self.compress_level)
+                self.written += 1
+            except Exception as error:
+                self.error = error
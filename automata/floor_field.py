@@ -0,0 +1,271 @@
+"""
+    The floor_field module precomputes static floor fields - the distance from every grid cell to each exit.
+    Exits never move, so the distances are calculated once and every later distance query is a table lookup.
+    The last few sets of fields (and their powers) are kept in memory per process (a small lru cache - see
+    clear_memory_cache), and obstacle aware fields, which are slow to compute, are also cached on disk (keyed by grid
+    size, exits, metric and obstacles), so parameter sweeps and replicates running in other processes reuse them.
+"""
+
+import array
+import hashlib
+import heapq
+import math
+import os
+import sys
+import tempfile
+from collections import deque, OrderedDict
+
+# supported distance metrics
+METRIC_CHEBYSHEV = "cheb"  # straight line chebyshev distance - the number of moves on an open floor
+METRIC_MANHATTAN = "man"  # straight line manhattan distance
+METRIC_EUCLIDEAN = "euc"  # straight line euclidean distance
+METRIC_BFS = "bfs"  # obstacle aware number of moves to the exit (breadth first search over passable cells)
+METRIC_DIJKSTRA = "dijkstra"  # obstacle aware path length, diagonal steps cost sqrt(2) (dijkstra over passable cells)
+METRICS = (METRIC_CHEBYSHEV, METRIC_MANHATTAN, METRIC_EUCLIDEAN, METRIC_BFS, METRIC_DIJKSTRA)
+
+FIELD_TYPECODE = "f"  # 4 byte floats - exact for whole distances, unreachable cells are inf
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "automata_floor_fields")
+MAX_FIELDS_IN_MEMORY = 8  # sets of fields kept in memory per process
+MAX_POWERS_IN_MEMORY = 8  # tables of field powers kept in memory per process
+
+
+class _LruCache:
+    """ a dict which keeps only the maxsize most recently used items """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+
+    def get(self, key):
+        """ returns the value of a key (now the most recently used), or None if it isn't cached """
+        value = self.items.get(key)
+        if value is not None:
+            self.items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        """ adds an item - the least recently used item is dropped when the cache is full """
+        self.items[key] = value
+        self.items.move_to_end(key)
+        while len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+
+    def clear(self):
+        self.items.clear()
+
+
+_fields_in_memory = _LruCache(MAX_FIELDS_IN_MEMORY)  # cache key: tuple of fields (one per exit)
+_MASK_TABLE = bytes([0]) + bytes([1]) * 255  # byte: 1 if truthy
+_INF_TABLE = bytes(int(b == 0x7f) for b in range(0, 256))  # top byte of a 4 byte float: 1 if inf (see is_inf_mask)
+_powers_in_memory = _LruCache(MAX_POWERS_IN_MEMORY)  # (cache key, power[, "cells"]): fields raised to the power
+
+
+def clear_memory_cache():
+    """ drops the fields and powers kept in memory (automatons keep the tables they already use) """
+    _fields_in_memory.clear()
+    _powers_in_memory.clear()
+
+
+def to_mask(cells):
+    """ returns a flat sequence as bytes where a truthy cell is 1 and a falsy cell is 0 - translated in C for bytes """
+    if isinstance(cells, (bytes, bytearray)):
+        return bytes(cells).translate(_MASK_TABLE)
+    return bytes(bool(cell) for cell in cells)
+
+
+def is_inf_mask(field):
+    """
+        returns bytes where a cell of a field is 1 if its distance is inf and 0 otherwise - found in C from the top
+        byte of each 4 byte float (0x7f is inf - distances are far below 2 ** 127)
+    """
+    top_byte = 3 if sys.byteorder == "little" else 0
+    return field.tobytes()[top_byte::4].translate(_INF_TABLE)
+
+
+def _straight_line_field(height, width, exit_pos, metric):
+    """ returns a flat field of straight line distances from every cell to the exit """
+    exit_y, exit_x = exit_pos
+    col_dist = [abs(x - exit_x) for x in range(0, width)]
+    field = array.array(FIELD_TYPECODE)
+    for y in range(0, height):
+        row_dist = abs(y - exit_y)
+        if metric == METRIC_CHEBYSHEV:
+            field.extend([row_dist if row_dist >= c else c for c in col_dist])
+        elif metric == METRIC_MANHATTAN:
+            field.extend([row_dist + c for c in col_dist])
+        else:
+            field.extend([math.sqrt(row_dist ** 2 + c ** 2) for c in col_dist])
+    return field
+
+
+def _flat_neighbors(idx, height, width):
+    """ yields (flat index, is diagonal) of the cells within a chebyshev distance of 1 of a flat index """
+    y, x = divmod(idx, width)
+    for n_y in range(max(0, y - 1), min(height, y + 2)):
+        for n_x in range(max(0, x - 1), min(width, x + 2)):
+            if n_y != y or n_x != x:
+                yield n_y * width + n_x, n_y != y and n_x != x
+
+
+def _path_field(height, width, exit_pos, metric, passable):
+    """ returns a flat field of shortest path lengths from every cell to the exit, moving only over passable cells """
+    exit_idx = exit_pos[0] * width + exit_pos[1]
+    field = array.array(FIELD_TYPECODE, [math.inf]) * (height * width)
+    field[exit_idx] = 0
+    if metric == METRIC_BFS:
+        # every move costs one generation - a breadth first search visits cells in order of distance
+        queue = deque([exit_idx])
+        while queue:
+            idx = queue.popleft()
+            next_dist = field[idx] + 1
+            for n_idx, _ in _flat_neighbors(idx, height, width):
+                if field[n_idx] == math.inf and (passable is None or passable[n_idx]):
+                    field[n_idx] = next_dist
+                    queue.append(n_idx)
+    else:
+        dist = {exit_idx: 0.0}  # double precision while searching, stored as a field afterwards
+        heap = [(0.0, exit_idx)]
+        while heap:
+            cur_dist, idx = heapq.heappop(heap)
+            if cur_dist > dist[idx]:
+                continue  # stale heap entry
+            for n_idx, is_diagonal in _flat_neighbors(idx, height, width):
+                if passable is not None and not passable[n_idx]:
+                    continue
+                n_dist = cur_dist + (math.sqrt(2) if is_diagonal else 1.0)
+                if n_dist < dist.get(n_idx, math.inf):
+                    dist[n_idx] = n_dist
+                    heapq.heappush(heap, (n_dist, n_idx))
+        for idx, cur_dist in dist.items():
+            field[idx] = cur_dist
+    return field
+
+
+def _cache_key(height, width, exits, metric, passable):
+    """ returns a string key which identifies a set of fields - used as a disk cache file name """
+    exits = [(int(exit_y), int(exit_x)) for exit_y, exit_x in exits]  # the same key for lists, tuples, numpy ints..
+    key = hashlib.sha1(("%s|%s|%s|%s|" % (height, width, metric, exits)).encode())
+    if passable is not None:
+        key.update(b"walls:" + to_mask(passable))  # wall cells are inf in every field
+    return "floor_field_" + key.hexdigest()
+
+
+def _load_from_disk(path, num_of_fields, field_size):
+    """ returns a tuple of fields read from a cache file, or None if there's no valid cache file """
+    try:
+        with open(path, "rb") as cache_file:
+            data = cache_file.read()
+    except OSError:
+        return None
+    flat = array.array(FIELD_TYPECODE)
+    if len(data) != num_of_fields * field_size * flat.itemsize:
+        return None  # truncated or stale file - recalculate
+    flat.frombytes(data)
+    return tuple(flat[i * field_size:(i + 1) * field_size] for i in range(0, num_of_fields))
+
+
+def _save_to_disk(path, fields):
+    """ writes the fields to a cache file - atomically, so concurrent processes never read a partial file """
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = "%s.%s.tmp" % (path, os.getpid())
+        with open(tmp_path, "wb") as cache_file:
+            for field in fields:
+                field.tofile(cache_file)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass  # the disk cache is only an optimization
+
+
+def get_fields(height, width, exits, metric=METRIC_CHEBYSHEV, passable=None, cache_dir=DEFAULT_CACHE_DIR):
+    """
+        Returns a tuple of flat (row-major) distance fields, one per exit in the given exits order.
+        :param height: number of rows in the grid
+        :param width: number of columns in the grid
+        :param exits: list of exit coordinates
+        :param metric: one of METRICS
+        :param passable: optional flat sequence, a falsy value marks a cell that can't be walked through (a wall) -
+                         path metrics go around walls, the distance of a wall cell is inf with every metric
+        :param cache_dir: directory of the disk cache of obstacle aware fields, None disables the disk cache
+                          (straight line fields are quick to compute - they're never written to disk)
+    """
+    if metric not in METRICS:
+        raise ValueError("unknown distance metric: %s - expected one of %s" % (metric, METRICS))
+    key = _cache_key(height, width, exits, metric, passable)
+    fields = _fields_in_memory.get(key)
+    if fields is not None:
+        return fields
+
+    is_path_metric = metric in (METRIC_BFS, METRIC_DIJKSTRA)
+    cache_path = os.path.join(cache_dir, key + ".bin") if cache_dir is not None and is_path_metric else None
+    fields = _load_from_disk(cache_path, len(exits), height * width) if cache_path is not None else None
+    if fields is None:
+        if is_path_metric:
+            fields = tuple(_path_field(height, width, exit_pos, metric, passable) for exit_pos in exits)
+        else:
+            fields = tuple(_straight_line_field(height, width, exit_pos, metric) for exit_pos in exits)
+            if passable is not None:
+                walls = [idx for idx, cell in enumerate(to_mask(passable)) if not cell]
+                for field in fields:
+                    for idx in walls:
+                        field[idx] = math.inf  # straight lines ignore walls - but a wall cell is never a target
+        if cache_path is not None:
+            _save_to_disk(cache_path, fields)
+    _fields_in_memory.put(key, fields)
+    return fields
+
+
+class FloorField:
+    """ static floor field of a grid - O(1) distance lookups from any cell to any exit """
+
+    def __init__(self, height, width, exits, metric=METRIC_CHEBYSHEV, passable=None, cache_dir=DEFAULT_CACHE_DIR):
+        """ see get_fields for parameter documentation """
+        self.width = width
+        self.size = height * width
+        self.metric = metric
+        self.exits = exits
+        self.key = _cache_key(height, width, exits, metric, passable)
+        self.fields = dict(zip(exits, get_fields(height, width, exits, metric, passable, cache_dir)))
+
+    def get_powers(self, power):
+        """ returns a tuple of double precision fields (same order as exits) with every distance raised to a power """
+        key = (self.key, power)
+        powers = _powers_in_memory.get(key)
+        if powers is None:
+            powers = tuple(array.array("d", [dist ** power for dist in self.fields[exit_pos]])
+                           for exit_pos in self.exits)
+            _powers_in_memory.put(key, powers)
+        return powers
+
+    def get_cell_powers(self, power):
+        """
+            Returns the same values as get_powers in a single cell-major field - the powers of all exits of cell idx
+            are the slice [idx * len(exits):(idx + 1) * len(exits)], so a cell's values are read with one C slice
+        """
+        key = (self.key, power, "cells")
+        cell_powers = _powers_in_memory.get(key)
+        if cell_powers is None:
+            num_of_exits = len(self.exits)
+            powers = self.get_powers(power)
+            num_of_cells = len(powers[0]) if powers else 0
+            cell_powers = array.array("d", bytes(8 * num_of_exits * num_of_cells))
+            for i, exit_powers in enumerate(powers):
+                cell_powers[i::num_of_exits] = exit_powers  # interleaved in C
+            _powers_in_memory.put(key, cell_powers)
+        return cell_powers
+
+    def get_unreachable_mask(self):
+        """ returns bytes where a cell is 1 if there's no path from it to any exit (walls included) and 0 otherwise """
+        # a cell is unreachable if it's inf in every field - the masks are and-ed as big integers (bytes don't carry)
+        unreachable = (1 << (8 * self.size)) - 1 if self.fields else 0
+        for field in self.fields.values():
+            unreachable &= int.from_bytes(is_inf_mask(field), "little")
+        return unreachable.to_bytes(self.size, "little")
+
+    def get_field(self, exit_pos):
+        """ returns the flat distance field of an exit - index a cell with y * width + x """
+        return self.fields[exit_pos]
+
+    def dist(self, exit_pos, pos):
+        """ returns the distance from a position to an exit """
+        return self.fields[exit_pos][pos[0] * self.width + pos[1]]
@@ -1,6 +1,90 @@
 """ module containing implementation of automata which simulate some phenomena """
 
-from automata.base_automata import BaseFloorFieldAutomaton  # import base class
+import array
+import bisect
+import itertools
+import math
+import operator
+import random
+from automata.base_automata import BaseFloorFieldAutomaton, derive_seed  # import base class
+from automata.stats_store import get_exit_esc_count
+from automata.floor_field import FloorField, METRIC_CHEBYSHEV, METRIC_BFS, to_mask  # precomputed exit distances
+
+# ways of keeping the crowd value (number of people in each exit area) up to date
+CROWD_SCAN = "scan"  # recount every cell of every exit area each generation - O(exits * radius^2)
+CROWD_INCREMENTAL = "incremental"  # update the counts from the moves and escapes of the last transition
+CROWD_SAT = "sat"  # build a summed area table of people each generation - any exit area count is O(1)
+CROWD_MODES = (CROWD_SCAN, CROWD_INCREMENTAL, CROWD_SAT)
+
+# ways of finding the people of the array engine each generation
+AGENTS_DENSE = "dense"  # scan the grid for person cells (bytearray.find) - O(cells) in C
+AGENTS_SPARSE = "sparse"  # keep a sorted array of person cell indices - O(people), independent of the floor area
+AGENTS_AUTO = "auto"  # switch between dense and sparse by occupancy (see SPARSE_MAX_OCCUPANCY)
+AGENT_MODES = (AGENTS_DENSE, AGENTS_SPARSE, AGENTS_AUTO)
+
+
+def _find_all(data, value, start=0, end=None):
+    """ yields the index of every occurrence of a byte value in data[start:end] - runs are skipped in C """
+    idx = data.find(value, start, end)
+    while idx != -1:
+        yield idx
+        idx = data.find(value, idx + 1, end)
+
+
+def choose_exit_fields(people, rand_probs, exit_fields, cell_dist_vals, crowd_vals, base=0):
+    """
+        The exit choice of the flat grid engines - returns the distance field of the exit each person (in the given
+        order) chooses, drawn by the safety of the exits (see rand_weighted_index)
+        :param people: sequence of person cell indices
+        :param rand_probs: iterator of a uniform float per person - the exit choice draws
+        :param exit_fields: flat distance field of each exit
+        :param cell_dist_vals: cell-major distance powers (see FloorField.get_cell_powers)
+        :param crowd_vals: crowd power of each exit in this generation
+        :param base: index of the first cell of the floor in the grid - a replicate's block of a stacked grid (the
+                     static tables are indexed by cell)
+    """
+    num_of_exits = len(crowd_vals)
+    last_exit = num_of_exits - 1
+    fields = []
+    for idx in people:
+        # IMPORTANT! the float operations are the same as in the list engine so both engines make the same choices -
+        # the safety of each exit (1 / (dist_val + crowd_val)) accumulated in C and bisected (see rand_weighted_index)
+        cell = idx - base
+        dist_vals = cell_dist_vals[cell * num_of_exits:(cell + 1) * num_of_exits]
+        cum_safety = list(itertools.accumulate(map(operator.truediv, itertools.repeat(1.0),
+                                                   map(operator.add, dist_vals, crowd_vals))))
+        fields.append(exit_fields[bisect.bisect_right(cum_safety, next(rand_probs) * cum_safety[-1], 0, last_exit)])
+    return fields
+
+
+def claim_exit_targets(people, fields, grid, boundary_class, class_flat_neighbors, trg_to_src, base=0):
+    """
+        The person rule of the flat grid engines - each person (in the given order) claims the first closest free PP
+        to its chosen exit in neighbor order (the same result as the filter chain + min of the list engine).
+        Claims are added to trg_to_src (target index: source index), people with no PP stay put.
+        :param people: sequence of person cell indices
+        :param fields: distance field of the exit each person chose (see choose_exit_fields)
+        :param grid: flat grid states (any indexable of ints, e.g a bytearray or a memoryview)
+        :param boundary_class: boundary class of each cell (see BaseAutomaton.__build_neighborhood__)
+        :param class_flat_neighbors: flat neighbor offsets of each boundary class in this generation's order
+        :param trg_to_src: dict of the claims so far - claimed cells aren't free
+        :param base: index of the first cell of the floor in grid - a replicate's block of a stacked grid (the static
+                     tables are indexed by cell, the grid and the claims by grid index)
+    """
+    for idx, field in zip(people, fields):
+        cell = idx - base
+        min_dist = field[cell]  # a PP must be closer to the exit than the current cell
+        target = -1
+        # walls are inf in every field - never closer, so they need no state check
+        for offset in class_flat_neighbors[boundary_class[cell]]:
+            n_idx = idx + offset
+            if grid[n_idx] == EmergencyEscapeAutomaton.STATE_PERSON or n_idx in trg_to_src:
+                continue
+            if field[n_idx - base] < min_dist:
+                min_dist = field[n_idx - base]
+                target = n_idx
+        if target != -1:
+            trg_to_src[target] = idx  # people who don't move stay put
 
 
 class EmergencyEscapeAutomaton(BaseFloorFieldAutomaton):
@@ -10,8 +94,12 @@ class EmergencyEscapeAutomaton(BaseFloorFieldAutomaton):
     STATE_EMPTY = 0  # grid cell is empty
     STATE_PERSON = 1  # a grid cell is a person
     STATE_EXIT = 2  # a grid cell is an escape exit
+    STATE_WALL = 3  # a grid cell is a wall (or any obstacle) - only used when a floor plan is given
 
-    def __init__(self, height, width, exits, exit_rad=3, dist_mod=3, crowd_mod=3, ppl_interval=3, evenly_dist=True):
+    DEFAULT_CROWD_MODE = CROWD_INCREMENTAL  # scanning exit areas cell by cell is slow with list rows
+
+    def __init__(self, height, width, exits, exit_rad=3, dist_mod=3, crowd_mod=3, ppl_interval=3, evenly_dist=True,
+                 metric=None, rng_seed=None, stats_store=None, crowd_mode=None, passable=None, occupancy=None):
         """
             Instantiate and setup the automaton simulation
             :param height: number of rows in automaton grid
@@ -22,12 +110,47 @@ class EmergencyEscapeAutomaton(BaseFloorFieldAutomaton):
             :param crowd_mod: modifier for weight of number of people in exit area in utility function
             :param ppl_interval: at what to seed people at (smaller interval generates more people at seed time)
             :param evenly_dist: evenly distribute people across the grid at seed time
+            :param metric: distance metric of the static floor field (see floor_field module) - None for chebyshev
+                           distance on an open floor and the obstacle aware bfs distance when there are walls
+            :param rng_seed: seed of the automaton random streams - the same seed gives the same run
+            :param stats_store: optional StatsStore for the per generation statistics (see stats_store module)
+            :param crowd_mode: how crowd values are kept up to date - one of CROWD_MODES (all give the same values),
+                               None for the DEFAULT_CROWD_MODE of the class
+            :param passable: optional floor plan mask - a flat (row-major) sequence of height * width values where a
+                             falsy value is a wall. Walls are never entered, people are only seeded on cells which
+                             have a path to an exit (so every run ends) and exits are always passable.
+            :param occupancy: optional flat (row-major) mask of the initial people, a truthy value is a person -
+                              replaces the random seeding (ppl_interval and evenly_dist are ignored)
         """
+        crowd_mode = crowd_mode if crowd_mode is not None else self.DEFAULT_CROWD_MODE
+        if crowd_mode not in CROWD_MODES:
+            raise ValueError("unknown crowd mode: %s - expected one of %s" % (crowd_mode, CROWD_MODES))
 
         # data structs
         self.exit_area = {}
         self.crowd = {}
+        self.crowd_mode = crowd_mode
+        self.exits_covering = {}  # flat cell index: tuple of exits whose exit area contains the cell (lazy)
+        self.covering_tuples = {}  # a single shared instance of each distinct exits_covering tuple
+        self.exit_cells = {exit_y * width + exit_x for exit_y, exit_x in exits}  # flat indices of exit cells
+        self.gen_moves = {}  # flat target index: flat source index of each move of the last transition
         self.exits = exits
+        self.passable = None  # floor plan mask - 1 for a floor cell and 0 for a wall, None on an open floor
+        if passable is not None:
+            if len(passable) != height * width:
+                raise ValueError("floor plan mask size %s doesn't match the grid size %s" % (len(passable),
+                                                                                               height * width))
+            passable = bytearray(to_mask(passable))
+            for exit_y, exit_x in exits:
+                passable[exit_y * width + exit_x] = 1
+            if 0 in passable:
+                self.passable = bytes(passable)
+        if metric is None:
+            metric = METRIC_BFS if self.passable is not None else METRIC_CHEBYSHEV
+        # distance from every cell to every exit - cached per floor plan and shared by every automaton in the process
+        self.floor_field = FloorField(height, width, exits, metric, self.passable)
+        # 1 for cells with no path to any exit (walls, an enclosed room..) - people are never seeded there
+        self.unreachable = self.floor_field.get_unreachable_mask() if self.passable is not None else None
 
         # configs
         self.exit_radius = exit_rad
@@ -35,17 +158,23 @@ class EmergencyEscapeAutomaton(BaseFloorFieldAutomaton):
         self.crowd_mod = crowd_mod
         self.ppl_interval = ppl_interval
         self.evenly_dist = evenly_dist
+        self.occupancy = occupancy
+        if occupancy is not None and len(occupancy) != height * width:
+            raise ValueError("occupancy mask size %s doesn't match the grid size %s" % (len(occupancy), height * width))
 
         # statistics
-        self.escaped_at_exit = {exit_pos: {0: 0} for exit_pos in exits}
+        self.exit_index = {exit_pos: i for i, exit_pos in enumerate(exits)}  # exit: its stats event column
+        self.gen_escapes = [0] * len(exits)  # number of people escaped at each exit in the current generation
 
         # init super
-        BaseFloorFieldAutomaton.__init__(self, height, width, radius=1, num_of_states=3)
+        BaseFloorFieldAutomaton.__init__(self, height, width, radius=1,
+                                         num_of_states=3 if self.passable is None else 4,
+                                         rng_seed=rng_seed, stats_store=stats_store)
 
     def __get_safety__(self, exit_pos, cur_pos):
         """ returns a safety rating of an exit, from the point of view of given position"""
         # calc distance and crowd at exit area
-        dist = self.cheb_dist(exit_pos, cur_pos)
+        dist = self.floor_field.dist(exit_pos, cur_pos)
         crowd = self.crowd[exit_pos]
         # process values
         dist_val = dist ** self.dist_mod
@@ -55,25 +184,21 @@ class EmergencyEscapeAutomaton(BaseFloorFieldAutomaton):
 
     def __exit_choice__(self, cur_pos):
         """ randomly select an  exit pos - randomness weights are assigned via safety rating and uniform probability """
-        exit_safe_list = list(
-            map(lambda exit_pos: self.__get_safety__(exit_pos, cur_pos), self.exits))  # calc safety vals
-        exit_prob_list = self.weights_to_uni_prob(exit_safe_list)  # calc probabilities from weights
-        return self.rand_prob_choice(self.exits, exit_prob_list)  # chosen exit
+        # cumulative safety values - the exit is found by bisection (see rand_weighted_index), no normalized list
+        cum_safety = list(itertools.accumulate(self.__get_safety__(exit_pos, cur_pos) for exit_pos in self.exits))
+        return self.exits[self.rand_weighted_index(cum_safety)]  # chosen exit
 
     def __possible_pos__(self, cur_pos, exit_pos, neighbors):
         """ returns a list of positions which are spatially closer to the given exit """
-        cur_dist = self.cheb_dist(cur_pos, exit_pos)
-        return list(filter(lambda n_pos: self.cheb_dist(n_pos, exit_pos) < cur_dist, neighbors))
+        cur_dist = self.floor_field.dist(exit_pos, cur_pos)
+        return list(filter(lambda n_pos: self.floor_field.dist(exit_pos, n_pos) < cur_dist, neighbors))
 
     def __min_dist_pos__(self, exit_pos, positions):
         """ returns a position with minimal spatial distance to the given exit """
-        return min(positions, key=lambda x: self.cheb_dist(x, exit_pos))
-
-    def __person_trans__(self, y, x, trg_to_src):
-        """ handle a generational transition of a cell with a person state """
-        # choose an exit
-        exit_choice = self.__exit_choice__((y, x))
+        return min(positions, key=lambda x: self.floor_field.dist(exit_pos, x))
 
+    def __person_trans__(self, y, x, exit_choice, trg_to_src):
+        """ handle a generational transition of a cell with a person state - a move toward the chosen exit """
         # retrieve neighbor cells to CP
         neighbors = list(self.__get_neighbors_at__((y, x)))
 
@@ -89,45 +214,56 @@ class EmergencyEscapeAutomaton(BaseFloorFieldAutomaton):
 
         if not neighbors:
             # if there are no cells meeting the required criteria to move - stay put
-            return self.STATE_PERSON
+            state = self.STATE_PERSON
         else:
             # mark cell as target for movement and set CP state in next generation as empty
-            trg_to_src[self.__min_dist_pos__(exit_choice, neighbors)] = True
-            return self.STATE_EMPTY
+            trg_to_src[self.__min_dist_pos__(exit_choice, neighbors)] = (y, x)
+            state = self.STATE_EMPTY
+        return state
 
     def __trans_first_pass__(self, new_grid, is_target):
         """ the first pass of a generational transition - only handles people states, other states are skipped """
-        for y in range(0, self.height):
-            for x in range(0, self.width):
-                if self.grid[y][x] == self.STATE_PERSON:
-                    new_grid[y][x] = self.__person_trans__(y, x, is_target)
-                else:
-                    pass  # exits and empty cells are handled in a later stage
+        # every person chooses an exit first (in scan order, the same draws) so the phases are lapped once per pass -
+        # per person laps would mostly time the clock
+        choices = [(y, x, self.__exit_choice__((y, x))) for y in range(0, self.height) for x in range(0, self.width)
+                   if self.grid[y][x] == self.STATE_PERSON]  # exits and empty cells are handled in a later stage
+        if self.profiler is not None:
+            self.profiler.lap("first_pass.exit_choice")
+        for y, x, exit_choice in choices:
+            new_grid[y][x] = self.__person_trans__(y, x, exit_choice, is_target)
+        if self.profiler is not None:
+            self.profiler.lap("first_pass.neighbors")
 
     def __trans_second_pass__(self, new_grid, is_target):
         """ second pass of a generational transition  handles empty states and exit states """
-        for t_y, t_x in is_target:
+        for (t_y, t_x), (s_y, s_x) in is_target.items():
+            self.gen_moves[t_y * self.width + t_x] = s_y * self.width + s_x  # recorded for the crowd update
             if self.grid[t_y][t_x] == self.STATE_EMPTY:  # a person has moved
                 new_grid[t_y][t_x] = self.STATE_PERSON
             else:
-                self.escaped_at_exit[(t_y, t_x)][self.generation_count] = 1  # a person has escaped
+                self.gen_escapes[self.exit_index[(t_y, t_x)]] += 1  # a person has escaped
 
     def __emr_esc_trans__(self):
         """ this method generates the next generation grid of the automaton """
-        # generate a new grid with all cells set to empty
-        new_grid = self.uniform_seed(self.height, self.width, self.STATE_EMPTY)
-        # place exits on newly created grid
-        new_grid = self.__seed_exits__(new_grid)
+        profiler = self.profiler
+        self.gen_escapes = [0] * len(self.exits)
+        self.gen_moves = {}
+        # the next generation buffer - all cells set to empty, exits are placed as static cells
+        new_grid = self.__get_back_buffer__(self.STATE_EMPTY)
+        if profiler is not None:
+            profiler.lap("allocate")
 
         # keep track of where each person selects to go next to avoid collisions
         # and use it in stage 2 to handle target cells
         is_target = {}
 
         # first pass handles person cells
-        self.__trans_first_pass__(new_grid, is_target)
+        self.__trans_first_pass__(new_grid, is_target)  # lapped by exit choice and neighbor filtering
 
         # second pass handles exit cells and empty cells
         self.__trans_second_pass__(new_grid, is_target)
+        if profiler is not None:
+            profiler.lap("second_pass")
 
         return new_grid
 
@@ -139,9 +275,17 @@ class EmergencyEscapeAutomaton(BaseFloorFieldAutomaton):
 
     def __seed_people__(self):
         """ generates a grid of randomly placed people, all other states are empty states """
+        if self.occupancy is not None:
+            # the given people - no random draws
+            states = self.__get_occupancy_states__()
+            return [list(states[i:i + self.width]) for i in range(0, self.height * self.width, self.width)]
         return self.rand_seed(self.height, self.width, self.STATE_EMPTY, self.STATE_PERSON,
                               interval=self.ppl_interval, fill_state=self.STATE_EMPTY, evenly_dist=self.evenly_dist)
 
+    def __get_occupancy_states__(self):
+        """ returns the occupancy mask as flat bytes of person and empty states """
+        return to_mask(self.occupancy).translate(bytes([self.STATE_EMPTY, self.STATE_PERSON]) + bytes(254))
+
     def __seed_exits__(self, grid):
         """ place exit states at set exit positions on a given grid"""
         # iterate over all exists and place on grid
@@ -149,14 +293,86 @@ class EmergencyEscapeAutomaton(BaseFloorFieldAutomaton):
             grid[exit_y][exit_x] = self.STATE_EXIT  # place the exit on the grid
         return grid
 
+    def __seed_walls__(self, grid):
+        """ place wall states on a given grid and clear the cells which can't reach an exit """
+        if self.passable is not None:
+            for idx in _find_all(self.unreachable, 1):
+                grid[idx // self.width][idx % self.width] = self.STATE_EMPTY
+            for idx in _find_all(self.passable, 0):
+                grid[idx // self.width][idx % self.width] = self.STATE_WALL
+        return grid
+
+    def __get_static_cells__(self):
+        """ exits and walls never change """
+        static_cells = {}
+        if self.passable is not None:
+            static_cells = {divmod(idx, self.width): self.STATE_WALL for idx in _find_all(self.passable, 0)}
+        static_cells.update((exit_pos, self.STATE_EXIT) for exit_pos in self.exits)
+        return static_cells
+
     def __get_seed_grid__(self):
         """ generates the initial state grid of the automaton """
         seed_grid = self.__seed_people__()  # place people randomly on the grid
+        seed_grid = self.__seed_walls__(seed_grid)  # place walls of the floor plan (same draws as an open floor)
         seed_grid = self.__seed_exits__(seed_grid)  # place exits at specified position on grid
         return seed_grid
 
+    def __get_exits_covering__(self, idx):
+        """ returns a tuple of the exits whose exit area contains a flat cell index """
+        covering = self.exits_covering.get(idx)
+        if covering is None:
+            y, x = divmod(idx, self.width)
+            covering = tuple((exit_y, exit_x) for exit_y, exit_x in self.exits
+                             if abs(exit_y - y) <= self.exit_radius and abs(exit_x - x) <= self.exit_radius)
+            # equal tuples are shared - a move between cells covered by the same exits is skipped by identity
+            covering = self.exits_covering[idx] = self.covering_tuples.setdefault(covering, covering)
+        return covering
+
+    def __apply_crowd_moves__(self):
+        """ updates the crowd values from the moves of the last transition - O(moves) instead of O(exit areas) """
+        crowd = self.crowd
+        for target, source in self.gen_moves.items():
+            source_covering = self.__get_exits_covering__(source)
+            if target in self.exit_cells:  # a person who reached an exit cell escaped - it's not counted
+                target_covering = ()
+            else:
+                target_covering = self.__get_exits_covering__(target)
+            if source_covering is target_covering:
+                continue  # moved within the same exit areas
+            for exit_pos in source_covering:
+                crowd[exit_pos] -= 1  # the person left the source cell
+            for exit_pos in target_covering:
+                crowd[exit_pos] += 1
+
+    def __get_person_rows__(self):
+        """ yields each grid row as bytes where a person is 1 and every other state is 0 """
+        for row in self.grid:
+            yield bytes(state == self.STATE_PERSON for state in row)
+
+    def __sat_crowd__(self):
+        """ counts the people in each exit area with a summed area table - O(1) per exit after an O(cells) build """
+        # sat[y][x] is the number of people in rows < y and columns < x - rows are accumulated in C
+        sat = [[0] * (self.width + 1)]
+        for person_row in self.__get_person_rows__():
+            row_sums = itertools.accumulate(itertools.chain((0,), person_row))
+            sat.append(list(map(operator.add, sat[-1], row_sums)))
+        for exit_y, exit_x in self.exits:
+            y_start, y_end = max(0, exit_y - self.exit_radius), min(self.height, exit_y + self.exit_radius + 1)
+            x_start, x_end = max(0, exit_x - self.exit_radius), min(self.width, exit_x + self.exit_radius + 1)
+            self.crowd[(exit_y, exit_x)] = (sat[y_end][x_end] - sat[y_start][x_end] -
+                                            sat[y_end][x_start] + sat[y_start][x_start])
+
     def __update_crowd_at_exits__(self):
         """ updates the crowd value for each exit """
+        if self.crowd_mode == CROWD_SAT:
+            self.__sat_crowd__()
+        elif self.crowd_mode == CROWD_INCREMENTAL and self.crowd:
+            self.__apply_crowd_moves__()  # the crowd was counted at the first generation - only apply the changes
+        else:
+            self.__scan_crowd__()
+
+    def __scan_crowd__(self):
+        """ counts the people in each exit area - scans every cell of every exit area """
         for exit_pos in self.exits:
             exit_area = self.__get_exit_area__(exit_pos)
             # sum the people at the exit area
@@ -166,18 +382,398 @@ class EmergencyEscapeAutomaton(BaseFloorFieldAutomaton):
     def __get_next_generation__(self):
         """ returns the next generation grid of the automaton"""
         self.__update_crowd_at_exits__()
+        if self.profiler is not None:
+            self.profiler.lap("crowd")
         return self.__emr_esc_trans__()
 
+    def __get_num_of_event_columns__(self):
+        """ escapes are recorded per exit """
+        return len(self.exits)
+
+    def __get_gen_events__(self):
+        """ returns the number of people escaped at each exit in the current generation """
+        return self.gen_escapes
+
+    def __get_gen_moves__(self):
+        """ returns the moves (and escapes - targets which are exit cells) of the last transition """
+        return self.gen_moves
+
+    def __get_checkpoint_state__(self):
+        """ adds the crowd values and the moves and escapes of the last transition (the next crowd update uses them) """
+        state, sections = BaseFloorFieldAutomaton.__get_checkpoint_state__(self)
+        state["exits"] = [list(exit_pos) for exit_pos in self.exits]
+        state["params"] = [self.exit_radius, self.dist_mod, self.crowd_mod]
+        state["floor_field"] = self.floor_field.key  # identifies the grid size, exits, metric and floor plan
+        state["crowd"] = [self.crowd[exit_pos] for exit_pos in self.exits] if self.crowd else None
+        state["gen_escapes"] = list(self.gen_escapes)
+        sections["moves.targets"] = array.array("q", self.gen_moves.keys()).tobytes()
+        sections["moves.sources"] = array.array("q", self.gen_moves.values()).tobytes()
+        return state, sections
+
+    def __set_checkpoint_state__(self, state, sections):
+        if ([tuple(exit_pos) for exit_pos in state["exits"]] != [tuple(exit_pos) for exit_pos in self.exits] or
+                state["params"] != [self.exit_radius, self.dist_mod, self.crowd_mod]):
+            raise ValueError("checkpoint exits or parameters (exit_rad, dist_mod, crowd_mod) don't match the automaton")
+        if state.get("floor_field") != self.floor_field.key:
+            raise ValueError("checkpoint floor field (metric or floor plan) doesn't match the automaton")
+        BaseFloorFieldAutomaton.__set_checkpoint_state__(self, state, sections)
+        self.crowd = dict(zip(self.exits, state["crowd"])) if state["crowd"] is not None else {}
+        self.gen_escapes = list(state["gen_escapes"])
+        targets, sources = array.array("q"), array.array("q")
+        targets.frombytes(sections["moves.targets"])
+        sources.frombytes(sections["moves.sources"])
+        self.gen_moves = dict(zip(targets, sources))
+
+    def __count_states__(self):
+        """ returns a list of the number of cells in each state - updated from the escapes after the seed count """
+        if self.state_counts is None:
+            return self.__recount_states__()
+        escaped = sum(self.gen_escapes)  # people only leave the grid through exits - moves don't change the counts
+        state_counts = list(self.state_counts)
+        state_counts[self.STATE_PERSON] -= escaped
+        state_counts[self.STATE_EMPTY] += escaped
+        return state_counts
+
     def is_terminal(self):
         """ returns true if all people escaped """
-        if self.gen_state_count[self.generation_count][self.STATE_PERSON] == 0:
+        if self.state_counts[self.STATE_PERSON] == 0:
             return True
         else:
             return False
 
     def get_exit_esc_count(self):
         """ returns a dict of exit:generation:num_of_escaped_ppl """
-        return self.escaped_at_exit
+        return get_exit_esc_count(self.stats, self.exits)
+
+    def get_exit_esc_total(self, exit_pos):
+        """ returns the total number of people escaped at an exit """
+        return self.stats.get_event_totals()[self.exit_index[exit_pos]]
 
     def get_num_of_people_at_seed(self):
-        return self.gen_state_count[0][self.STATE_PERSON]
+        return self.stats.get_initial_counts()[self.STATE_PERSON]
+
+
+class ArrayEmergencyEscapeAutomaton(EmergencyEscapeAutomaton):
+    """
+        Opt-in flat array engine for the evacuation automaton - same rules, same random draws, same statistics.
+        The grid is a row-major bytearray (one unsigned byte per cell) instead of a list of lists, so copying,
+        counting and scanning the grid for people is done by C loops instead of per cell python code.
+        Use this class instead of EmergencyEscapeAutomaton for large grids.
+    """
+
+    PERSON_TABLE = bytes(int(state == EmergencyEscapeAutomaton.STATE_PERSON) for state in range(0, 256))
+    # counting row slices of exit areas runs in C - use CROWD_SAT for many exits with a large exit radius
+    DEFAULT_CROWD_MODE = CROWD_SCAN
+    SPARSE_MAX_OCCUPANCY = 0.01  # AGENTS_AUTO keeps a person array while at most this fraction of cells are people
+
+    def __init__(self, height, width, exits, exit_rad=3, dist_mod=3, crowd_mod=3, ppl_interval=3, evenly_dist=True,
+                 metric=None, rng_seed=None, stats_store=None, crowd_mode=None, agent_mode=AGENTS_AUTO, passable=None,
+                 occupancy=None):
+        """
+            see EmergencyEscapeAutomaton for parameter documentation
+            :param agent_mode: how people are found each generation - one of AGENT_MODES (all give the same runs)
+        """
+        if agent_mode not in AGENT_MODES:
+            raise ValueError("unknown agent mode: %s - expected one of %s" % (agent_mode, AGENT_MODES))
+        self.agent_mode = agent_mode
+        self.people = None  # sparse mode - array of the flat indices of person cells in row-major (scan) order
+        EmergencyEscapeAutomaton.__init__(self, height, width, exits, exit_rad, dist_mod, crowd_mod, ppl_interval,
+                                          evenly_dist, metric, rng_seed, stats_store, crowd_mode, passable, occupancy)
+        # flat lookup tables (one per exit, same order as exits) for the hot path
+        self.exit_fields = [self.floor_field.get_field(exit_pos) for exit_pos in exits]
+        # the distance part of the utility function never changes - precomputed for every cell (shared in process),
+        # cell-major so the values of all exits at a cell are a single slice
+        self.cell_dist_vals = self.floor_field.get_cell_powers(dist_mod)
+
+    def get_grid(self):
+        """ returns the world state grid as a list of rows (a copy - the automaton keeps a flat grid) """
+        return [list(self.grid[i:i + self.width]) for i in range(0, self.height * self.width, self.width)]
+
+    def get_flat_grid(self):
+        return bytes(self.grid)
+
+    def __iter_people__(self):
+        """ yields the flat index of every person cell in row-major order - the scan order of the base engine """
+        if self.people is not None:
+            return iter(self.people)
+        return self.__find_people__()
+
+    def __find_people__(self):
+        """ yields the flat index of every person cell - bytearray.find skips over empty cells in C """
+        grid = self.grid
+        idx = grid.find(self.STATE_PERSON)
+        while idx != -1:
+            yield idx
+            idx = grid.find(self.STATE_PERSON, idx + 1)
+
+    def __select_agent_mode__(self):
+        """ keeps the person array in sparse mode and drops it in dense mode - auto decides by occupancy """
+        sparse = self.agent_mode == AGENTS_SPARSE or (
+            self.agent_mode == AGENTS_AUTO and
+            self.state_counts[self.STATE_PERSON] <= self.SPARSE_MAX_OCCUPANCY * self.height * self.width)
+        if not sparse:
+            self.people = None
+        elif self.people is None:
+            self.people = array.array("L", self.__find_people__())  # a single scan when switching to sparse
+
+    def __array_trans_first_pass__(self, trg_to_src):
+        """ the first pass of a generational transition - every person chooses a target cell in scan order """
+        crowd_vals = [self.crowd[exit_pos] ** self.crowd_mod for exit_pos in self.exits]  # once per generation
+        # one bulk draw per generation - the same floats the base engine draws one person at a time
+        rand_probs = iter(self.rand_uniforms(self.state_counts[self.STATE_PERSON]))
+        people = list(self.__iter_people__())
+        fields = choose_exit_fields(people, rand_probs, self.exit_fields, self.cell_dist_vals, crowd_vals)
+        if self.profiler is not None:
+            self.profiler.lap("first_pass.exit_choice")
+        claim_exit_targets(people, fields, self.grid, self.boundary_class, self.class_flat_neighbors, trg_to_src)
+        if self.profiler is not None:
+            self.profiler.lap("first_pass.neighbors")
+
+    def __array_trans_second_pass__(self, trg_to_src):
+        """ second pass of a generational transition - applies the moves to the grid and records escapes """
+        grid = self.grid
+        # targets were free cells of the current generation and sources were people - updating in place is safe
+        for t_idx, s_idx in trg_to_src.items():
+            if grid[t_idx] == self.STATE_EMPTY:  # a person has moved
+                grid[t_idx] = self.STATE_PERSON
+            else:
+                self.gen_escapes[self.exit_index[divmod(t_idx, self.width)]] += 1  # a person has escaped
+            grid[s_idx] = self.STATE_EMPTY
+        if self.people is not None and trg_to_src:
+            # the moved people are replaced by their targets (escaped people are dropped), kept in scan order
+            sources = set(trg_to_src.values())
+            people = [idx for idx in self.people if idx not in sources]
+            people.extend(t_idx for t_idx in trg_to_src if t_idx not in self.exit_cells)
+            people.sort()
+            self.people = array.array("L", people)
+
+    def __emr_esc_trans__(self):
+        """ this method generates the next generation grid of the automaton - the grid is updated in place """
+        profiler = self.profiler
+        self.gen_escapes = [0] * len(self.exits)
+        self.__select_agent_mode__()
+        trg_to_src = {}  # target cell index: source cell index - insertion order is the scan order
+        if profiler is not None:
+            profiler.lap("allocate")
+        self.__array_trans_first_pass__(trg_to_src)  # lapped by exit choice and neighbor filtering
+        self.__array_trans_second_pass__(trg_to_src)
+        if profiler is not None:
+            profiler.lap("second_pass")
+        self.gen_moves = trg_to_src  # already flat indices - recorded for the crowd update
+        return self.grid
+
+    def __get_seed_grid__(self):
+        """ generates the initial state grid of the automaton as a flat bytearray """
+        if self.occupancy is not None:
+            seed_grid = bytearray(self.__get_occupancy_states__())
+        else:
+            seed_grid = bytearray(itertools.chain.from_iterable(self.__seed_people__()))  # same random draws
+        if self.passable is not None:
+            seed_grid = self.__seed_flat_walls__(seed_grid)
+        for exit_idx in self.exit_cells:
+            seed_grid[exit_idx] = self.STATE_EXIT
+        return seed_grid
+
+    def __seed_flat_walls__(self, grid):
+        """ same as __seed_walls__ for a flat grid - with whole grid operations on big integers instead of per cell """
+        size = self.height * self.width
+        # 1: a reachable floor cell (kept), 2: a wall, 3: an unreachable floor cell (cleared) - walls are unreachable
+        cell_kinds = (int.from_bytes(self.passable, "little") |
+                      int.from_bytes(self.unreachable, "little") << 1).to_bytes(size, "little")
+        keep = int.from_bytes(cell_kinds.translate(bytes([0, 0xff]) + bytes(254)), "little")
+        replace = int.from_bytes(cell_kinds.translate(bytes([0, 0, self.STATE_WALL, self.STATE_EMPTY]) + bytes(252)),
+                                 "little")
+        return bytearray((int.from_bytes(grid, "little") & keep | replace).to_bytes(size, "little"))
+
+    def __set_flat_grid__(self, flat_grid):
+        self.grid = bytearray(flat_grid)
+
+    def __get_checkpoint_state__(self):
+        """ adds the agent mode in use - the person array is the grid's person cells in scan order, so it's rebuilt """
+        state, sections = EmergencyEscapeAutomaton.__get_checkpoint_state__(self)
+        state["sparse"] = self.people is not None
+        return state, sections
+
+    def __set_checkpoint_state__(self, state, sections):
+        EmergencyEscapeAutomaton.__set_checkpoint_state__(self, state, sections)
+        self.people = array.array("L", self.__find_people__()) if state["sparse"] else None
+
+    def __get_person_rows__(self):
+        """ yields each grid row as bytes where a person is 1 and every other state is 0 - translated in C """
+        for row_start in range(0, self.height * self.width, self.width):
+            yield self.grid[row_start:row_start + self.width].translate(self.PERSON_TABLE)
+
+    def __scan_crowd__(self):
+        """ counts the people in each exit area - counts row slices of each exit area """
+        for exit_y, exit_x in self.exits:
+            x_start = max(0, exit_x - self.exit_radius) - exit_x
+            x_end = min(self.width, exit_x + self.exit_radius + 1) - exit_x
+            crowd_at_exit = 0
+            for y in range(max(0, exit_y - self.exit_radius), min(self.height, exit_y + self.exit_radius + 1)):
+                row_start = y * self.width + exit_x
+                crowd_at_exit += self.grid[row_start + x_start:row_start + x_end].count(self.STATE_PERSON)
+            self.crowd[(exit_y, exit_x)] = crowd_at_exit
+
+    def __recount_states__(self):
+        """ returns a list of the number of cells in each state - counted in C """
+        return [self.grid.count(state) for state in range(0, self.num_of_states)]
+
+
+class BatchEmergencyEscapeAutomaton:
+    """
+        Runs a batch of independent replicates of the same evacuation configuration in lock step, in a single stacked
+        (replicates x height x width) bytearray grid. Every generation the claim kernel runs over each live replicate's
+        block of the stack into one claims dict, then a single pass applies the moves of all replicates. Finished
+        replicates are masked out. The floor field tables, exit areas and neighborhood index are shared - only the
+        random streams, crowd values and statistics are per replicate. Replicate i is the same run as an
+        ArrayEmergencyEscapeAutomaton seeded with get_replicate_seed(i), so the batch gives the same escape curves as
+        running the replicates one by one.
+    """
+
+    STATE_EMPTY = EmergencyEscapeAutomaton.STATE_EMPTY
+    STATE_PERSON = EmergencyEscapeAutomaton.STATE_PERSON
+
+    def __init__(self, replicates, height, width, exits, rng_seed=None, **automaton_kwargs):
+        """
+            :param replicates: number of independent replicates
+            :param height: number of rows in each replicate grid
+            :param width: number of columns in each replicate grid
+            :param exits: list of exit coordinates
+            :param rng_seed: seed of the batch - each replicate gets its own seed derived from it (None - random)
+            :param automaton_kwargs: other ArrayEmergencyEscapeAutomaton parameters (e.g exit_rad, dist_mod)
+        """
+        if replicates < 1:
+            raise ValueError("replicates must be a positive number")
+        self.height = height
+        self.width = width
+        self.cells = height * width  # the size of a replicate's block of the stacked grid
+        self.exits = exits
+        self.rng_seed = rng_seed if rng_seed is not None else random.SystemRandom().getrandbits(64)
+        self.generation_count = 0
+        # the replicates seed their grids, draw their random numbers and record their statistics - the batch keeps
+        # their grids and does their transitions
+        self.replicates = [ArrayEmergencyEscapeAutomaton(height, width, exits, rng_seed=self.get_replicate_seed(i),
+                                                         **automaton_kwargs) for i in range(0, replicates)]
+        self.grid = bytearray(b"".join(replicate.grid for replicate in self.replicates))
+        first = self.replicates[0]
+        first.__build_neighborhood__()
+        for replicate in self.replicates:
+            replicate.grid = None  # the replicate's grid is its block of the stacked grid
+            # the same floor - a single neighborhood index for the batch
+            replicate.neighbor_offsets = first.neighbor_offsets
+            replicate.neighbor_flat_offsets = first.neighbor_flat_offsets
+            replicate.boundary_masks = first.boundary_masks
+            replicate.boundary_class = first.boundary_class
+        self.boundary_class = first.boundary_class
+        self.exit_fields = first.exit_fields
+        self.cell_dist_vals = first.cell_dist_vals
+        self.crowd_mod = first.crowd_mod
+        self.exit_index = {exit_y * width + exit_x: i for i, (exit_y, exit_x) in enumerate(exits)}
+        # (start, end) block offsets of the rows of each exit area - crowds are counted on row slices in C
+        self.exit_area_rows = []
+        for exit_y, exit_x in exits:
+            x_start, x_end = max(0, exit_x - first.exit_radius), min(width, exit_x + first.exit_radius + 1)
+            self.exit_area_rows.append([(y * width + x_start, y * width + x_end) for y in
+                                        range(max(0, exit_y - first.exit_radius),
+                                              min(height, exit_y + first.exit_radius + 1))])
+        self.terminal = [replicate.is_terminal() for replicate in self.replicates]  # per replicate terminal mask
+
+    def get_replicate_seed(self, i):
+        """ returns the seed of a replicate - pass it to ArrayEmergencyEscapeAutomaton to rerun it alone """
+        return derive_seed(self.rng_seed, "replicate", i)
+
+    def get_num_of_replicates(self):
+        return len(self.replicates)
+
+    def get_replicate(self, i):
+        """ returns the automaton of a single replicate - its random streams and statistics (see get_replicate_grid) """
+        return self.replicates[i]
+
+    def get_height(self):
+        return self.height
+
+    def get_width(self):
+        return self.width
+
+    def get_gen_count(self):
+        """ returns the number of lock step generations (the longest replicate run) """
+        return self.generation_count
+
+    def get_grid_stack(self):
+        """ returns a (replicates x height x width) row-major bytearray of all replicate grids (a copy) """
+        return bytearray(self.grid)
+
+    def get_replicate_grid(self, i):
+        """ returns the grid of a replicate as row-major bytes - see ArrayEmergencyEscapeAutomaton.get_flat_grid """
+        return bytes(self.grid[i * self.cells:(i + 1) * self.cells])
+
+    def __update_block_crowd__(self, replicate, base):
+        """ counts the people in each exit area of a replicate's block and returns the crowd powers of the exits """
+        grid = self.grid
+        crowd_vals = []
+        for exit_pos, rows in zip(self.exits, self.exit_area_rows):
+            crowd_at_exit = sum(grid.count(self.STATE_PERSON, base + start, base + end) for start, end in rows)
+            replicate.crowd[exit_pos] = crowd_at_exit
+            crowd_vals.append(crowd_at_exit ** self.crowd_mod)
+        return crowd_vals
+
+    def update_world_state(self):
+        """ transitions every replicate which hasn't terminated to its next generation - in a single stacked grid """
+        live = [i for i, terminal in enumerate(self.terminal) if not terminal]  # finished replicates are masked out
+        grid = self.grid
+        trg_to_src = {}  # stacked target index: stacked source index - the blocks don't overlap, nor do their claims
+        for i in live:
+            replicate = self.replicates[i]
+            base = i * self.cells
+            replicate.__permute_neighborhood__()  # the replicate's own neighbor stream - the same orders as alone
+            crowd_vals = self.__update_block_crowd__(replicate, base)
+            rand_probs = iter(replicate.rand_uniforms(replicate.state_counts[self.STATE_PERSON]))
+            people = list(_find_all(grid, self.STATE_PERSON, base, base + self.cells))
+            fields = choose_exit_fields(people, rand_probs, self.exit_fields, self.cell_dist_vals, crowd_vals, base)
+            claim_exit_targets(people, fields, grid, self.boundary_class, replicate.class_flat_neighbors, trg_to_src,
+                               base)
+        gen_escapes = {i: [0] * len(self.exits) for i in live}
+        # one pass over the moves of every replicate - targets were free cells and sources were people
+        for t_idx, s_idx in trg_to_src.items():
+            if grid[t_idx] == self.STATE_EMPTY:  # a person has moved
+                grid[t_idx] = self.STATE_PERSON
+            else:
+                i, cell = divmod(t_idx, self.cells)
+                gen_escapes[i][self.exit_index[cell]] += 1  # a person has escaped
+            grid[s_idx] = self.STATE_EMPTY
+        for i in live:
+            replicate = self.replicates[i]
+            replicate.gen_escapes = gen_escapes[i]
+            replicate.generation_count += 1
+            replicate.__update_stats__()
+            self.terminal[i] = replicate.is_terminal()
+        self.generation_count += 1
+
+    def run(self, max_generations=None):
+        """ runs the batch until every replicate terminates (or for max_generations) and returns it """
+        generations = 0
+        while not self.is_terminal() and (max_generations is None or generations < max_generations):
+            self.update_world_state()
+            generations += 1
+        return self
+
+    def get_terminal_mask(self):
+        """ returns a list of booleans - True for each replicate which has terminated """
+        return list(self.terminal)
+
+    def is_terminal(self):
+        """ returns true once every replicate has terminated """
+        return all(self.terminal)
+
+    def get_gen_counts(self):
+        """ returns a list of the number of generations each replicate ran """
+        return [replicate.get_gen_count() for replicate in self.replicates]
+
+    def get_escape_curves(self):
+        """ returns a list (one per replicate) of lists of the cumulative number of escaped people per generation """
+        curves = []
+        for replicate in self.replicates:
+            people_at_seed = replicate.get_num_of_people_at_seed()
+            curves.append([people_at_seed - people
+                           for people in replicate.get_stats().get_state_column(replicate.STATE_PERSON)])
+        return curves
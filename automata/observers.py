@@ -0,0 +1,64 @@
+"""
+    The observers module contains generation observers - pluggable consumers of a running automaton.
+    Attach an observer with BaseAutomaton.add_observer (or pass it to BaseAutomaton.run) and it's handed a light
+    GenerationSnapshot after every generation, so results can be streamed out without keeping the whole run in memory.
+"""
+
+
+class Observer:
+    """ base class of generation observers - override the hooks you need, all of them do nothing by default """
+
+    def on_start(self, automaton):
+        """ called when the observer is attached to an automaton """
+        pass
+
+    def on_generation(self, automaton, snapshot):
+        """ called after every generation transition with a GenerationSnapshot of the new generation """
+        pass
+
+    def on_end(self, automaton):
+        """ called when a run ends (terminal state, generation limit or stop predicate) """
+        pass
+
+
+class CallbackObserver(Observer):
+    """ calls a function with (automaton, snapshot) after every generation """
+
+    def __init__(self, on_generation):
+        self.callback = on_generation
+
+    def on_generation(self, automaton, snapshot):
+        self.callback(automaton, snapshot)
+
+
+class ProgressObserver(Observer):
+    """ prints the generation number and state counts every few generations """
+
+    def __init__(self, every=100):
+        self.every = every
+
+    def on_generation(self, automaton, snapshot):
+        if snapshot.generation % self.every == 0:
+            print("generation: ", snapshot.generation, " state counts: ", list(snapshot.state_counts))
+
+    def on_end(self, automaton):
+        print("ended at generation: ", automaton.get_gen_count())
+
+
+class CsvStreamObserver(Observer):
+    """ writes a csv line per generation (generation, state counts, events) to a file-like object - O(1) memory """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def on_start(self, automaton):
+        states = ["state_%s" % state for state in range(0, automaton.get_num_of_states())]
+        events = ["event_%s" % col for col in range(0, automaton.get_stats().num_of_events)]
+        self.stream.write(",".join(["generation"] + states + events) + "\n")
+
+    def on_generation(self, automaton, snapshot):
+        values = [snapshot.generation] + list(snapshot.state_counts) + list(snapshot.events or ())
+        self.stream.write(",".join(str(value) for value in values) + "\n")
+
+    def on_end(self, automaton):
+        self.stream.flush()
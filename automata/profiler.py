@@ -0,0 +1,91 @@
+"""
+    The profiler module contains a PhaseProfiler - per phase wall time and call counts of automaton generations.
+    Enable it with BaseAutomaton.enable_profiling. Automata mark the end of each phase of a transition with lap(phase),
+    the time since the previous lap is added to that phase. When profiling is disabled the automaton's profiler is None
+    and the instrumentation is a single `is not None` check per phase.
+"""
+
+import json
+import time
+
+
+class PhaseProfiler:
+    """ accumulates wall time and call counts per transition phase - see module doc """
+
+    def __init__(self, stream=None, clock=time.perf_counter):
+        """
+            :param stream: optional file-like object - a json line of the phase times is written after every generation
+                           ({"generation": g, "phases": {phase: [seconds, calls]}}) for external collectors
+            :param clock: time function in seconds
+        """
+        self.stream = stream
+        self.clock = clock
+        self.phase_order = []  # phases in the order they were first seen
+        self.total_times = {}  # phase: total seconds over all generations
+        self.total_calls = {}  # phase: total number of laps over all generations
+        self.gen_times = {}  # phase: seconds in the current generation
+        self.gen_calls = {}  # phase: number of laps in the current generation
+        self.generations = 0
+        self.last_time = None
+
+    def start_generation(self):
+        """ starts timing a generation transition """
+        self.gen_times = {}
+        self.gen_calls = {}
+        self.last_time = self.clock()
+
+    def lap(self, phase):
+        """ ends a phase - the time since the previous lap (or the generation start) is added to the phase """
+        now = self.clock()
+        self.add(phase, now - self.last_time)
+        self.last_time = now
+
+    def add(self, phase, seconds, calls=1):
+        """ adds a measured time to a phase of the current generation """
+        if phase not in self.gen_times:
+            self.gen_times[phase] = 0.0
+            self.gen_calls[phase] = 0
+            if phase not in self.total_times:
+                self.phase_order.append(phase)
+                self.total_times[phase] = 0.0
+                self.total_calls[phase] = 0
+        self.gen_times[phase] += seconds
+        self.gen_calls[phase] += calls
+
+    def end_generation(self, generation):
+        """ adds the current generation to the totals and writes it to the stream """
+        for phase, seconds in self.gen_times.items():
+            self.total_times[phase] += seconds
+            self.total_calls[phase] += self.gen_calls[phase]
+        self.generations += 1
+        if self.stream is not None:
+            phases = {phase: [seconds, self.gen_calls[phase]] for phase, seconds in self.gen_times.items()}
+            self.stream.write(json.dumps({"generation": generation, "phases": phases}) + "\n")
+
+    def get_generation_times(self):
+        """ returns a dict of phase:(seconds, calls) of the last generation """
+        return {phase: (seconds, self.gen_calls[phase]) for phase, seconds in self.gen_times.items()}
+
+    def get_summary(self):
+        """ returns a list of (phase, total seconds, calls, seconds per generation, share of total time) rows """
+        total = sum(self.total_times.values()) or 1
+        return [(phase, self.total_times[phase], self.total_calls[phase],
+                 self.total_times[phase] / max(1, self.generations), self.total_times[phase] / total)
+                for phase in self.phase_order]
+
+    def format_summary(self):
+        """ returns the summary as a text table """
+        lines = ["%-28s %12s %12s %16s %8s" % ("phase", "total (sec)", "calls", "per gen (ms)", "share")]
+        for phase, seconds, calls, per_gen, share in self.get_summary():
+            lines.append("%-28s %12.4f %12d %16.4f %7.1f%%" % (phase, seconds, calls, per_gen * 1000, share * 100))
+        lines.append("generations: %s" % self.generations)
+        return "\n".join(lines)
+
+    def reset(self):
+        """ clears all collected times """
+        self.phase_order = []
+        self.total_times = {}
+        self.total_calls = {}
+        self.gen_times = {}
+        self.gen_calls = {}
+        self.generations = 0
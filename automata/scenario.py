@@ -0,0 +1,197 @@
+"""
+    The scenario module loads evacuation scenarios - a floor plan (walls and exits), the initial people (an explicit
+    occupancy or a density) and automaton parameters - and builds automata from them. Grids are decoded with whole
+    grid bytes operations (slicing, translate), there's no per cell python code, so million cell scenarios load in
+    milliseconds (obstacle aware floor fields are computed on the first load and cached - see floor_field).
+
+    Raster images are binary pgm (P5) or ppm (P6) files with 8 bit channels, a pixel per cell:
+        ppm - black is a wall, green an exit, red a person, any other color is floor
+              (a channel is on at 128 or more - e.g pure red and dark red are both people)
+        pgm - dark pixels (below 128) are walls, all others are floor - exits and people are given as parameters
+    Scenario files (little endian):
+        header - magic, height, width, length of a json blob of the exits and parameters, the json blob
+        cells  - zlib compressed cell states, a byte per cell (the EmergencyEscapeAutomaton states)
+"""
+
+import json
+import random
+import struct
+import zlib
+from collections import namedtuple
+from automata.base_automata import derive_seed
+from automata.floor_field import to_mask
+from automata.mmn11_automata import EmergencyEscapeAutomaton, ArrayEmergencyEscapeAutomaton
+
+# passable: 1 for floor and 0 for wall cells (None - no walls), occupancy: 1 for people (None - seeded randomly),
+# params: automaton keyword arguments (e.g exit_rad, dist_mod, crowd_mod, ppl_interval) and an optional density
+Scenario = namedtuple("Scenario", ["height", "width", "exits", "passable", "occupancy", "params"])
+
+MAGIC = b"CASCEN01"
+HEADER_FORMAT = "<8sIII"  # magic, height, width, json length
+RASTER_MAGICS = (b"P5", b"P6")
+
+STATE_EMPTY = EmergencyEscapeAutomaton.STATE_EMPTY
+STATE_PERSON = EmergencyEscapeAutomaton.STATE_PERSON
+STATE_EXIT = EmergencyEscapeAutomaton.STATE_EXIT
+STATE_WALL = EmergencyEscapeAutomaton.STATE_WALL
+
+# ppm pixels are classified by a 3 bit code - bit 0: red on, bit 1: green on, bit 2: blue on
+_CHANNEL_TABLES = [bytes(bit if value >= 128 else 0 for value in range(0, 256)) for bit in (1, 2, 4)]
+_COLOR_STATES = bytes([STATE_WALL, STATE_PERSON, STATE_EXIT] + [STATE_EMPTY] * 253)  # black, red, green, other
+_GRAY_STATES = bytes([STATE_WALL] * 128 + [STATE_EMPTY] * 128)
+_WALL_MASK = bytes(int(state != STATE_WALL) for state in range(0, 256))  # state: 1 for floor, 0 for a wall
+_PERSON_MASK = bytes(int(state == STATE_PERSON) for state in range(0, 256))
+_DENSITY_RESOLUTION = 256  # densities are rounded to a multiple of 1 / 256
+
+
+def _states_to_scenario(height, width, states, exits, params):
+    """ returns a Scenario from flat cell states - exits found in the states are used unless exits are given """
+    if exits is None:
+        exits = []
+        idx = states.find(STATE_EXIT)
+        while idx != -1:
+            exits.append(divmod(idx, width))
+            idx = states.find(STATE_EXIT, idx + 1)
+    passable = states.translate(_WALL_MASK) if STATE_WALL in states else None
+    occupancy = states.translate(_PERSON_MASK) if STATE_PERSON in states else None
+    return Scenario(height, width, [tuple(exit_pos) for exit_pos in exits], passable, occupancy, dict(params or {}))
+
+
+def _read_raster_header(data):
+    """ returns (magic, width, height, max value, offset of the pixels) of a binary pgm/ppm image """
+    fields, offset = [], 0
+    while len(fields) < 4:
+        while data[offset:offset + 1].isspace():
+            offset += 1
+        if data[offset:offset + 1] == b"#":
+            offset = data.find(b"\n", offset)  # a comment line
+            if offset == -1:
+                raise ValueError("malformed image header - a comment runs into the end of the file")
+            continue
+        end = offset
+        while end < len(data) and not data[end:end + 1].isspace():
+            end += 1
+        if end == offset:
+            raise ValueError("malformed image header - expected a magic, width, height and max value")
+        fields.append(data[offset:end])
+        offset = end
+    if not all(field.isdigit() for field in fields[1:]):
+        raise ValueError("malformed image header - width, height and max value must be decimal numbers")
+    return fields[0], int(fields[1]), int(fields[2]), int(fields[3]), offset + 1  # a single whitespace byte
+
+
+def parse_raster(data, exits=None, params=None):
+    """
+        Returns a Scenario of a binary pgm/ppm image - see module doc for the colors
+        :param data: image file data
+        :param exits: list of exit coordinates - replaces the exits of the image (green pixels)
+        :param params: automaton parameters
+    """
+    magic, width, height, max_value, offset = _read_raster_header(data)
+    if magic not in RASTER_MAGICS or max_value != 255:
+        raise ValueError("unsupported image - expected a binary pgm/ppm (P5/P6) with 8 bit channels")
+    size = height * width
+    channels = 1 if magic == b"P5" else 3
+    pixels = data[offset:offset + channels * size]
+    if len(pixels) != channels * size:  # checked before decoding - the ppm codes would be padded with walls
+        raise ValueError("truncated image - expected %s pixels, got %s" % (size, len(pixels) // channels))
+    if magic == b"P5":
+        states = pixels.translate(_GRAY_STATES)
+    else:
+        # the channel bits are or-ed as big integers - each byte holds a single pixel code, bytes don't carry
+        codes = 0
+        for channel, table in enumerate(_CHANNEL_TABLES):
+            codes |= int.from_bytes(pixels[channel::3].translate(table), "little")
+        states = codes.to_bytes(size, "little").translate(_COLOR_STATES)
+    return _states_to_scenario(height, width, states, exits, params)
+
+
+def parse_scenario(data):
+    """ returns a Scenario of scenario file data - see module doc """
+    offset = struct.calcsize(HEADER_FORMAT)
+    if len(data) < offset or data[:len(MAGIC)] != MAGIC:
+        raise ValueError("not a scenario file")
+    _, height, width, json_length = struct.unpack_from(HEADER_FORMAT, data)
+    if len(data) < offset + json_length:
+        raise ValueError("corrupt scenario file - the header is truncated")
+    description = json.loads(data[offset:offset + json_length].decode())
+    states = zlib.decompress(data[offset + json_length:])
+    if len(states) != height * width:
+        raise ValueError("corrupt scenario file - expected %s cells, got %s" % (height * width, len(states)))
+    return _states_to_scenario(height, width, states, description["exits"], description["params"])
+
+
+def load_scenario(path, exits=None, params=None):
+    """
+        Returns the Scenario of a scenario file or a raster image (see module doc) - the format is found by its magic
+        :param exits: raster images only - see parse_raster
+        :param params: automaton parameters - override the parameters of the file
+    """
+    with open(path, "rb") as scenario_file:
+        data = scenario_file.read()
+    if data[:2] in RASTER_MAGICS:
+        return parse_raster(data, exits, params)
+    scenario = parse_scenario(data)
+    scenario.params.update(params or {})
+    return scenario
+
+
+def encode_scenario(scenario):
+    """ returns scenario file data of a Scenario """
+    size = scenario.height * scenario.width
+    states = 0
+    if scenario.occupancy is not None:
+        states = int.from_bytes(to_mask(scenario.occupancy), "little") * STATE_PERSON
+    if scenario.passable is not None:
+        # walls replace people - the people bytes are masked out (each byte is 0 or 0xff) and the wall states added
+        floor = int.from_bytes(to_mask(scenario.passable), "little")
+        states = states & floor * 0xff | (int.from_bytes(bytes([1]) * size, "little") - floor) * STATE_WALL
+    states = bytearray(states.to_bytes(size, "little"))
+    for exit_y, exit_x in scenario.exits:
+        states[exit_y * scenario.width + exit_x] = STATE_EXIT
+    description = json.dumps({"exits": [list(exit_pos) for exit_pos in scenario.exits],
+                              "params": scenario.params}).encode()
+    return (struct.pack(HEADER_FORMAT, MAGIC, scenario.height, scenario.width, len(description)) + description +
+            zlib.compress(bytes(states)))
+
+
+def save_scenario(path, scenario):
+    """ writes a Scenario to a scenario file """
+    with open(path, "wb") as scenario_file:
+        scenario_file.write(encode_scenario(scenario))
+
+
+def density_occupancy(height, width, density, rng, passable=None):
+    """
+        returns a flat occupancy mask where each floor cell is a person with probability density - drawn in bulk
+        (a random byte per cell, so the density is rounded to a multiple of 1 / 256)
+    """
+    size = height * width
+    threshold = round(density * _DENSITY_RESOLUTION)
+    # getrandbits(0) raises before python 3.9 - an empty floor draws nothing
+    occupancy = (rng.getrandbits(8 * size) if size else 0).to_bytes(size, "little").translate(
+        bytes(int(value < threshold) for value in range(0, 256)))
+    if passable is not None:
+        occupancy = (int.from_bytes(occupancy, "little") & int.from_bytes(to_mask(passable), "little")).to_bytes(
+            size, "little")
+    return occupancy
+
+
+def build_automaton(scenario, automaton_cls=ArrayEmergencyEscapeAutomaton, rng_seed=None, **kwargs):
+    """
+        Returns an evacuation automaton of a scenario
+        :param scenario: a Scenario
+        :param automaton_cls: EmergencyEscapeAutomaton or a subclass
+        :param rng_seed: seed of the automaton random streams (and of the density occupancy) - None for random
+        :param kwargs: other automaton parameters - override the scenario parameters
+    """
+    params = dict(scenario.params)
+    params.update(kwargs)
+    density = params.pop("density", None)
+    occupancy = scenario.occupancy
+    if occupancy is None and density is not None:
+        rng_seed = rng_seed if rng_seed is not None else random.SystemRandom().getrandbits(64)
+        occupancy = density_occupancy(scenario.height, scenario.width, density,
+                                      random.Random(derive_seed(rng_seed, "occupancy")), scenario.passable)
+    return automaton_cls(scenario.height, scenario.width, scenario.exits, rng_seed=rng_seed,
+                         passable=scenario.passable, occupancy=occupancy, **params)
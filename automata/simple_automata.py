@@ -8,12 +8,15 @@ class RandomWalkAutomaton(BaseStochasticAutomaton):
     STATE_TAKEN = 1
     STATE_EMPTY = 0
 
-    def __init__(self, height, width):
-        BaseStochasticAutomaton.__init__(self, height, width, radius=1, num_of_states=2)
+    def __init__(self, height, width, rng_seed=None, stats_store=None):
+        BaseStochasticAutomaton.__init__(self, height, width, radius=1, num_of_states=2, rng_seed=rng_seed,
+                                         stats_store=stats_store)
 
     def rand_gen_trans(self):
         """ stochasticly transition to next the generation of the automaton """
-        new_grid = self.uniform_seed(self.height, self.width, self.STATE_EMPTY)
+        new_grid = self.__get_back_buffer__(self.STATE_EMPTY)
+        if self.profiler is not None:
+            self.profiler.lap("allocate")
         for y in range(0, self.height):
             for x in range(0, self.width):
                 if self.grid[y][x] == self.STATE_EMPTY:
@@ -40,12 +43,15 @@ class FoodHierarchyAutomaton(BaseStochasticAutomaton):
 
     STATE_EMPTY = 0
 
-    def __init__(self, height, width):
-        BaseStochasticAutomaton.__init__(self, height, width, radius=1, num_of_states=10)
+    def __init__(self, height, width, rng_seed=None, stats_store=None):
+        BaseStochasticAutomaton.__init__(self, height, width, radius=1, num_of_states=10, rng_seed=rng_seed,
+                                         stats_store=stats_store)
 
     def food_chain_gen_trans(self):
         """ transition to next the generation of the automaton """
-        new_grid = self.uniform_seed(self.height, self.width, self.STATE_EMPTY)
+        new_grid = self.__get_back_buffer__(self.STATE_EMPTY)
+        if self.profiler is not None:
+            self.profiler.lap("allocate")
         for y in range(0, self.height):
             for x in range(0, self.width):
                 # if the current cell is in empty state - it stays empty and nothing needs to be done
@@ -69,7 +75,7 @@ class FoodHierarchyAutomaton(BaseStochasticAutomaton):
 
     def __get_seed_grid__(self):
         return self.rand_seed(self.height, self.width, self.STATE_EMPTY,
-                              self.num_of_states, interval=3, fill_state=self.STATE_EMPTY)
+                              self.num_of_states - 1, interval=3, fill_state=self.STATE_EMPTY)
 
     def __get_next_generation__(self):
         return self.food_chain_gen_trans()
@@ -0,0 +1,221 @@
+"""
+    The stats_store module contains a StatsStore class - columnar per generation statistics of an automaton.
+    Counts are kept in preallocated flat arrays (generation x state, generation x event column) which grow by doubling,
+    or wrap around as a ring buffer for long runs. Arrays support the buffer protocol, so they can be handed to
+    numpy (numpy.frombuffer / numpy.asarray) without copying - release views before recording more rows, a buffer
+    can't grow while it's exported.
+"""
+
+import array
+
+COUNT_TYPECODE = "q"  # 8 byte signed integers (int64)
+
+
+def get_exit_esc_count(stats, exits):
+    """
+        returns a dict of exit:generation:num_of_escaped_ppl from a store whose event columns are the escapes at each
+        exit (in exits order) - only recorded generations are included (see StatsStore ring_size and every)
+    """
+    escaped_at_exit = {exit_pos: {0: 0} for exit_pos in exits}
+    for generation, _, gen_escapes in stats.iter_rows():
+        for exit_pos, esc_count in zip(exits, gen_escapes):
+            if esc_count:
+                # keyed by the generation the person escaped from (the row is of the generation after)
+                escaped_at_exit[exit_pos][generation - 1] = esc_count
+    return escaped_at_exit
+
+
+class StatsStore:
+    """ columnar statistics buffer - one row per recorded generation """
+
+    def __init__(self, capacity=1024, ring_size=None, every=1):
+        """
+            :param capacity: number of rows to preallocate (the buffer doubles when full)
+            :param ring_size: if given, keep only the last ring_size recorded rows (fixed memory for long runs)
+            :param every: decimation - record a row only every `every` generations (events in between are summed)
+        """
+        if every < 1:
+            raise ValueError("every must be a positive number of generations")
+        if ring_size is not None and ring_size < 1:
+            raise ValueError("ring_size must be None or a positive number of rows")
+        self.capacity = ring_size if ring_size is not None else max(1, capacity)
+        self.ring_size = ring_size
+        self.every = every
+        self.num_of_states = 0
+        self.num_of_events = 0
+        self.rows = 0  # number of rows held in the buffer
+        self.ring_start = 0  # storage index of the oldest row (only moves in ring buffer mode)
+        self.generations = array.array(COUNT_TYPECODE)
+        self.state_counts = array.array(COUNT_TYPECODE)
+        self.events = array.array(COUNT_TYPECODE)
+        self.initial_counts = None  # counts at the first recorded generation (the seed) - never evicted
+        self.last_counts = None  # counts at the latest generation - recorded or not
+        self.last_generation = -1
+        self.last_recorded = True  # False when the latest generation was skipped by decimation
+        self.event_totals = []  # sum of every event column over the whole run - never evicted
+        self.pending_events = []  # events of generations skipped by decimation - added to the next recorded row
+
+    def allocate(self, num_of_states, num_of_events=0):
+        """ sets the number of columns and preallocates the buffer - called by the automaton """
+        self.num_of_states = num_of_states
+        self.num_of_events = num_of_events
+        self.generations = array.array(COUNT_TYPECODE, bytes(self.capacity * 8))
+        self.state_counts = array.array(COUNT_TYPECODE, bytes(self.capacity * num_of_states * 8))
+        self.events = array.array(COUNT_TYPECODE, bytes(self.capacity * num_of_events * 8))
+        self.rows = 0
+        self.ring_start = 0
+        self.initial_counts = None
+        self.last_recorded = True
+        self.event_totals = [0] * num_of_events
+        self.pending_events = [0] * num_of_events
+
+    def __grow__(self):
+        """ doubles the buffer capacity - zero filled in C """
+        self.generations.frombytes(bytes(self.capacity * 8))
+        self.state_counts.frombytes(bytes(self.capacity * self.num_of_states * 8))
+        self.events.frombytes(bytes(self.capacity * self.num_of_events * 8))
+        self.capacity *= 2
+
+    def record(self, generation, state_counts, events=None):
+        """
+            Records the statistics of a generation
+            :param generation: the generation number
+            :param state_counts: sequence of the number of cells in each state
+            :param events: optional sequence of event counts of the generation (e.g escapes at each exit)
+        """
+        if events is not None:
+            for col in range(0, self.num_of_events):
+                self.event_totals[col] += events[col]
+                self.pending_events[col] += events[col]
+        self.last_counts = tuple(state_counts)
+        self.last_generation = generation
+        if self.initial_counts is None:
+            self.initial_counts = self.last_counts
+        elif generation % self.every != 0:
+            self.last_recorded = False
+            return  # decimated - the events are kept pending for the next recorded row
+        self.__write_row__()
+
+    def flush(self):
+        """ records a row for the latest generation if decimation skipped it (e.g at the end of a run) """
+        if not self.last_recorded:
+            self.__write_row__()
+
+    def __write_row__(self):
+        """ writes the latest counts and the pending events into the next row of the buffer """
+        self.last_recorded = True
+        generation = self.last_generation
+        if self.ring_size is not None and self.rows == self.capacity:
+            row = self.ring_start  # overwrite the oldest row
+            self.ring_start = (self.ring_start + 1) % self.capacity
+        else:
+            if self.rows == self.capacity:
+                self.__grow__()
+            row = (self.ring_start + self.rows) % self.capacity
+            self.rows += 1
+        self.generations[row] = generation
+        self.state_counts[row * self.num_of_states:(row + 1) * self.num_of_states] = array.array(
+            COUNT_TYPECODE, self.last_counts)
+        if self.num_of_events:
+            self.events[row * self.num_of_events:(row + 1) * self.num_of_events] = array.array(
+                COUNT_TYPECODE, self.pending_events)
+            self.pending_events = [0] * self.num_of_events
+
+    def __get_checkpoint_state__(self):
+        """ returns (dict of json values, dict of name: bytes sections) of the buffer - see the checkpoint module """
+        # rows are held in storage rows 0..rows - 1 (a ring buffer only wraps around once it's full)
+        state = {"capacity": self.capacity, "ring_size": self.ring_size, "every": self.every,
+                 "num_of_states": self.num_of_states, "num_of_events": self.num_of_events, "rows": self.rows,
+                 "ring_start": self.ring_start, "initial_counts": self.initial_counts,
+                 "last_counts": self.last_counts, "last_generation": self.last_generation,
+                 "last_recorded": self.last_recorded, "event_totals": list(self.event_totals),
+                 "pending_events": list(self.pending_events)}  # copies - later generations update them in place
+        sections = {"stats.generations": self.generations[:self.rows].tobytes(),
+                    "stats.state_counts": self.state_counts[:self.rows * self.num_of_states].tobytes(),
+                    "stats.events": self.events[:self.rows * self.num_of_events].tobytes()}
+        return state, sections
+
+    def __set_checkpoint_state__(self, state, sections):
+        """ restores the buffer from __get_checkpoint_state__ values """
+        self.capacity = state["capacity"]
+        self.ring_size = state["ring_size"]
+        self.every = state["every"]
+        self.allocate(state["num_of_states"], state["num_of_events"])
+        for column, name in ((self.generations, "stats.generations"), (self.state_counts, "stats.state_counts"),
+                             (self.events, "stats.events")):
+            values = array.array(COUNT_TYPECODE)
+            values.frombytes(sections[name])
+            column[:len(values)] = values
+        self.rows = state["rows"]
+        self.ring_start = state["ring_start"]
+        self.initial_counts = tuple(state["initial_counts"]) if state["initial_counts"] is not None else None
+        self.last_counts = tuple(state["last_counts"]) if state["last_counts"] is not None else None
+        self.last_generation = state["last_generation"]
+        self.last_recorded = state["last_recorded"]
+        self.event_totals = list(state["event_totals"])
+        self.pending_events = list(state["pending_events"])
+
+    def __len__(self):
+        return self.rows
+
+    def __storage_rows__(self):
+        """ yields the storage index of each held row - oldest first """
+        for i in range(0, self.rows):
+            yield (self.ring_start + i) % self.capacity
+
+    def get_generations(self):
+        """ returns a list of the recorded generation numbers - oldest first """
+        return [self.generations[row] for row in self.__storage_rows__()]
+
+    def get_state_column(self, state):
+        """ returns a list of the number of cells in the given state at each recorded generation - oldest first """
+        return [self.state_counts[row * self.num_of_states + state] for row in self.__storage_rows__()]
+
+    def get_event_column(self, col):
+        """ returns a list of event counts of the given column at each recorded generation - oldest first """
+        return [self.events[row * self.num_of_events + col] for row in self.__storage_rows__()]
+
+    def get_initial_counts(self):
+        """ returns a tuple of state counts at the first recorded generation """
+        return self.initial_counts
+
+    def get_last_counts(self):
+        """ returns a tuple of state counts at the latest generation """
+        return self.last_counts
+
+    def get_pending_row(self):
+        """
+            returns (generation, events list) of the latest generation if decimation skipped it - it isn't in the
+            buffer until the next recorded row or flush - or None if the latest generation was recorded
+        """
+        if self.last_recorded:
+            return None
+        return self.last_generation, list(self.pending_events)
+
+    def get_event_totals(self):
+        """ returns a list of the total of each event column over the whole run """
+        return list(self.event_totals)
+
+    def iter_rows(self):
+        """ yields (generation, state counts tuple, events tuple) for each recorded generation - oldest first """
+        for row in self.__storage_rows__():
+            yield (self.generations[row],
+                   tuple(self.state_counts[row * self.num_of_states:(row + 1) * self.num_of_states]),
+                   tuple(self.events[row * self.num_of_events:(row + 1) * self.num_of_events]))
+
+    def __view__(self, buffer, cols):
+        """ returns a zero copy 2d memoryview of the held rows of a buffer (in storage order) """
+        view = memoryview(buffer)[:self.rows * cols]
+        return view.cast("B").cast(COUNT_TYPECODE, [self.rows, cols]) if cols else view
+
+    def generations_view(self):
+        """ zero copy view of the generation column - in ring buffer mode the oldest row is at ring_start """
+        return memoryview(self.generations)[:self.rows]
+
+    def state_counts_view(self):
+        """ zero copy (rows x states) view, e.g numpy.asarray(store.state_counts_view()) - see generations_view """
+        return self.__view__(self.state_counts, self.num_of_states)
+
+    def events_view(self):
+        """ zero copy (rows x event columns) view - see generations_view """
+        return self.__view__(self.events, self.num_of_events)
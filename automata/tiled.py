@@ -0,0 +1,278 @@
+"""
+    The tiled module runs flat grid automata on several cores - the grid is partitioned into tiles (see
+    BaseAutomaton.get_tiles) which are advanced by a pool of worker processes over shared memory.
+
+    Every generation:
+        publish  - the current grid is copied into a shared array (a single memory copy)
+        tiles    - each tile's people choose their moves in scan order, reading the tile and a one cell halo around it
+                   from the shared grid. A tile draws from its own random stream (see BaseAutomaton.get_tile_seed) and
+                   resolves conflicts between its own people the same way the single process engines do.
+        exchange - the claims of all tiles are merged in the main process. Two tiles can only claim the same cell
+                   near their border (a halo cell of one of them) - the person with the lower cell index (the earlier
+                   one in scan order) gets it, the other stays put. The merged moves are applied to the grid.
+    Tiles don't depend on the number of workers or on the order they finish in, so a run is the same for a given seed
+    and tile size with any number of workers. It's a different (parallel) update schedule than the single process
+    engines - people of different tiles don't see each other's claims - so runs aren't the same as theirs.
+"""
+
+import array
+import itertools
+import os
+import random
+from multiprocessing import Pool
+from multiprocessing.sharedctypes import RawArray
+from automata.mmn11_automata import ArrayEmergencyEscapeAutomaton, AGENTS_DENSE, choose_exit_fields, claim_exit_targets
+from automata.simple_automata import RandomWalkAutomaton
+
+DEFAULT_TILE_SIZE = 128  # rows and columns of a tile
+CLAIM_TYPECODE = "l"  # claimed target and source cell indices sent back from the workers
+
+_worker_arrays = {}  # name: memoryview of a shared array - set in each worker process (see _init_worker)
+
+
+def _init_worker(shared_arrays):
+    """ worker process initializer - keeps typed views of the shared arrays """
+    _worker_arrays.clear()
+    for name, (typecode, shared) in shared_arrays.items():
+        _worker_arrays[name] = memoryview(shared).cast("B").cast(typecode)
+
+
+def _iter_tile_cells(grid, width, tile, state):
+    """ yields the flat index of every cell of a tile in a given state, in row-major order """
+    y_start, y_end, x_start, x_end = tile
+    for y in range(y_start, y_end):
+        row_start = y * width + x_start
+        row = grid[row_start:row_start + x_end - x_start].tobytes()
+        x = row.find(state)
+        while x != -1:
+            yield row_start + x
+            x = row.find(state, x + 1)
+
+
+def _to_claims(trg_to_src):
+    """ returns the claims of a tile as (targets, sources) bytes - cheap to send back to the main process """
+    return (array.array(CLAIM_TYPECODE, trg_to_src.keys()).tobytes(),
+            array.array(CLAIM_TYPECODE, trg_to_src.values()).tobytes())
+
+
+def _evacuation_tile(task):
+    """ tile kernel of TiledEmergencyEscapeAutomaton - returns the claims of the tile's people """
+    tile, width, seed, crowd_vals, class_flat_neighbors = task
+    grid, exit_fields = _worker_arrays["grid"], _worker_arrays["exit_fields"]
+    size = len(grid)
+    fields = [exit_fields[i * size:(i + 1) * size] for i in range(0, len(crowd_vals))]  # views - not copies
+    rand = random.Random(seed).random
+    trg_to_src = {}
+    people = list(_iter_tile_cells(grid, width, tile, ArrayEmergencyEscapeAutomaton.STATE_PERSON))
+    chosen = choose_exit_fields(people, iter(rand, None), fields, _worker_arrays["cell_dist_vals"], crowd_vals)
+    claim_exit_targets(people, chosen, grid, _worker_arrays["boundary_class"], class_flat_neighbors, trg_to_src)
+    return _to_claims(trg_to_src)
+
+
+def _random_walk_tile(task):
+    """ tile kernel of TiledRandomWalkAutomaton - returns the claims of the tile's walkers """
+    tile, width, seed, class_flat_neighbors = task
+    grid, boundary_class = _worker_arrays["grid"], _worker_arrays["boundary_class"]
+    choice = random.Random(seed).choice
+    trg_to_src = {}
+    for idx in _iter_tile_cells(grid, width, tile, RandomWalkAutomaton.STATE_TAKEN):
+        target = idx + choice(class_flat_neighbors[boundary_class[idx]])
+        # a walker moves to a random neighbor cell if it's empty and not claimed - otherwise it stays put
+        if grid[target] == RandomWalkAutomaton.STATE_EMPTY and target not in trg_to_src:
+            trg_to_src[target] = idx
+    return _to_claims(trg_to_src)
+
+
+def merge_claims(tile_claims):
+    """
+        the exchange phase - returns a dict of target: source of the claims of all tiles (in tile order), where a cell
+        claimed by more than one tile goes to the lowest source index
+    """
+    trg_to_src = {}
+    for targets, sources in tile_claims:
+        tile_targets, tile_sources = array.array(CLAIM_TYPECODE), array.array(CLAIM_TYPECODE)
+        tile_targets.frombytes(targets)
+        tile_sources.frombytes(sources)
+        for target, source in zip(tile_targets, tile_sources):
+            if trg_to_src.setdefault(target, source) > source:
+                trg_to_src[target] = source  # a halo conflict - the earlier person in scan order wins
+    return trg_to_src
+
+
+class TilePool:
+    """ runs a tile kernel over every tile of a shared flat grid on a pool of worker processes """
+
+    def __init__(self, grid_size, static_arrays, workers=None):
+        """
+            :param grid_size: number of cells in the grid
+            :param static_arrays: dict of name: (typecode, array of the typecode) of read only arrays the kernels use
+            :param workers: number of worker processes, None uses all cores, 1 runs the tiles in the calling process
+        """
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.shared_arrays = {"grid": ("B", RawArray("B", grid_size))}
+        for name, (typecode, values) in static_arrays.items():
+            self.shared_arrays[name] = (typecode, RawArray(typecode, len(values)))
+            memoryview(self.shared_arrays[name][1]).cast("B").cast(typecode)[:] = values  # a buffer copy
+        self.grid_view = memoryview(self.shared_arrays["grid"][1]).cast("B")
+        self.pool = Pool(self.workers, _init_worker, (self.shared_arrays,)) if self.workers > 1 else None
+
+    def run(self, kernel, tasks, grid):
+        """ publishes the grid, runs the kernel of every tile task and returns the merged claims (see merge_claims) """
+        self.grid_view[:] = grid
+        if self.pool is None:
+            _init_worker(self.shared_arrays)  # cheap - another automaton may have used the in process views
+            return merge_claims(map(kernel, tasks))
+        return merge_claims(self.pool.imap(kernel, tasks))
+
+    def close(self):
+        """ stops the worker processes """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+
+class _TilePoolOwner:
+    """
+        worker pool lifetime of the tiled automata - the pool is started on the first transition and stopped at the end
+        of every run (and when the automaton is used as a context manager and the block exits), or by close()
+    """
+
+    tile_pool = None
+
+    def run(self, observers=(), max_generations=None, until=None):
+        """ see BaseAutomaton.run - the worker processes are stopped when the run ends """
+        try:
+            return super().run(observers, max_generations, until)
+        finally:
+            self.close()
+
+    def close(self):
+        """ stops the worker processes - they're started again if the automaton is transitioned """
+        if self.tile_pool is not None:
+            self.tile_pool.close()
+            self.tile_pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class TiledEmergencyEscapeAutomaton(_TilePoolOwner, ArrayEmergencyEscapeAutomaton):
+    """
+        The evacuation automaton on several cores - see module doc. The crowd update, the exchange and applying the
+        moves run in the main process, the exit choices and neighbor filtering of the people run in the tiles.
+    """
+
+    def __init__(self, height, width, exits, tile_size=DEFAULT_TILE_SIZE, workers=None, **automaton_kwargs):
+        """
+            :param tile_size: rows and columns of a tile - runs of the same seed and tile size are the same
+            :param workers: number of worker processes, None uses all cores, 1 runs in the calling process
+            :param automaton_kwargs: other ArrayEmergencyEscapeAutomaton parameters (agent_mode is always dense)
+        """
+        automaton_kwargs["agent_mode"] = AGENTS_DENSE  # tiles scan their own rows
+        ArrayEmergencyEscapeAutomaton.__init__(self, height, width, exits, **automaton_kwargs)
+        self.tiles = self.get_tiles(tile_size, tile_size)
+        self.workers = workers
+        self.tile_pool = None  # started on the first transition
+
+    def __start_tile_pool__(self):
+        """ shares the static tables of the automaton with a new pool of workers """
+        if self.boundary_class is None:
+            self.__build_neighborhood__()
+        exit_fields = array.array(self.exit_fields[0].typecode)
+        for field in self.exit_fields:
+            exit_fields += field  # exit-major - the kernels slice a field per exit
+        self.tile_pool = TilePool(self.height * self.width, {
+            "exit_fields": (exit_fields.typecode, exit_fields),
+            "cell_dist_vals": ("d", self.cell_dist_vals),
+            "boundary_class": (self.boundary_class.typecode, self.boundary_class)}, self.workers)
+
+    def __emr_esc_trans__(self):
+        """ this method generates the next generation grid of the automaton - tiles claim, the exchange merges """
+        profiler = self.profiler
+        self.gen_escapes = [0] * len(self.exits)
+        if self.tile_pool is None:
+            self.__start_tile_pool__()
+        crowd_vals = [self.crowd[exit_pos] ** self.crowd_mod for exit_pos in self.exits]  # once per generation
+        tasks = [(tile, self.width, self.get_tile_seed(i), crowd_vals, self.class_flat_neighbors)
+                 for i, tile in enumerate(self.tiles)]
+        if profiler is not None:
+            profiler.lap("allocate")
+        trg_to_src = self.tile_pool.run(_evacuation_tile, tasks, self.grid)
+        if profiler is not None:
+            profiler.lap("tiles")
+        self.__array_trans_second_pass__(trg_to_src)
+        if profiler is not None:
+            profiler.lap("second_pass")
+        self.gen_moves = trg_to_src
+        return self.grid
+
+    def update_world_state(self):
+        """ transitions the automaton to its next generation - the workers are stopped once everyone escaped """
+        ArrayEmergencyEscapeAutomaton.update_world_state(self)
+        if self.is_terminal():
+            self.close()
+
+
+class TiledRandomWalkAutomaton(_TilePoolOwner, RandomWalkAutomaton):
+    """
+        The random walk automaton on several cores with a flat grid - see module doc. Walkers of a tile move in scan
+        order (a walker moves to a random neighbor if it's empty and unclaimed), halo conflicts are resolved by the
+        exchange. A random walk never terminates - step it by run(max_generations=..), in a with block or call close()
+        after stepping it with update_world_state, so the worker processes are stopped.
+    """
+
+    def __init__(self, height, width, tile_size=DEFAULT_TILE_SIZE, workers=None, rng_seed=None, stats_store=None):
+        """
+            :param tile_size: rows and columns of a tile - runs of the same seed and tile size are the same
+            :param workers: number of worker processes, None uses all cores, 1 runs in the calling process
+        """
+        RandomWalkAutomaton.__init__(self, height, width, rng_seed, stats_store)
+        self.tiles = self.get_tiles(tile_size, tile_size)
+        self.workers = workers
+        self.tile_pool = None  # started on the first transition
+        self.gen_moves = None
+
+    def get_grid(self):
+        """ returns the world state grid as a list of rows (a copy - the automaton keeps a flat grid) """
+        return [list(self.grid[i:i + self.width]) for i in range(0, self.height * self.width, self.width)]
+
+    def get_flat_grid(self):
+        return bytes(self.grid)
+
+    def __get_seed_grid__(self):
+        """ generates the initial state grid as a flat bytearray - the same random draws as RandomWalkAutomaton """
+        return bytearray(itertools.chain.from_iterable(RandomWalkAutomaton.__get_seed_grid__(self)))
+
+    def __set_flat_grid__(self, flat_grid):
+        self.grid = bytearray(flat_grid)
+
+    def __recount_states__(self):
+        """ returns a list of the number of cells in each state - counted in C """
+        return [self.grid.count(state) for state in range(0, self.num_of_states)]
+
+    def __get_gen_moves__(self):
+        return self.gen_moves
+
+    def __get_next_generation__(self):
+        """ tiles claim, the exchange merges - the moves are applied to the grid in place """
+        if self.tile_pool is None:
+            if self.boundary_class is None:
+                self.__build_neighborhood__()
+            self.tile_pool = TilePool(self.height * self.width, {
+                "boundary_class": (self.boundary_class.typecode, self.boundary_class)}, self.workers)
+        tasks = [(tile, self.width, self.get_tile_seed(i), self.class_flat_neighbors)
+                 for i, tile in enumerate(self.tiles)]
+        trg_to_src = self.tile_pool.run(_random_walk_tile, tasks, self.grid)
+        if self.profiler is not None:
+            self.profiler.lap("tiles")
+        grid = self.grid
+        # targets were empty cells of the current generation and sources were walkers - updating in place is safe
+        for target, source in trg_to_src.items():
+            grid[target] = self.STATE_TAKEN
+            grid[source] = self.STATE_EMPTY
+        self.gen_moves = trg_to_src
+        return grid
@@ -0,0 +1,296 @@
+"""
+    The trajectory module records automaton runs into a compact binary file and replays them without re-simulating.
+
+    File layout (little endian):
+        header  - magic, version, height, width, number of states, keyframe interval, number of event columns and a
+                  json metadata blob (automaton class, exits, state constants and the number of the first recorded
+                  generation - not 0 when recording starts from a restored checkpoint)
+        chunks  - one zlib compressed chunk per keyframe interval: a keyframe (the full grid, a byte per cell)
+                  followed by a sparse delta per generation (count, changed cell indices, their new states)
+        index   - chunk offsets and lengths, state counts and event counts of every generation
+        trailer - number of generations, number of chunks, index offset, magic
+    Seeking to any generation decompresses a single chunk and applies at most keyframe interval - 1 deltas.
+"""
+
+import array
+import json
+import mmap
+import struct
+import zlib
+from automata.base_automata import BaseAutomaton
+from automata.stats_store import get_exit_esc_count
+from automata.observers import Observer
+
+MAGIC = b"CATRAJ01"
+VERSION = 1
+HEADER_FORMAT = "<8sIIIIII"  # magic, version, height, width, num of states, keyframe interval, num of event columns
+TRAILER_FORMAT = "<QQQ8s"  # num of generations, num of chunks, index offset, magic
+COUNT_FORMAT = "<I"  # number of changed cells in a delta
+INDEX_TYPECODE = "Q"  # chunk offsets and lengths
+STATS_TYPECODE = "q"  # state counts and event counts
+CELL_TYPECODE = "I"  # changed cell indices
+
+
+class TrajectoryRecorder(Observer):
+    """ observer which records every generation of an automaton into a trajectory file - see module doc """
+
+    def __init__(self, path, keyframe_interval=64, compress_level=6):
+        """
+            :param path: trajectory file path
+            :param keyframe_interval: number of generations per chunk - a keyframe is stored at the start of each
+            :param compress_level: zlib compression level (1 fastest - 9 smallest)
+        """
+        self.path = path
+        self.keyframe_interval = keyframe_interval
+        self.compress_level = compress_level
+        self.file = None
+        self.chunk = bytearray()  # uncompressed records of the current chunk
+        self.prev_grid = None  # flat grid of the last recorded generation
+        self.num_of_generations = 0
+        self.chunk_offsets = array.array(INDEX_TYPECODE)
+        self.chunk_lengths = array.array(INDEX_TYPECODE)
+        self.state_counts = array.array(STATS_TYPECODE)
+        self.events = array.array(STATS_TYPECODE)
+        self.num_of_events = 0
+
+    def on_start(self, automaton):
+        """ writes the header and records the current generation as the first keyframe """
+        self.num_of_events = automaton.get_stats().num_of_events
+        states = {name: getattr(automaton, name) for name in dir(type(automaton)) if name.startswith("STATE_")}
+        metadata = {"automaton": type(automaton).__name__, "states": states,
+                    "exits": [list(exit_pos) for exit_pos in getattr(automaton, "exits", [])],
+                    "first_generation": automaton.get_gen_count()}
+        metadata_bytes = json.dumps(metadata).encode()
+        self.file = open(self.path, "wb")
+        self.file.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, automaton.get_height(), automaton.get_width(),
+                                    automaton.get_num_of_states(), self.keyframe_interval, self.num_of_events))
+        self.file.write(struct.pack(COUNT_FORMAT, len(metadata_bytes)) + metadata_bytes)
+        self.__record__(automaton, automaton.get_snapshot())
+
+    def on_generation(self, automaton, snapshot):
+        self.__record__(automaton, snapshot)
+
+    def on_end(self, automaton):
+        self.close()
+
+    def __record__(self, automaton, snapshot):
+        """ appends a generation to the current chunk - a keyframe at each interval start, a sparse delta otherwise """
+        grid = automaton.get_flat_grid()
+        if self.num_of_generations % self.keyframe_interval == 0:
+            self.__flush_chunk__()
+            self.chunk += grid
+        else:
+            if snapshot.moves is not None:
+                # only cells which took part in a move can change - no need to compare the whole grid
+                candidates = sorted(set(snapshot.moves).union(snapshot.moves.values()))
+            else:
+                candidates = range(0, len(grid))
+            prev_grid = self.prev_grid
+            changed = array.array(CELL_TYPECODE, [idx for idx in candidates if grid[idx] != prev_grid[idx]])
+            self.chunk += struct.pack(COUNT_FORMAT, len(changed))
+            self.chunk += changed.tobytes()
+            self.chunk += bytes(grid[idx] for idx in changed)
+        self.prev_grid = grid
+        self.state_counts.extend(snapshot.state_counts)
+        self.events.extend(snapshot.events if snapshot.events is not None else [0] * self.num_of_events)
+        self.num_of_generations += 1
+
+    def __flush_chunk__(self):
+        """ compresses the current chunk and writes it to the file """
+        if self.chunk:
+            data = zlib.compress(bytes(self.chunk), self.compress_level)
+            self.chunk_offsets.append(self.file.tell())
+            self.chunk_lengths.append(len(data))
+            self.file.write(data)
+            self.chunk = bytearray()
+
+    def close(self):
+        """ writes the last chunk, the index and the trailer - the file is complete only after this call """
+        if self.file is None or self.file.closed:
+            return
+        self.__flush_chunk__()
+        index_offset = self.file.tell()
+        for column in (self.chunk_offsets, self.chunk_lengths, self.state_counts, self.events):
+            column.tofile(self.file)
+        self.file.write(struct.pack(TRAILER_FORMAT, self.num_of_generations, len(self.chunk_offsets),
+                                    index_offset, MAGIC))
+        self.file.close()
+
+
+class TrajectoryReader:
+    """ memory mapped reader of a trajectory file - random access to any generation (see module doc) """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as trajectory_file:
+            self.data = mmap.mmap(trajectory_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.height, self.width, self.num_of_states, self.keyframe_interval, self.num_of_events = \
+            struct.unpack_from(HEADER_FORMAT, self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not a trajectory file (or was written by another version)" % path)
+        offset = struct.calcsize(HEADER_FORMAT)
+        metadata_length, = struct.unpack_from(COUNT_FORMAT, self.data, offset)
+        offset += struct.calcsize(COUNT_FORMAT)
+        self.metadata = json.loads(bytes(self.data[offset:offset + metadata_length]).decode())
+        self.first_generation = self.metadata.get("first_generation", 0)  # the generation number of frame 0
+
+        self.num_of_generations, num_of_chunks, index_offset, magic = struct.unpack_from(
+            TRAILER_FORMAT, self.data, len(self.data) - struct.calcsize(TRAILER_FORMAT))
+        if magic != MAGIC:
+            raise ValueError("%s is incomplete - the recorder was not closed" % path)
+        self.chunk_offsets = self.__read_column__(INDEX_TYPECODE, index_offset, num_of_chunks)
+        self.chunk_lengths = self.__read_column__(INDEX_TYPECODE, index_offset + 8 * num_of_chunks, num_of_chunks)
+        stats_offset = index_offset + 16 * num_of_chunks
+        self.state_counts = self.__read_column__(STATS_TYPECODE, stats_offset,
+                                                 self.num_of_generations * self.num_of_states)
+        self.events = self.__read_column__(STATS_TYPECODE, stats_offset + 8 * len(self.state_counts),
+                                           self.num_of_generations * self.num_of_events)
+        self.cached_chunk = (None, None)  # (chunk number, decompressed chunk) - sequential reads reuse it
+
+    def __read_column__(self, typecode, offset, length):
+        """ reads an index column from the mapped file """
+        column = array.array(typecode)
+        column.frombytes(self.data[offset:offset + length * column.itemsize])
+        return column
+
+    def __len__(self):
+        return self.num_of_generations
+
+    def __get_chunk__(self, chunk_num):
+        """ returns a decompressed chunk """
+        if self.cached_chunk[0] != chunk_num:
+            offset = self.chunk_offsets[chunk_num]
+            self.cached_chunk = (chunk_num, zlib.decompress(self.data[offset:offset + self.chunk_lengths[chunk_num]]))
+        return self.cached_chunk[1]
+
+    def __iter_chunk__(self, chunk_num):
+        """ yields the flat grid of each generation of a chunk - the same bytearray is updated in place """
+        chunk = self.__get_chunk__(chunk_num)
+        cells = self.height * self.width
+        grid = bytearray(chunk[:cells])
+        yield grid
+        offset = cells
+        cell_size = array.array(CELL_TYPECODE).itemsize
+        while offset < len(chunk):
+            count, = struct.unpack_from(COUNT_FORMAT, chunk, offset)
+            offset += struct.calcsize(COUNT_FORMAT)
+            changed = array.array(CELL_TYPECODE)
+            changed.frombytes(chunk[offset:offset + count * cell_size])
+            offset += count * cell_size
+            for idx, state in zip(changed, chunk[offset:offset + count]):
+                grid[idx] = state
+            offset += count
+            yield grid
+
+    def get_frame(self, generation):
+        """ returns the flat (row-major) grid of a frame - frames count from the first recorded generation (0) """
+        if not 0 <= generation < self.num_of_generations:
+            raise IndexError("generation %s is not in the trajectory" % generation)
+        chunk_num, skip = divmod(generation, self.keyframe_interval)
+        for i, grid in enumerate(self.__iter_chunk__(chunk_num)):
+            if i == skip:
+                return bytearray(grid)
+
+    def iter_frames(self, start=0):
+        """ yields the flat grid of every generation from start on - a new bytearray for each generation """
+        chunk_num, skip = divmod(start, self.keyframe_interval)
+        for chunk_num in range(chunk_num, len(self.chunk_offsets)):
+            for grid in self.__iter_chunk__(chunk_num):
+                if skip:
+                    skip -= 1
+                    continue
+                yield bytearray(grid)
+
+    def get_state_counts(self, generation):
+        """ returns a list of the number of cells in each state at a frame (see get_frame) """
+        return list(self.state_counts[generation * self.num_of_states:(generation + 1) * self.num_of_states])
+
+    def get_events(self, generation):
+        """ returns a list of the event counts of a frame (e.g escapes at each exit) """
+        return list(self.events[generation * self.num_of_events:(generation + 1) * self.num_of_events])
+
+    def close(self):
+        self.data.close()
+
+
+class ReplayAutomaton(BaseAutomaton):
+    """
+        Replays a recorded trajectory through the automaton interface - can be handed to SquareGridView and ExitGraph.
+        Every generation transition reads the next recorded generation instead of simulating it. A reader opened from a
+        path is closed at the last recorded generation (or by close).
+    """
+
+    def __init__(self, path, stats_store=None):
+        """ :param path: trajectory file path (or an open TrajectoryReader - the caller closes it) """
+        self.owns_reader = not isinstance(path, TrajectoryReader)
+        self.reader = TrajectoryReader(path) if self.owns_reader else path
+        self.frames = self.reader.iter_frames()
+        self.exits = [tuple(exit_pos) for exit_pos in self.reader.metadata["exits"]]
+        self.exit_index = {exit_pos: i for i, exit_pos in enumerate(self.exits)}
+        for name, state in self.reader.metadata["states"].items():
+            setattr(self, name, state)  # e.g STATE_PERSON - the recorded automaton state constants
+        self.recorded_automaton = self.reader.metadata["automaton"]
+        self.num_of_generations = len(self.reader)
+        self.first_generation = self.reader.first_generation
+        BaseAutomaton.__init__(self, self.reader.height, self.reader.width, radius=1,
+                               num_of_states=self.reader.num_of_states, rng_seed=0, stats_store=stats_store)
+        if self.is_terminal():
+            self.close()  # a single recorded generation
+
+    def get_grid(self):
+        """ returns the world state grid as a list of rows """
+        return [list(self.grid[i:i + self.width]) for i in range(0, self.height * self.width, self.width)]
+
+    def get_flat_grid(self):
+        return bytes(self.grid)
+
+    def __get_seed_grid__(self):
+        self.generation_count = self.first_generation  # generations are numbered as they were in the recorded run
+        return next(self.frames)
+
+    def __get_next_generation__(self):
+        return next(self.frames)
+
+    def __permute_neighborhood__(self):
+        """ recorded generations don't use a neighborhood - no index is built or shuffled """
+        pass
+
+    def update_world_state(self):
+        """ reads the next recorded generation - the reader is closed at the last one """
+        BaseAutomaton.update_world_state(self)
+        if self.is_terminal():
+            self.close()
+
+    def close(self):
+        """ closes the trajectory file (if the replay opened it) """
+        if self.owns_reader:
+            self.frames.close()
+            self.reader.close()
+
+    def __get_num_of_event_columns__(self):
+        return self.reader.num_of_events
+
+    def __get_frame_num__(self):
+        """ returns the trajectory frame of the current generation """
+        return self.generation_count - self.first_generation
+
+    def __get_gen_events__(self):
+        return self.reader.get_events(self.__get_frame_num__())
+
+    def __count_states__(self):
+        return self.reader.get_state_counts(self.__get_frame_num__())
+
+    def is_terminal(self):
+        """ returns true at the last recorded generation """
+        return self.__get_frame_num__() >= self.num_of_generations - 1
+
+    def get_exit_esc_count(self):
+        """ returns a dict of exit:generation:num_of_escaped_ppl - see EmergencyEscapeAutomaton """
+        return get_exit_esc_count(self.stats, self.exits)
+
+    def get_exit_esc_total(self, exit_pos):
+        """ returns the number of people escaped at an exit so far """
+        return self.stats.get_event_totals()[self.exit_index[exit_pos]]
+
+    def get_num_of_people_at_seed(self):
+        return self.stats.get_initial_counts()[self.STATE_PERSON]
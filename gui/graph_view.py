@@ -7,6 +7,7 @@
 import tkinter as tk
 from decimal import Decimal
 from gui.color_generator import *
+from gui.plot_data import escape_curves, downsample_min_max
 
 
 class Graph(tk.Frame):
@@ -109,22 +110,29 @@ class Graph(tk.Frame):
 
     def plot_line(self, points: list, color='black', point_visibility=False):
         """
-        Plot a line of points
+        Plot a line of points - drawn as a single polyline canvas item
         :param points: a list of tuples, each tuple containing an (x, y) point
         :param color: the color of the line
         :param point_visibility: True if the points
         should be individually visible
         :return: None
         """
-        last_point = ()
-        for point in points:
-            this_point = self.plot_point(point[0], point[1],
-                                         color=color, visible=point_visibility)
-
-            if last_point:
-                self.canvas.create_line(last_point + this_point, fill=color)
-            last_point = this_point
-            # print last_point
+        if point_visibility:
+            for point in points:
+                self.plot_point(point[0], point[1], color=color)
+        # the coordinate math of plot_point, done for the whole line in one pass
+        x_scale, y_scale = self.px_x / self.x_tick, self.px_y / self.y_tick
+        x_offset, y_offset = 50 - x_scale * self.x_min, 50 + y_scale * self.y_max
+        coords = []
+        for x, y in points:
+            coords.append(x_offset + x_scale * x)
+            coords.append(y_offset - y_scale * y)
+        if len(coords) >= 4:
+            self.canvas.create_line(coords, fill=color)
+
+    def plot_width(self):
+        """ returns the width of the plot area in pixels """
+        return int(self.w - 100)
 
     @staticmethod
     def frange(start, stop, step, digits_to_round=3):
@@ -144,7 +152,7 @@ class Graph(tk.Frame):
 
 
 def people_label(automaton):
-    return "People at seed: %s" % automaton.gen_state_count[0][automaton.STATE_PERSON]
+    return "People at seed: %s" % automaton.get_num_of_people_at_seed()
 
 
 def size_label(automaton):
@@ -154,7 +162,7 @@ def size_label(automaton):
 def esc_count_label(automaton):
     label_text = ""
     for exit_pos in automaton.exits:
-        esc_count = sum(automaton.get_exit_esc_count()[exit_pos][g] for g in automaton.get_exit_esc_count()[exit_pos])
+        esc_count = automaton.get_exit_esc_total(exit_pos)
         label_text += "Total escaped at exit " + str(exit_pos) + " : " + str(esc_count) + " \n"
     return label_text
 
@@ -205,12 +213,7 @@ class ExitGraph(Graph):
         desc_label.grid()
 
     def plot_exit_points(self):
-        esc_gen_esc_dict = self.automaton.get_exit_esc_count()
-        for exit_pos in self.automaton.exits:
-            esc_ppl = 0
-            point_list = []
-            for g in range(0, self.automaton.get_gen_count()):
-                if g in esc_gen_esc_dict[exit_pos]:
-                    esc_ppl += esc_gen_esc_dict[exit_pos][g]
-                point_list.append((g, esc_ppl))
-            self.plot_line(point_list, color=self.colors[exit_pos])
+        """ plot the cumulative escape curve of each exit - downsampled to the plot width, a line item per exit """
+        for exit_pos, (generations, escaped) in escape_curves(self.automaton).items():
+            generations, escaped = downsample_min_max(generations, escaped, self.x_min, self.x_max, self.plot_width())
+            self.plot_line(list(zip(generations, escaped)), color=self.colors[exit_pos])
@@ -0,0 +1,189 @@
+"""
+This module exports automaton runs as image files without a display - tkinter is not required.
+Frames are png (encoded with zlib, no external libraries) or binary ppm images, one pixel per cell scaled up by an
+integer factor. A FrameExporter observer hands the grids of every Nth generation to an encoder thread, so encoding
+and writing (zlib releases the GIL) run alongside the simulation.
+"""
+
+import os
+import queue
+import struct
+import threading
+import zlib
+from automata.observers import Observer
+from gui import color_generator
+from gui import pixel_buffer
+from gui.plot_data import escape_curves, downsample_min_max
+
+FORMAT_PNG = "png"
+FORMAT_PPM = "ppm"
+IMAGE_FORMATS = (FORMAT_PNG, FORMAT_PPM)
+CURVES_SIZE = 700  # pixel width and height of the exported escape curves image (same as ExitGraph)
+
+
+def scale_pixels(pixels, width, height, x_scale, y_scale):
+    """ returns an interleaved rgb pixel buffer scaled up by integer factors (nearest neighbour) """
+    if x_scale != 1:
+        scaled = bytearray(len(pixels) * x_scale)
+        for i in range(0, x_scale):
+            for channel in range(0, 3):
+                scaled[3 * i + channel::3 * x_scale] = pixels[channel::3]
+        pixels = scaled
+    if y_scale != 1:
+        stride = 3 * width * x_scale
+        pixels = b"".join(pixels[y * stride:(y + 1) * stride] * y_scale for y in range(0, height))
+    return pixels
+
+
+def _png_chunk(tag, data):
+    """ returns a png chunk - length, tag, data, crc """
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+
+
+def encode_png(pixels, width, height, compress_level=6):
+    """ returns png file data of an interleaved rgb pixel buffer (8 bit truecolor, no filtering) """
+    stride = 3 * width
+    raw = b"".join(b"\x00" + bytes(pixels[y * stride:(y + 1) * stride]) for y in range(0, height))
+    return (b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)) +
+            _png_chunk(b"IDAT", zlib.compress(raw, compress_level)) + _png_chunk(b"IEND", b""))
+
+
+def encode_image(pixels, width, height, image_format=FORMAT_PNG):
+    """ returns image file data in one of IMAGE_FORMATS """
+    if image_format == FORMAT_PNG:
+        return encode_png(pixels, width, height)
+    elif image_format == FORMAT_PPM:
+        return pixel_buffer.to_ppm(pixels, width, height)
+    raise ValueError("unknown image format: %s - expected one of %s" % (image_format, IMAGE_FORMATS))
+
+
+def write_image(path, pixels, width, height, image_format=FORMAT_PNG):
+    """ encodes and writes an image file """
+    with open(path, "wb") as image_file:
+        image_file.write(encode_image(pixels, width, height, image_format))
+
+
+class FrameExporter(Observer):
+    """ observer which writes an image file of every Nth generation - encoded on a background thread """
+
+    def __init__(self, directory, every=1, scale=1, image_format=FORMAT_PNG, max_pending=16):
+        """
+            :param directory: output directory - frames are named frame_<generation>.<format>
+            :param every: export every `every` generations (the generation the exporter is attached at is exported)
+            :param scale: pixel size of each cell
+            :param image_format: one of IMAGE_FORMATS
+            :param max_pending: frames waiting to be encoded - the simulation waits when the encoder falls behind
+        """
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError("unknown image format: %s - expected one of %s" % (image_format, IMAGE_FORMATS))
+        self.directory = directory
+        self.every = every
+        self.scale = scale
+        self.image_format = image_format
+        self.frames = queue.Queue(max_pending)
+        self.encoder = None
+        self.error = None  # an exception raised by the encoder thread - re-raised by on_end
+        self.channel_tables = None
+        self.width = self.height = 0
+        self.exported = 0
+
+    def on_start(self, automaton):
+        os.makedirs(self.directory, exist_ok=True)
+        self.channel_tables = pixel_buffer.make_state_tables(automaton.get_num_of_states())
+        self.width, self.height = automaton.get_width(), automaton.get_height()
+        self.encoder = threading.Thread(target=self.__encode_frames__, name="frame encoder", daemon=True)
+        self.encoder.start()
+        self.__submit__(automaton)
+
+    def on_generation(self, automaton, snapshot):
+        if snapshot.generation % self.every == 0:
+            self.__submit__(automaton)
+
+    def on_end(self, automaton):
+        """ waits until every submitted frame is written """
+        if self.encoder is not None:
+            self.frames.put(None)
+            self.encoder.join()
+            self.encoder = None
+        if self.error is not None:
+            raise self.error
+
+    def __submit__(self, automaton):
+        """ hands a copy of the current grid to the encoder thread """
+        self.frames.put((automaton.get_gen_count(), automaton.get_flat_grid()))
+
+    def __encode_frames__(self):
+        """ encoder thread - converts, scales, encodes and writes frames until the end of the run """
+        while True:
+            frame = self.frames.get()
+            if frame is None:
+                return
+            if self.error is not None:
+                continue  # keep draining so the simulation never blocks
+            generation, grid = frame
+            try:
+                pixels = pixel_buffer.grid_to_rgb(grid, self.channel_tables)
+                pixels = scale_pixels(pixels, self.width, self.height, self.scale, self.scale)
+                path = os.path.join(self.directory, "frame_%06d.%s" % (generation, self.image_format))
+                write_image(path, pixels, self.width * self.scale, self.height * self.scale, self.image_format)
+                self.exported += 1
+            except Exception as error:
+                self.error = error
+
+
+def _draw_line(pixels, width, x0, y0, x1, y1, color):
+    """ draws a line into an interleaved rgb pixel buffer (bresenham) """
+    dx, dy = abs(x1 - x0), -abs(y1 - y0)
+    step_x, step_y = (1 if x0 < x1 else -1), (1 if y0 < y1 else -1)
+    error = dx + dy
+    while True:
+        offset = 3 * (y0 * width + x0)
+        pixels[offset:offset + 3] = color
+        if x0 == x1 and y0 == y1:
+            return
+        double_error = 2 * error
+        if double_error >= dy:
+            error += dy
+            x0 += step_x
+        if double_error <= dx:
+            error += dx
+            y0 += step_y
+
+
+def render_exit_curves(automaton, width=CURVES_SIZE, height=CURVES_SIZE, margin=50):
+    """
+        Returns an interleaved rgb pixel buffer of the cumulative escape curve of each exit (the ExitGraph plot,
+        without text) - exit colors match ExitGraph, x is the generation and y the number of escaped people.
+    """
+    pixels = bytearray(b"\xff" * (3 * width * height))
+    black = bytes(3)
+    right, bottom = width - margin, height - margin
+    for x0, y0, x1, y1 in ((margin, margin, right, margin), (margin, bottom, right, bottom),
+                           (margin, margin, margin, bottom), (right, margin, right, bottom)):
+        _draw_line(pixels, width, x0, y0, x1, y1, black)
+
+    x_max = max(1, automaton.get_gen_count())
+    y_max = max(1, automaton.get_num_of_people_at_seed())
+    colors = color_generator.generate_rgb_colors(len(automaton.exits) + 1)
+    for i, (generations, escaped) in enumerate(escape_curves(automaton).values()):
+        color = bytes(colors[i + 1])
+        generations, escaped = downsample_min_max(generations, escaped, 0, x_max, right - margin)
+        points = [(margin + round((right - margin) * min(generation, x_max) / x_max),
+                   bottom - round((bottom - margin) * min(esc_count, y_max) / y_max))
+                  for generation, esc_count in zip(generations, escaped)]
+        for (x0, y0), (x1, y1) in zip(points, points[1:]):
+            _draw_line(pixels, width, x0, y0, x1, y1, color)
+    return pixels
+
+
+def export_run(automaton, directory, every=1, scale=1, image_format=FORMAT_PNG, max_generations=None):
+    """
+        Runs an automaton to its end without a display, writing every Nth generation as an image frame and
+        (for automata with exits) the escape curves as exit_curves.<format>. Returns the automaton.
+    """
+    exporter = FrameExporter(directory, every, scale, image_format)
+    automaton.run([exporter], max_generations)
+    if getattr(automaton, "exits", None):
+        write_image(os.path.join(directory, "exit_curves." + image_format), render_exit_curves(automaton),
+                    CURVES_SIZE, CURVES_SIZE, image_format)
+    return automaton
@@ -0,0 +1,41 @@
+"""
+This module converts automaton grids into RGB pixel buffers - one pixel per cell, colored by the cell's state.
+Conversion runs in C: each color channel is a bytes.translate lookup table indexed by the state byte, and the
+channels are interleaved with slice assignment. Doesn't require tkinter (used by the GUI and by headless exporters).
+"""
+
+from gui import color_generator
+
+
+def make_channel_tables(rgb_colors):
+    """ returns a (red, green, blue) tuple of 256 byte translate tables - state: channel value of the state's color """
+    tables = []
+    for channel in range(0, 3):
+        table = bytearray(256)
+        for state, color in enumerate(rgb_colors[:256]):
+            table[state] = color[channel]
+        tables.append(bytes(table))
+    return tuple(tables)
+
+
+def make_state_tables(num_of_states):
+    """ returns channel tables for the palette of color_generator.generate_rgb_colors """
+    return make_channel_tables(color_generator.generate_rgb_colors(num_of_states))
+
+
+def grid_to_rgb(flat_grid, channel_tables):
+    """
+        Returns a bytearray of interleaved rgb pixels (3 bytes per cell)
+        :param flat_grid: row-major bytes-like grid of states (e.g BaseAutomaton.get_flat_grid())
+        :param channel_tables: see make_channel_tables
+    """
+    flat_grid = bytes(flat_grid)
+    pixels = bytearray(3 * len(flat_grid))
+    for channel, table in enumerate(channel_tables):
+        pixels[channel::3] = flat_grid.translate(table)
+    return pixels
+
+
+def to_ppm(pixels, width, height):
+    """ returns binary (P6) ppm image data of an interleaved rgb pixel buffer """
+    return b"P6\n%d %d\n255\n" % (width, height) + bytes(pixels)
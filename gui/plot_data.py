@@ -0,0 +1,67 @@
+"""
+This module prepares plot data from automaton statistics - doesn't require tkinter (used by graphs and exporters).
+"""
+
+import bisect
+import itertools
+
+
+def escape_curves(automaton):
+    """
+        Returns a dict of exit:(generations, cumulative number of people escaped at the exit) computed from the
+        automaton's stats store - a point per recorded generation, starting at (0, 0), and a last point for the latest
+        generation if decimation skipped it (read without recording it - the store isn't changed).
+        Escapes recorded at generation g happened during the transition from g - 1 (as in get_exit_esc_count).
+    """
+    stats = automaton.get_stats()
+    generations = stats.get_generations()
+    seed_held = generations[:1] == [0]  # in ring buffer mode the seed row may have been evicted
+    event_totals = stats.get_event_totals()
+    pending = stats.get_pending_row()
+    curves = {}
+    for col, exit_pos in enumerate(automaton.exits):
+        column = stats.get_event_column(col)
+        pending_escapes = pending[1][col] if pending is not None else 0
+        if seed_held:
+            # the seed row has no escapes - it's the (0, 0) starting point
+            xs = [0] + [generation - 1 for generation in generations[1:]]
+            ys = list(itertools.accumulate(itertools.chain((0,), column[1:])))
+        else:
+            base = event_totals[col] - sum(column) - pending_escapes  # escapes of evicted rows
+            xs = [generation - 1 for generation in generations]
+            ys = list(itertools.accumulate(itertools.chain((base,), column)))[1:]
+        if pending is not None:
+            xs.append(pending[0] - 1)
+            ys.append(event_totals[col])
+        curves[exit_pos] = (xs, ys)
+    return curves
+
+
+def downsample_min_max(xs, ys, x_min, x_max, num_of_columns):
+    """
+        Returns (xs, ys) reduced to at most 4 points per pixel column - the first, lowest, highest and last point of
+        each column (in x order), so the drawn line looks the same as with every point, at a cost bounded by the plot
+        width instead of the number of points.
+        :param xs: ascending x values
+        :param ys: y values
+        :param x_min: x value of the left plot edge
+        :param x_max: x value of the right plot edge
+        :param num_of_columns: plot width in pixels
+    """
+    if len(xs) <= 4 * num_of_columns:
+        return list(xs), list(ys)
+    x_step = ((x_max - x_min) or 1) / num_of_columns
+    out_xs, out_ys = [], []
+    start = 0
+    for column in range(1, num_of_columns + 2):
+        # xs are ascending - the points of a column are found by bisection, min/max run in C over the slice
+        end = bisect.bisect_left(xs, x_min + column * x_step, start) if column <= num_of_columns else len(xs)
+        if end > start:
+            column_ys = ys[start:end]
+            low = start + column_ys.index(min(column_ys))
+            high = start + column_ys.index(max(column_ys))
+            for i in sorted({start, low, high, end - 1}):
+                out_xs.append(xs[i])
+                out_ys.append(ys[i])
+        start = end
+    return out_xs, out_ys
@@ -0,0 +1,105 @@
+"""
+This module runs an automaton simulation in a background thread, so the simulation doesn't wait for the screen to
+redraw and the screen doesn't wait for the simulation to step. Doesn't require tkinter.
+
+The latest generation is handed to the renderer through a published Frame: the renderer requests a frame, the
+simulation thread copies the grid into a new immutable Frame once the current generation is done and swaps the
+reference (a single atomic assignment - no locks). Generations completed between two requests are never copied -
+the renderer draws at its own frame rate and skips them.
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+# a published generation - grid is row-major bytes (see BaseAutomaton.get_flat_grid), snapshot a GenerationSnapshot
+Frame = namedtuple("Frame", ["generation", "grid", "snapshot"])
+
+PAUSE_POLL_INTERVAL = 0.05  # seconds between checks for resume/step/stop while paused
+
+
+class SimulationThread(threading.Thread):
+    """ steps an automaton until it terminates (or is stopped) and publishes frames on request """
+
+    def __init__(self, automaton, generation_interval=None, paused=False):
+        """
+            :param automaton: the automaton object - a subclass of BaseAutomaton, only this thread touches it
+            :param generation_interval: minimal time (in seconds) between generations, None runs at full speed
+            :param paused: start paused - call resume() or step() to advance
+        """
+        threading.Thread.__init__(self, name="simulation", daemon=True)
+        self.automaton = automaton
+        self.generation_interval = generation_interval
+        self.fast_forward = False  # True ignores generation_interval
+        self.running = threading.Event()  # cleared while paused
+        if not paused:
+            self.running.set()
+        self.step_event = threading.Event()  # set to advance a single generation while paused
+        self.stop_event = threading.Event()
+        self.frame_requested = False
+        self.finished = False  # True once the simulation has ended - the last frame is published before it's set
+        self.frame = None
+        self.__publish__(automaton.get_snapshot())
+
+    def __publish__(self, snapshot):
+        """ copies the current generation into a new frame and makes it the latest frame """
+        self.frame_requested = False
+        self.frame = Frame(self.automaton.get_gen_count(), self.automaton.get_flat_grid(), snapshot)
+
+    def request_frame(self):
+        """ asks the simulation thread to publish the generation it completes next """
+        self.frame_requested = True
+
+    def run(self):
+        generations = self.automaton.iter_generations()
+        next_step_time = time.perf_counter()
+        last_snapshot = None
+        while not self.stop_event.is_set():
+            if not self.running.is_set():
+                if not self.step_event.wait(PAUSE_POLL_INTERVAL):
+                    continue
+                self.step_event.clear()
+                self.frame_requested = True  # always show the result of a single step
+            elif self.generation_interval is not None and not self.fast_forward:
+                delay = next_step_time - time.perf_counter()
+                if delay > 0:
+                    self.stop_event.wait(delay)
+                    continue  # recheck pause/stop after sleeping
+                next_step_time = max(next_step_time + self.generation_interval, time.perf_counter())
+            snapshot = next(generations, None)
+            if snapshot is None:
+                break
+            last_snapshot = snapshot
+            if self.frame_requested:
+                self.__publish__(snapshot)
+        if last_snapshot is not None and self.frame.generation != self.automaton.get_gen_count():
+            self.__publish__(last_snapshot)  # the final generation
+        self.finished = True
+
+    def is_paused(self):
+        return not self.running.is_set()
+
+    def pause(self):
+        self.running.clear()
+
+    def resume(self):
+        self.running.set()
+
+    def toggle_pause(self):
+        if self.is_paused():
+            self.resume()
+        else:
+            self.pause()
+
+    def step(self):
+        """ advances a single generation - only while paused """
+        self.step_event.set()
+
+    def toggle_fast_forward(self):
+        self.fast_forward = not self.fast_forward
+
+    def stop(self):
+        """ stops the simulation and waits for the thread to end - the automaton may be used again afterwards """
+        self.stop_event.set()
+        if self.is_alive():
+            self.join()
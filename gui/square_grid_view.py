@@ -2,12 +2,19 @@
 
 import tkinter as tk  # requires tkinter (a Python standard GUI library) to display the visualization
 from gui import color_generator  # requires the color generator to generate distinct colors for each automaton state
+from gui import pixel_buffer  # converts grids into rgb pixels for the image renderer
+from gui.simulation_thread import SimulationThread  # steps the automaton in the background
+
+RENDERER_CANVAS = "canvas"  # a canvas rectangle per cell - only changed cells are recolored
+RENDERER_IMAGE = "image"  # a single image per frame - scales to grids with millions of cells
+IMAGE_RENDERER_MIN_CELLS = 40000  # grids with at least this many cells use the image renderer by default
 
 
 class SquareGridView(tk.Frame):
     """ this class is used to visually display and animate a square grid based cellular automaton """
 
-    def __init__(self, rows, cols, row_size, col_size, num_of_states, world_state_obj, update_time_interval):
+    def __init__(self, rows, cols, row_size, col_size, num_of_states, world_state_obj, update_time_interval,
+                 renderer=None, background=True, paused=False):
         """
             Display an animated visualization of a cellular automaton - call mainloop() after initialization to run
             :param rows: number of automaton grid rows
@@ -17,7 +24,11 @@ class SquareGridView(tk.Frame):
             :param num_of_states: number of possible states in automaton
             :param world_state_obj: the automaton object - a subclass of BaseAutomaton
             :param update_time_interval: time (in milliseconds) between each cycle of update-state + redraw-screen
-
+            :param renderer: RENDERER_CANVAS or RENDERER_IMAGE, None picks by grid size (see IMAGE_RENDERER_MIN_CELLS)
+            :param background: step the automaton in a background thread (see SimulationThread) - the screen is
+            redrawn every update_time_interval with the latest generation, generations in between are skipped.
+            keys: space - pause/resume, s or right arrow - single step, f - fast forward (full simulation speed)
+            :param paused: start paused (background mode only)
         """
         tk.Frame.__init__(self, None, background='#000000')  # set the frame background color
         self.master.title("Cellular Automata")  # set the ui window name
@@ -29,7 +40,18 @@ class SquareGridView(tk.Frame):
         self.app_row_size = row_size
         self.app_col_size = col_size
         self.colors = color_generator.generate_tk_colors(num_of_states)
+        self.channel_tables = pixel_buffer.make_state_tables(num_of_states)  # same palette as colors
+        if renderer is None:
+            renderer = RENDERER_IMAGE if rows * cols >= IMAGE_RENDERER_MIN_CELLS else RENDERER_CANVAS
+        self.renderer = renderer
         self.world_state = world_state_obj  # this object is used to get automaton grid and access automaton state
+        self.generations = None  # foreground mode - each next() call transitions the automaton
+        self.simulation = None  # background mode - the thread which transitions the automaton
+        if background:
+            # the simulation paces itself at a generation per update interval (unless fast forwarded)
+            self.simulation = SimulationThread(world_state_obj, update_time_interval / 1000, paused)
+        else:
+            self.generations = world_state_obj.iter_generations()
         self.app_update_delay = update_time_interval  # screen update time interval
         # create the canvas on which to draw the grid and automata
         self.canvas = tk.Canvas(self, width=self.app_cols * self.app_col_size + 1,
@@ -37,9 +59,22 @@ class SquareGridView(tk.Frame):
                                 borderwidth=0, highlightthickness=0)
 
         self.canvas.grid(padx=5, pady=5)
+        self.cells = None  # canvas items of the grid cells - created on the first draw
+        self.drawn_grid = None
+        self.frame_image = None  # image renderer - one pixel per cell
+        self.zoomed_image = None  # image renderer - the frame image scaled by the cell size (shown on the canvas)
+        self.drawn_generation = None
         # create a description label
         self.__draw_description__()
-        self.__app_update__()
+        if self.simulation is not None:
+            self.status_label = tk.Label(self, fg='white', bg='black')
+            self.status_label.grid()
+            self.master.bind("<Key>", self.__on_key__)
+            self.master.protocol("WM_DELETE_WINDOW", self.__app_close__)
+            self.simulation.start()
+            self.__app_render_frame__()
+        else:
+            self.__app_update__()
 
     def __draw_description__(self):
         description = "Size: %sx%s" % (self.app_rows, self.app_cols)
@@ -55,29 +90,120 @@ class SquareGridView(tk.Frame):
         for i in range(x, height, y):
             self.canvas.create_line(0, i, width, i, fill="#222222")
 
-    def __app_color_fill_cells__(self):
-        """ fill the grid cells with color """
-        grid = self.world_state.get_grid()
-        # iterate over the world grid and draw each cell with a color corresponding to its state
-        for y in range(0, len(grid)):
-            for x in range(0, len(grid[y])):
+    def __app_create_cells__(self, grid):
+        """ create a rectangle item for each grid cell (once) and fill it with the color of the cell's state """
+        self.drawn_grid = grid  # row-major states currently shown on the canvas
+        self.cells = []  # row-major canvas item ids - the item of cell (y, x) is cells[y * cols + x]
+        for y in range(0, self.app_rows):
+            for x in range(0, self.app_cols):
                 x0, y0 = x * self.app_col_size, y * self.app_row_size  # rect top-left coords
                 x1, y1 = (x + 1) * self.app_col_size, (y + 1) * self.app_row_size  # rect bottom-right coords
-                self.canvas.create_rectangle(x0, y0, x1, y1, width=0, fill=self.colors[grid[y][x]])  # draw rect
+                state = grid[y * self.app_cols + x]
+                self.cells.append(self.canvas.create_rectangle(x0, y0, x1, y1, width=0, fill=self.colors[state]))
+
+    def __app_changed_cells__(self, grid, moves):
+        """ yields the flat index of every cell whose state differs from the drawn grid """
+        drawn_grid = self.drawn_grid
+        if moves is not None:
+            # the automaton reports the cells it moved since the drawn generation - only those can have changed
+            for idx in set(moves).union(moves.values()):
+                if grid[idx] != drawn_grid[idx]:
+                    yield idx
+            return
+        cols = self.app_cols
+        for row_start in range(0, len(grid), cols):
+            row_end = row_start + cols
+            if grid[row_start:row_end] == drawn_grid[row_start:row_end]:
+                continue  # unchanged rows are skipped by a single (C speed) comparison
+            for idx in range(row_start, row_end):
+                if grid[idx] != drawn_grid[idx]:
+                    yield idx
+
+    def __app_color_fill_cells__(self, grid, moves):
+        """ recolor only the cells whose state changed since the last draw """
+        if grid == self.drawn_grid:
+            return
+        for idx in self.__app_changed_cells__(grid, moves):
+            self.canvas.itemconfigure(self.cells[idx], fill=self.colors[grid[idx]])
+        self.drawn_grid = grid
+
+    def __app_draw_image__(self, grid):
+        """ draw the whole grid as a single image - a pixel per cell, scaled up by tk (nearest neighbour) """
+        pixels = pixel_buffer.grid_to_rgb(grid, self.channel_tables)
+        ppm = pixel_buffer.to_ppm(pixels, self.app_cols, self.app_rows)
+        if self.frame_image is None:
+            self.frame_image = tk.PhotoImage(width=self.app_cols, height=self.app_rows, data=ppm, format="PPM")
+            self.zoomed_image = tk.PhotoImage(width=self.app_cols * self.app_col_size,
+                                              height=self.app_rows * self.app_row_size)
+            self.canvas.create_image(0, 0, image=self.zoomed_image, anchor=tk.NW)
+        else:
+            self.frame_image.configure(data=ppm, format="PPM")
+        # copy the frame into the shown image - every pixel is repeated col_size x row_size times
+        self.tk.call(self.zoomed_image, "copy", self.frame_image, "-zoom", self.app_col_size, self.app_row_size)
 
-    def __app_draw_screen__(self):
-        """ delete the previous screen and redraw the grid and automata """
-        self.canvas.delete("all")
-        self.__app_color_fill_cells__()  # draw the automata world state
-        self.__app_draw_grid__()  # draw the grid
+    def __app_draw_screen__(self, grid, moves=None):
+        """
+            draw the automata world state - the cells and grid lines are created once, only changes are redrawn
+            :param grid: row-major bytes of cell states (see BaseAutomaton.get_flat_grid)
+            :param moves: moves of the transition from the drawn generation to this one (None if unknown)
+        """
+        if self.renderer == RENDERER_IMAGE:
+            self.__app_draw_image__(grid)
+        elif self.cells is None:
+            self.__app_create_cells__(grid)  # draw the automata world state
+            self.__app_draw_grid__()  # draw the grid (on top of the cells)
+        else:
+            self.__app_color_fill_cells__(grid, moves)
 
     def __app_update__(self):
-        self.world_state.update_world_state()  # this call causes the automata to transition to the next generation
+        # this call causes the automata to transition to the next generation
+        snapshot = next(self.generations, None)
         # check if automaton simulation has ended - terminate visualization if so
-        if self.world_state.is_terminal():
-            self.quit()
-            self.destroy()
+        if snapshot is None or self.world_state.is_terminal():
+            self.__app_close__()
         else:
-            self.__app_draw_screen__()  # draw current universe state on screen
+            self.__app_draw_screen__(self.world_state.get_flat_grid(), snapshot.moves)  # draw current state
             # call update again after set amount of time (i.e this is the draw loop call)
             self.after(self.app_update_delay, self.__app_update__)
+
+    def __app_render_frame__(self):
+        """ background mode draw loop - draws the latest published frame at a fixed rate, skipping generations """
+        frame = self.simulation.frame
+        if frame.generation != self.drawn_generation:
+            # moves are only valid if no generation was skipped since the drawn one
+            skipped = self.drawn_generation is None or frame.generation != self.drawn_generation + 1
+            moves = frame.snapshot.moves if not skipped else None
+            self.__app_draw_screen__(frame.grid, moves)
+            self.drawn_generation = frame.generation
+            self.__draw_status__()
+        if self.simulation.finished and frame is self.simulation.frame:
+            self.__app_close__()  # the final generation has been drawn
+        else:
+            self.simulation.request_frame()
+            self.after(self.app_update_delay, self.__app_render_frame__)
+
+    def __draw_status__(self):
+        """ show the drawn generation and the simulation controls state """
+        status = "Generation: %s" % self.drawn_generation
+        if self.simulation.is_paused():
+            status += " [paused]"
+        elif self.simulation.fast_forward:
+            status += " [fast forward]"
+        self.status_label.configure(text=status)
+
+    def __on_key__(self, event):
+        """ simulation controls - space: pause/resume, s or right arrow: single step, f: fast forward """
+        if event.keysym == "space":
+            self.simulation.toggle_pause()
+        elif event.keysym in ("s", "Right"):
+            self.simulation.step()
+        elif event.keysym == "f":
+            self.simulation.toggle_fast_forward()
+        self.__draw_status__()
+
+    def __app_close__(self):
+        """ stop the simulation (background mode) and close the window - the automaton is safe to use afterwards """
+        if self.simulation is not None:
+            self.simulation.stop()
+        self.quit()
+        self.destroy()
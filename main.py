@@ -3,106 +3,185 @@
 # Author:   Roman Smirnov
 # Created:  4/11/2017
 
-import sys  # used to get command line arguments
+import argparse  # used to parse command line arguments
+import os
+from collections import namedtuple
 from automata.mmn11_automata import EmergencyEscapeAutomaton
-from gui.square_grid_view import *
-from gui.graph_view import *
+from automata.trajectory import TrajectoryRecorder, ReplayAutomaton
+from automata.scenario import load_scenario, build_automaton
+from automata.profiler import PhaseProfiler
+from gui.image_export import export_run
 from stats.mmn11_stats import *
+from stats.benchmark import run_benchmarks, compare_results
 
 # some global constants
 ROW_SIZE = 10
 COL_SIZE = 10
 TICK_TIME = 5
-
-
-def q2_0():
+MAX_VIEW_SIZE = 800  # scenario grids are shown with cells small enough to fit this many pixels
+
+
+# where the demos send their output - record_dir: trajectory files (None disables recording),
+# export_dir: run headless and write image frames of every export_every generations instead of showing a GUI,
+# profile: print a per phase timing table after each demo, profile_stream: file of per generation phase times
+Output = namedtuple("Output", ["record_dir", "export_dir", "export_every", "profile", "profile_stream"])
+GUI_OUTPUT = Output(None, None, 1, False, None)
+
+
+def show(automaton, name, output=GUI_OUTPUT, cell_size=ROW_SIZE):
+    """ visualizes an automaton until it terminates, then shows the exit graph - see Output for other outputs """
+    recorder = None
+    if output.record_dir is not None:
+        os.makedirs(output.record_dir, exist_ok=True)
+        recorder = TrajectoryRecorder(os.path.join(output.record_dir, name + ".traj"))
+        automaton.add_observer(recorder)
+    try:
+        if output.profile or output.profile_stream is not None:
+            automaton.enable_profiling(PhaseProfiler(output.profile_stream))
+        if output.export_dir is not None:
+            # headless - frames and the exit graph curves are written as images
+            export_run(automaton, os.path.join(output.export_dir, name), output.export_every, scale=cell_size)
+        else:
+            from gui.square_grid_view import SquareGridView  # tkinter is only needed to show the run
+            # create the visualization grid
+            gui = SquareGridView(automaton.get_height(), automaton.get_width(), cell_size, cell_size,
+                                 automaton.get_num_of_states(), automaton, TICK_TIME)
+            gui.mainloop()
+    finally:
+        if recorder is not None:  # the trajectory is complete up to the last generation even if the run failed
+            automaton.remove_observer(recorder)
+            recorder.close()
+    profiler = automaton.disable_profiling()
+    if profiler is not None and output.profile:
+        print("\n%s phase times:\n%s" % (name, profiler.format_summary()))
+
+    if output.export_dir is None:
+        # show statistics and graph plot
+        from gui.graph_view import ExitGraph
+        graph = ExitGraph(automaton)
+        graph.mainloop()
+
+
+def replay(path, output=GUI_OUTPUT):
+    """ visualizes a recorded trajectory (see --record) without simulating it """
+    automaton = ReplayAutomaton(path)
+    try:
+        show(automaton, os.path.splitext(os.path.basename(path))[0], output)
+    finally:
+        automaton.close()  # the window may be closed before the last generation
+
+
+def scenario(path, output=GUI_OUTPUT):
+    """ visualizes an evacuation scenario file or floor plan image (see the scenario module) """
+    automaton = build_automaton(load_scenario(path))
+    cell_size = max(1, min(ROW_SIZE, MAX_VIEW_SIZE // max(automaton.get_height(), automaton.get_width())))
+    show(automaton, os.path.splitext(os.path.basename(path))[0], output, cell_size)
+
+
+def q2_0(output=GUI_OUTPUT):
     """ visualizes an automaton with a 50x50 grid and roughly 50 people"""
     rows = 50
     cols = 50
     exits = [(0, 0), (49, 49)]
     # initialize the automaton
     automaton = EmergencyEscapeAutomaton(rows, cols, exits, ppl_interval=5)
-    # create the visualization grid
-    gui = SquareGridView(rows, cols, ROW_SIZE, COL_SIZE,
-                         automaton.get_num_of_states(), automaton, TICK_TIME)
-    gui.mainloop()
-
-    # show statistics and graph plot
-    graph = ExitGraph(automaton)
-    graph.mainloop()
+    show(automaton, "q2_0", output)
 
 
-def q2_1():
+def q2_1(output=GUI_OUTPUT):
     """ visualizes an automaton with a 50x50 grid and roughly 150 people"""
     rows = 50
     cols = 50
     exits = [(0, 0), (49, 49)]
     # initialize the automaton
     automaton = EmergencyEscapeAutomaton(rows, cols, exits, ppl_interval=3)
-    # create the visualization grid
-    gui = SquareGridView(rows, cols, ROW_SIZE, COL_SIZE,
-                         automaton.get_num_of_states(), automaton, TICK_TIME)
-    gui.mainloop()
+    show(automaton, "q2_1", output)
 
-    # show statistics and graph plot
-    graph = ExitGraph(automaton)
-    graph.mainloop()
 
-
-def q2_2():
+def q2_2(output=GUI_OUTPUT):
     """ visualizes an automaton with a 25x25 grid and roughly 50 people"""
     rows = 25
     cols = 25
     exits = [(0, 0), (24, 24)]
     # initialize the automaton
     automaton = EmergencyEscapeAutomaton(rows, cols, exits, ppl_interval=3)
-    # create the visualization grid
-    gui = SquareGridView(rows, cols, ROW_SIZE, COL_SIZE,
-                         automaton.get_num_of_states(), automaton, TICK_TIME)
-    gui.mainloop()
-
-    # show statistics and graph plot
-    graph = ExitGraph(automaton)
-    graph.mainloop()
+    show(automaton, "q2_2", output)
 
 
-def q2_3():
+def q2_3(output=GUI_OUTPUT):
     """ visualizes an automaton with a 25x25 grid and roughly 150 people"""
     rows = 25
     cols = 25
     exits = [(0, 0), (24, 24)]
     # initialize the automaton
     automaton = EmergencyEscapeAutomaton(rows, cols, exits, ppl_interval=2)
-    # create the visualization grid
-    gui = SquareGridView(rows, cols, ROW_SIZE, COL_SIZE,
-                         automaton.get_num_of_states(), automaton, TICK_TIME)
-    gui.mainloop()
-
-    # show statistics and graph plot
-    graph = ExitGraph(automaton)
-    graph.mainloop()
+    show(automaton, "q2_3", output)
 
 
-def q2():
+def q2(output=GUI_OUTPUT):
     """ runs the demonstrations as defined in mmn11 question 2"""
-    q2_0()
-    q2_1()
-    q2_2()
-    q2_3()
+    q2_0(output)
+    q2_1(output)
+    q2_2(output)
+    q2_3(output)
 
 
-def run_stats_demo():
+def run_stats_demo(workers=None):
     """ generate some intertesting statistics - run without a GUI """
-    demo_choice_bias()  # slight bias toward lower y,x exits on grid....
-    demo_dist_modifier()
-    demo_crowd_modifier()
-    demo_exit_radius()
+    demo_choice_bias(workers)  # slight bias toward lower y,x exits on grid....
+    demo_dist_modifier(workers)
+    demo_crowd_modifier(workers)
+    demo_exit_radius(workers)
+    demo_array_engine()
 
 
 if __name__ == '__main__':
-    if sys.argv[1] == "q2":
-        q2()
-    elif sys.argv[1] == "stats":
-        run_stats_demo()
-    else:
-        print(" no such command ")
+    parser = argparse.ArgumentParser(description="Portable 2d cellular automata simulation")
+    parser.add_argument("command", choices=["q2", "stats", "replay", "export", "bench", "scenario"],
+                        help="q2: GUI showcase, stats: statistics (no GUI), replay: show a recorded trajectory, "
+                             "export: run the q2 showcase headless and write images (no GUI), "
+                             "bench: benchmark the automata engines, "
+                             "scenario: show a scenario file or floor plan image")
+    parser.add_argument("path", nargs="?",
+                        help="replay: trajectory file, export: output directory, bench: json results file, "
+                             "scenario: scenario file (.scn, .ppm or .pgm)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes for stats runs (default: one per core)")
+    parser.add_argument("--record", metavar="DIR", default=None,
+                        help="q2/export/scenario: record a trajectory file of each run into a directory")
+    parser.add_argument("--every", type=int, default=1, help="export an image of every N generations")
+    parser.add_argument("--profile", action="store_true",
+                        help="q2/export/replay/scenario: print how long each phase of a generation transition takes")
+    parser.add_argument("--profile-stream", metavar="FILE", default=None,
+                        help="q2/export/replay/scenario: write the phase times of every generation to a file "
+                             "(json lines)")
+    parser.add_argument("--quick", action="store_true", help="bench: fewer and smaller cases")
+    parser.add_argument("--compare", metavar="FILE", default=None,
+                        help="bench: compare the results with an earlier json results file")
+    args = parser.parse_args()
+    profile_stream = open(args.profile_stream, "w") if args.profile_stream is not None else None
+    try:
+        if args.command == "q2":
+            q2(Output(args.record, None, 1, args.profile, profile_stream))
+        elif args.command == "stats":
+            run_stats_demo(args.workers)
+        elif args.command == "replay":
+            if args.path is None:
+                parser.error("replay requires a trajectory file path")
+            replay(args.path, Output(None, None, 1, args.profile, profile_stream))
+        elif args.command == "export":
+            if args.path is None:
+                parser.error("export requires an output directory")
+            q2(Output(args.record, args.path, args.every, args.profile, profile_stream))
+        elif args.command == "scenario":
+            if args.path is None:
+                parser.error("scenario requires a scenario file path")
+            scenario(args.path, Output(args.record, None, 1, args.profile, profile_stream))
+        elif args.command == "bench":
+            output_path = args.path if args.path is not None else "benchmark_results.json"
+            run_benchmarks(output_path, args.quick)
+            if args.compare is not None:
+                compare_results(args.compare, output_path)
+    finally:
+        if profile_stream is not None:
+            profile_stream.close()  # flushed even when a command fails
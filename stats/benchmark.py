@@ -0,0 +1,163 @@
+"""
+module for benchmarking the automata engines - run time, throughput, memory and time to evacuation.
+Each case is run with a fixed seed (the same work on every commit), results are written as json so runs of different
+commits can be compared (see compare_results).
+"""
+
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+from collections import namedtuple
+from automata.mmn11_automata import EmergencyEscapeAutomaton, ArrayEmergencyEscapeAutomaton
+from automata.simple_automata import RandomWalkAutomaton, FoodHierarchyAutomaton
+from automata.tiled import TiledEmergencyEscapeAutomaton, TiledRandomWalkAutomaton
+
+# a single benchmark case - kwargs are passed to the automaton, max_generations limits automata which never terminate
+BenchmarkCase = namedtuple("BenchmarkCase", ["name", "automaton_cls", "kwargs", "max_generations"])
+
+BENCHMARK_SEED = 2017
+DEFAULT_REPEATS = 3
+TILE_SIZE = 64
+
+
+def _evacuation_case(automaton_cls, size, ppl_interval=3, num_of_exits=2, exit_rad=3, workers=None):
+    """ returns an evacuation benchmark case - exits are spread along the grid border, workers for tiled engines """
+    last = size - 1
+    border = [(0, 0), (last, last), (0, last), (last, 0), (0, last // 2), (last, last // 2), (last // 2, 0),
+              (last // 2, last)]
+    kwargs = {"height": size, "width": size, "exits": border[:num_of_exits], "ppl_interval": ppl_interval,
+              "exit_rad": exit_rad}
+    name = "%s size=%s ppl_interval=%s exits=%s exit_rad=%s" % (automaton_cls.__name__, size, ppl_interval,
+                                                                num_of_exits, exit_rad)
+    if workers is not None:
+        kwargs.update(tile_size=TILE_SIZE, workers=workers)
+        name += " workers=%s" % workers
+    return BenchmarkCase(name, automaton_cls, kwargs, None)
+
+
+def _scaling_workers():
+    """ returns the worker counts of the tiled engine cases - a single worker and every core (at least 2) """
+    return 1, max(2, os.cpu_count() or 1)
+
+
+def benchmark_cases(quick=False):
+    """
+        Returns the list of benchmark cases - each parameter is swept on its own around a baseline
+        (grid size, people density, number of exits, exit radius) for both evacuation engines, plus the simple automata
+        and the tiled engines with 1 and N worker processes (their scaling)
+        :param quick: a smaller set of cases with smaller grids (a smoke run)
+    """
+    sizes = (25, 50) if quick else (50, 100, 200)
+    base_size = sizes[-1] if quick else 100
+    cases = []
+    for automaton_cls in (EmergencyEscapeAutomaton, ArrayEmergencyEscapeAutomaton):
+        cases.extend(_evacuation_case(automaton_cls, size) for size in sizes)
+        cases.extend(_evacuation_case(automaton_cls, base_size, ppl_interval=ppl_interval) for ppl_interval in (2, 5))
+        cases.extend(_evacuation_case(automaton_cls, base_size, num_of_exits=num_of_exits) for num_of_exits in (4, 8))
+        cases.extend(_evacuation_case(automaton_cls, base_size, exit_rad=exit_rad) for exit_rad in (1, 10))
+    generations = 10 if quick else 50
+    for automaton_cls in (RandomWalkAutomaton, FoodHierarchyAutomaton):
+        for size in sizes:
+            cases.append(BenchmarkCase("%s size=%s" % (automaton_cls.__name__, size), automaton_cls,
+                                       {"height": size, "width": size}, generations))
+    walk_size = sizes[-1] * 2
+    for workers in _scaling_workers():
+        cases.append(_evacuation_case(TiledEmergencyEscapeAutomaton, sizes[-1], workers=workers))
+        cases.append(BenchmarkCase("%s size=%s workers=%s" % (TiledRandomWalkAutomaton.__name__, walk_size, workers),
+                                   TiledRandomWalkAutomaton, {"height": walk_size, "width": walk_size,
+                                                              "tile_size": TILE_SIZE, "workers": workers},
+                                   generations))
+    return cases
+
+
+def run_case(case, repeats=DEFAULT_REPEATS, memory=True):
+    """
+        Runs a benchmark case and returns a dict of its results - times are the best of `repeats` runs
+        :param case: a BenchmarkCase
+        :param repeats: number of timed runs
+        :param memory: also measure the peak memory (an extra run under tracemalloc - not timed)
+    """
+    best_seconds = None
+    automaton = None
+    for _ in range(0, repeats):
+        start_time = time.perf_counter()
+        automaton = case.automaton_cls(**case.kwargs, rng_seed=BENCHMARK_SEED).run(max_generations=case.max_generations)
+        seconds = time.perf_counter() - start_time
+        best_seconds = seconds if best_seconds is None else min(best_seconds, seconds)
+
+    peak_memory = None
+    if memory:
+        tracemalloc.start()
+        case.automaton_cls(**case.kwargs, rng_seed=BENCHMARK_SEED).run(max_generations=case.max_generations)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    generations = automaton.get_gen_count()
+    cells = automaton.get_height() * automaton.get_width()
+    return {"name": case.name, "automaton": case.automaton_cls.__name__,
+            "params": {key: value for key, value in case.kwargs.items() if key != "exits"},
+            "num_of_exits": len(case.kwargs.get("exits", ())), "generations": generations,
+            "seconds": best_seconds, "gens_per_sec": generations / best_seconds,
+            "cell_updates_per_sec": generations * cells / best_seconds, "peak_memory_bytes": peak_memory,
+            "evacuated": automaton.is_terminal(),  # time to evacuation is `seconds` when True
+            "repeats": repeats}
+
+
+def _git_commit():
+    """ returns the current git commit hash of the project, or None outside a git checkout """
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(output_path=None, quick=False, repeats=DEFAULT_REPEATS, memory=True, progress=True):
+    """
+        Runs every benchmark case, optionally writes the results to a json file and returns them
+        :param output_path: json file path, None doesn't write a file
+        :param quick: see benchmark_cases
+        :param repeats: see run_case
+        :param memory: see run_case
+        :param progress: print a line per case
+    """
+    results = {"meta": {"commit": _git_commit(), "python": platform.python_version(),
+                        "implementation": platform.python_implementation(), "platform": platform.platform(),
+                        "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "seed": BENCHMARK_SEED, "quick": quick},
+               "results": []}
+    for case in benchmark_cases(quick):
+        result = run_case(case, repeats, memory)
+        results["results"].append(result)
+        if progress:
+            print("%-72s gens: %6s  sec: %8.3f  gens/sec: %9.1f  cell updates/sec: %12.0f  peak mem (KiB): %s" % (
+                result["name"], result["generations"], result["seconds"], result["gens_per_sec"],
+                result["cell_updates_per_sec"],
+                "-" if result["peak_memory_bytes"] is None else result["peak_memory_bytes"] // 1024))
+    if output_path is not None:
+        with open(output_path, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+    return results
+
+
+def compare_results(old_path, new_path, threshold=0.1):
+    """
+        Prints the run time change of every case found in two benchmark result files and returns a list of the
+        names of the cases which got slower by more than threshold (a fraction - 0.1 is 10%)
+    """
+    with open(old_path) as old_file, open(new_path) as new_file:
+        old_results = {result["name"]: result for result in json.load(old_file)["results"]}
+        new_results = json.load(new_file)["results"]
+    regressions = []
+    for result in new_results:
+        old_result = old_results.get(result["name"])
+        if old_result is None:
+            continue
+        change = result["seconds"] / old_result["seconds"] - 1
+        if change > threshold:
+            regressions.append(result["name"])
+        print("%-72s %8.3f -> %8.3f sec  (%+.1f%%)%s" % (result["name"], old_result["seconds"], result["seconds"],
+                                                           100 * change, "  SLOWER" if change > threshold else ""))
+    return regressions
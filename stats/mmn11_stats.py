@@ -1,40 +1,45 @@
 """ module for executing multiple simulation runs and generating some interesting statistics """
 
+import time
 from automata.mmn11_automata import *  # import crowd simulation automaton
+from stats.sweep import param_grid, params_key, run_sweep, run_shared_sweep  # runs the simulation runs in parallel
 
 
-def demo_choice_bias():
+def print_gen_count_summary(results, params, name, label):
+    """ prints the mean (with a 95% confidence interval) and the median of the escape generation count of a sweep """
+    summary = results.summarize_gen_count(params)
+    print(label, ": ", params[name], " avg esc generations: ", round(summary.mean, 2),
+          " (95% ci: ", round(summary.ci_low, 2), "-", round(summary.ci_high, 2), ") median: ",
+          summary.quantiles[0.5])
+
+
+def demo_choice_bias(workers=None):
     """ demonstrate bias caused by sequential execution of automaton - exits with lower y/x more likely to be chosen """
     rows = 50
     cols = 50
     exits = [(5, 5), (49, 49)]
     runs = 25
 
-    exit_esc_total = {exit_pos: 0 for exit_pos in exits}
-
     print("\n\nGENERATING CHOICE BIAS STATISTICS..............")
     print("Grid height: ", rows, " Grid width: ", cols)
     print("Number of runs: ", runs)
 
-    for i in range(0, runs):    # runs many times
-        automaton = EmergencyEscapeAutomaton(rows, cols, exits)
-        while not automaton.is_terminal():
-            automaton.update_world_state()
-        for exit_pos in exits:  # collect stats from each run
-            esc_count = sum(
-                automaton.get_exit_esc_count()[exit_pos][g] for g in automaton.get_exit_esc_count()[exit_pos])
-            exit_esc_total[exit_pos] += esc_count
+    # a single parameter combination - runs many times
+    aggregate = run_sweep(ArrayEmergencyEscapeAutomaton, [{}], runs, workers,
+                          height=rows, width=cols, exits=exits)
+    exit_esc_total = aggregate.escaped_at_exit[params_key({})]
+    exit_esc_avg = aggregate.avg_escaped_at_exit({})
 
     print("Escaped at each exit: ")
     for exit_pos in exits:
-        print("  exit: " + str(exit_pos) + " escaped total: " + str(exit_esc_total[exit_pos]))
+        print("  exit: " + str(exit_pos) + " escaped total: " + str(exit_esc_total.get(exit_pos, 0)))
 
     print("Escaped average at each exit: ")
     for exit_pos in exits:
-        print("  exit: " + str(exit_pos) + " escaped average: " + str(exit_esc_total[exit_pos] / runs))
+        print("  exit: " + str(exit_pos) + " escaped average: " + str(exit_esc_avg.get(exit_pos, 0)))
 
 
-def demo_dist_modifier():
+def demo_dist_modifier(workers=None):
     """ demonstrate distance utility function modifier effect on escape generation count """
     rows = 50
     cols = 50
@@ -46,24 +51,19 @@ def demo_dist_modifier():
 
     runs = 25
 
-    modifier_esc_time = {modifier: 0 for modifier in range(min_dist_modifier, max_dist_modifier)}
-
     print("\n\nGENERATING DISTANCE MODIFIER STATISTICS..............")
     print("Grid height: ", rows, " Grid width: ", cols)
     print("Number of runs: ", runs)
 
-    for i in range(0, runs):
-        for d in range(min_dist_modifier, max_dist_modifier):
-            automaton = EmergencyEscapeAutomaton(rows, cols, exits, dist_mod=d, evenly_dist=False)
-            while not automaton.is_terminal():
-                automaton.update_world_state()
-            modifier_esc_time[d] += automaton.get_gen_count()
+    params_list = param_grid(dist_mod=range(min_dist_modifier, max_dist_modifier))
+    results = run_shared_sweep(ArrayEmergencyEscapeAutomaton, params_list, runs, workers=workers,
+                               height=rows, width=cols, exits=exits, evenly_dist=False)
 
-    for d in modifier_esc_time:
-        print("distance modifier: ", d, " avg esc generations: ", modifier_esc_time[d] / runs)
+    for params in params_list:
+        print_gen_count_summary(results, params, "dist_mod", "distance modifier")
 
 
-def demo_crowd_modifier():
+def demo_crowd_modifier(workers=None):
     """ demonstrate crowd utility function modifier effect on escape generation count """
     rows = 50
     cols = 50
@@ -75,24 +75,19 @@ def demo_crowd_modifier():
 
     runs = 25
 
-    modifier_esc_time = {modifier: 0 for modifier in range(min_crowd_modifier, max_crowd_modifier)}
-
     print("\n\nGENERATING CROWD MODIFIER STATISTICS..............")
     print("Grid height: ", rows, " Grid width: ", cols)
     print("Number of runs: ", runs)
 
-    for i in range(0, runs):
-        for c in range(min_crowd_modifier, max_crowd_modifier):
-            automaton = EmergencyEscapeAutomaton(rows, cols, exits, crowd_mod=c, evenly_dist=False)
-            while not automaton.is_terminal():
-                automaton.update_world_state()
-            modifier_esc_time[c] += automaton.get_gen_count()
+    params_list = param_grid(crowd_mod=range(min_crowd_modifier, max_crowd_modifier))
+    results = run_shared_sweep(ArrayEmergencyEscapeAutomaton, params_list, runs, workers=workers,
+                               height=rows, width=cols, exits=exits, evenly_dist=False)
 
-    for c in modifier_esc_time:
-        print("crowd modifier: ", c, " avg esc generations: ", modifier_esc_time[c] / runs)
+    for params in params_list:
+        print_gen_count_summary(results, params, "crowd_mod", "crowd modifier")
 
 
-def demo_exit_radius():
+def demo_exit_radius(workers=None):
     """ demonstrate exit area radius effect on escape generation count """
     rows = 50
     cols = 50
@@ -105,21 +100,43 @@ def demo_exit_radius():
 
     runs = 25
 
-    modifier_esc_time = {modifier: 0 for modifier in range(min_exit_radius, max_exit_radius, radius_iter_jump)}
-
     print("\n\nGENERATING EXIT RADIUS STATISTICS..............")
     print("Grid height: ", rows, " Grid width: ", cols)
     print("Number of runs: ", runs)
 
-    for i in range(0, runs):
-        for r in range(min_exit_radius, max_exit_radius, radius_iter_jump):
-            automaton = EmergencyEscapeAutomaton(rows, cols, exits, exit_rad=r, evenly_dist=False)
-            while not automaton.is_terminal():
-                automaton.update_world_state()
-            modifier_esc_time[r] += automaton.get_gen_count()
+    params_list = param_grid(exit_rad=range(min_exit_radius, max_exit_radius, radius_iter_jump))
+    results = run_shared_sweep(ArrayEmergencyEscapeAutomaton, params_list, runs, workers=workers,
+                               height=rows, width=cols, exits=exits, evenly_dist=False)
+
+    for params in params_list:
+        print_gen_count_summary(results, params, "exit_rad", "exit radius")
+
+
+def demo_array_engine():
+    """ compare the list engine with the flat array engine - same random seed must give the same statistics """
+    rows = 150
+    cols = 150
+    exits = [(0, 0), (149, 149)]
+    seed = 11
+
+    print("\n\nCOMPARING LIST ENGINE AND ARRAY ENGINE..............")
+    print("Grid height: ", rows, " Grid width: ", cols)
 
-    for r in modifier_esc_time:
-        print("exit radius: ", r, " avg esc generations: ", modifier_esc_time[r] / runs)
+    run_times = {}
+    automatons = {}
+    for automaton_cls in (EmergencyEscapeAutomaton, ArrayEmergencyEscapeAutomaton):
+        start_time = time.perf_counter()
+        automaton = automaton_cls(rows, cols, exits, rng_seed=seed).run()  # both engines make the same random draws
+        run_times[automaton_cls] = time.perf_counter() - start_time
+        automatons[automaton_cls] = automaton
+        print(automaton_cls.__name__, " generations: ", automaton.get_gen_count(),
+              " run time (sec): ", round(run_times[automaton_cls], 3))
+
+    list_automaton, array_automaton = automatons[EmergencyEscapeAutomaton], automatons[ArrayEmergencyEscapeAutomaton]
+    same_stats = (list_automaton.get_gen_state_count() == array_automaton.get_gen_state_count() and
+                  list_automaton.get_exit_esc_count() == array_automaton.get_exit_esc_count())
+    print("same statistics: ", same_stats)
+    print("speedup: ", round(run_times[EmergencyEscapeAutomaton] / run_times[ArrayEmergencyEscapeAutomaton], 1), "x")
 
 
 def demo_people_density():
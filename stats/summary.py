@@ -0,0 +1,38 @@
+""" module for summary statistics of simulation runs - means, quantiles and confidence intervals """
+
+import math
+from collections import namedtuple
+
+Z_95 = 1.959964  # normal quantile of a two sided 95% confidence interval
+DEFAULT_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+# summary of a sample - ci_low/ci_high bound the mean (normal approximation), quantiles is a dict of q:value
+Summary = namedtuple("Summary", ["count", "mean", "std", "ci_low", "ci_high", "quantiles"])
+
+
+def quantile(sorted_values, q):
+    """ returns the q quantile (0 <= q <= 1) of a sorted sequence - linear interpolation between the closest ranks """
+    if not sorted_values:
+        raise ValueError("quantile of an empty sample")
+    position = q * (len(sorted_values) - 1)
+    low = int(position)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low)
+
+
+def summarize(values, quantiles=DEFAULT_QUANTILES, z=Z_95):
+    """
+        Returns a Summary of a sample
+        :param values: iterable of numbers
+        :param quantiles: the quantiles to compute
+        :param z: normal quantile of the confidence interval of the mean (the default is 95%)
+    """
+    values = sorted(values)
+    count = len(values)
+    if count == 0:
+        raise ValueError("summary of an empty sample")
+    mean = math.fsum(values) / count
+    std = math.sqrt(math.fsum((value - mean) ** 2 for value in values) / (count - 1)) if count > 1 else 0.0
+    half_width = z * std / math.sqrt(count)
+    return Summary(count, mean, std, mean - half_width, mean + half_width,
+                   {q: quantile(values, q) for q in quantiles})
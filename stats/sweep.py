@@ -0,0 +1,270 @@
+"""
+    module for running parameter sweeps of automaton simulations on a pool of worker processes.
+    sweep/run_sweep send a small RunResult of every run back to the parent. For large sweeps run_shared_sweep has the
+    workers write each run straight into a shared memory SweepResults array with a fixed schema (nothing is sent back
+    but the run's index), the parent computes summary statistics from the array (see the summary module).
+"""
+
+import array
+import itertools
+import os
+from collections import namedtuple
+from multiprocessing import Pool
+from multiprocessing.sharedctypes import RawArray
+from automata.base_automata import derive_seed
+from stats.summary import summarize, DEFAULT_QUANTILES, Z_95
+
+# the outcome of a single simulation run - small, so it's cheap to send back from a worker process
+RunResult = namedtuple("RunResult", ["params", "run", "seed", "gen_count", "people_at_seed", "escaped_at_exit"])
+
+# SweepResults row schema - the header columns, then the escaped count of each exit, then the escape curve
+RESULT_TYPECODE = "q"  # 8 byte signed integers (int64)
+COL_FINISHED = 0  # 1 once the run's row is written
+COL_GEN_COUNT = 1
+COL_PEOPLE_AT_SEED = 2
+HEADER_COLS = 3
+
+_worker_run = {}  # SweepResults and automaton of a run_shared_sweep worker process - set by _init_shared_worker
+
+
+def param_grid(**param_values):
+    """ returns a list of automaton keyword argument dicts - one for each combination of the given parameter values """
+    names = sorted(param_values)
+    return [dict(zip(names, values)) for values in itertools.product(*(param_values[name] for name in names))]
+
+
+def params_key(params):
+    """ returns a hashable key of a parameter dict """
+    return tuple(sorted(params.items()))
+
+
+def run_seed(base_seed, params, run):
+    """ returns a deterministic seed for a single run - independent of the worker and of the order runs finish in """
+    return derive_seed(base_seed, params_key(params), run)
+
+
+def run_to_end(automaton_cls, automaton_kwargs, params, run, seed):
+    """ runs a single simulation until it terminates and returns its RunResult """
+    # IMPORTANT! each run is seeded - the same sweep seed reproduces the same results
+    automaton = automaton_cls(**automaton_kwargs, **params, rng_seed=seed).run()
+    escaped_at_exit = {exit_pos: automaton.get_exit_esc_total(exit_pos) for exit_pos in automaton.exits}
+    return RunResult(params, run, seed, automaton.get_gen_count(), automaton.get_num_of_people_at_seed(),
+                     escaped_at_exit)
+
+
+def _run_task(task):
+    """ worker process entry point - unpacks a task tuple """
+    return run_to_end(*task)
+
+
+class SweepAggregate:
+    """ running totals of a sweep - per parameter combination, updated as runs finish """
+
+    def __init__(self, params_list, runs):
+        self.total_runs = len(params_list) * runs
+        self.finished_runs = 0
+        self.runs = {params_key(params): 0 for params in params_list}
+        self.gen_count = {params_key(params): 0 for params in params_list}
+        self.escaped_at_exit = {params_key(params): {} for params in params_list}
+
+    def add(self, result):
+        """ adds a finished run to the totals """
+        key = params_key(result.params)
+        self.finished_runs += 1
+        self.runs[key] += 1
+        self.gen_count[key] += result.gen_count
+        for exit_pos, esc_count in result.escaped_at_exit.items():
+            self.escaped_at_exit[key][exit_pos] = self.escaped_at_exit[key].get(exit_pos, 0) + esc_count
+
+    def avg_gen_count(self, params):
+        """ returns the average number of generations until termination for a parameter combination """
+        key = params_key(params)
+        return self.gen_count[key] / self.runs[key] if self.runs[key] else 0
+
+    def avg_escaped_at_exit(self, params):
+        """ returns a dict of exit:average number of people escaped at it for a parameter combination """
+        key = params_key(params)
+        return {exit_pos: esc_count / self.runs[key] for exit_pos, esc_count in self.escaped_at_exit[key].items()}
+
+
+def sweep(automaton_cls, params_list, runs, workers=None, seed=0, **automaton_kwargs):
+    """
+        Runs each parameter combination `runs` times and yields (RunResult, SweepAggregate) as runs finish.
+        :param automaton_cls: the automaton class to run - must be importable by worker processes
+        :param params_list: list of keyword argument dicts - the swept parameters (see param_grid)
+        :param runs: number of runs (replicates) for each parameter combination
+        :param workers: number of worker processes, None uses all cores, 1 runs in the calling process
+        :param seed: sweep seed - every run gets its own seed derived from it
+        :param automaton_kwargs: keyword arguments shared by all runs (e.g height, width, exits)
+    """
+    tasks = [(automaton_cls, automaton_kwargs, params, run, run_seed(seed, params, run))
+             for run in range(0, runs) for params in params_list]
+    aggregate = SweepAggregate(params_list, runs)
+    if workers == 1:
+        for task in tasks:
+            result = _run_task(task)
+            aggregate.add(result)
+            yield result, aggregate
+    else:
+        with Pool(workers) as pool:
+            for result in pool.imap_unordered(_run_task, tasks):  # results arrive in the order runs finish
+                aggregate.add(result)
+                yield result, aggregate
+
+
+def run_sweep(automaton_cls, params_list, runs, workers=None, seed=0, progress=True, **automaton_kwargs):
+    """ runs a whole sweep (see sweep) and returns the final SweepAggregate - optionally prints progress """
+    aggregate = SweepAggregate(params_list, runs)
+    for result, aggregate in sweep(automaton_cls, params_list, runs, workers, seed, **automaton_kwargs):
+        if progress:
+            print("\rruns finished: %s/%s" % (aggregate.finished_runs, aggregate.total_runs), end="", flush=True)
+    if progress:
+        print()
+    return aggregate
+
+
+def _num_of_exits(params_list, automaton_kwargs):
+    """ returns the number of exits of the automata of a sweep - the most of any parameter combination """
+    return max(len(params.get("exits", automaton_kwargs.get("exits", ()))) for params in params_list)
+
+
+class SweepResults:
+    """
+        Run results of a sweep in a shared memory array (multiprocessing RawArray) with a fixed schema - a row per run:
+            COL_FINISHED, COL_GEN_COUNT, COL_PEOPLE_AT_SEED, escaped at each exit (num_of_exits columns),
+            escape curve (curve_length columns - cumulative number of escaped people at generations 0..curve_length - 1,
+            padded with the run's total after it ended - compare COL_GEN_COUNT to find truncated curves)
+        Rows are in task order - run by run, each run over params_list (see get_row_index).
+    """
+
+    def __init__(self, params_list, runs, num_of_exits, curve_length=0, buffer=None):
+        """
+            :param params_list: list of keyword argument dicts - the swept parameters
+            :param runs: number of runs for each parameter combination
+            :param num_of_exits: number of escaped at exit columns
+            :param curve_length: number of escape curve columns (generations) - 0 doesn't keep the curves
+            :param buffer: an existing shared array of the schema (a worker process attaching to the results)
+        """
+        self.params_list = params_list
+        self.runs = runs
+        self.num_of_exits = num_of_exits
+        self.curve_length = curve_length
+        self.row_size = HEADER_COLS + num_of_exits + curve_length
+        self.num_of_rows = len(params_list) * runs
+        self.buffer = buffer if buffer is not None else RawArray(RESULT_TYPECODE, self.num_of_rows * self.row_size)
+        self.values = memoryview(self.buffer).cast("B").cast(RESULT_TYPECODE)
+        self.params_index = {params_key(params): i for i, params in enumerate(params_list)}
+
+    def get_row_index(self, params, run):
+        """ returns the row index of a run of a parameter combination """
+        return run * len(self.params_list) + self.params_index[params_key(params)]
+
+    def write(self, row, gen_count, people_at_seed, escaped_at_exit, curve=()):
+        """
+            Writes the row of a finished run - a single buffer copy
+            :param escaped_at_exit: sequence of the number of people escaped at each exit
+            :param curve: sequence of the cumulative number of escaped people at each generation of the run
+        """
+        curve = list(curve[:self.curve_length])
+        curve += [curve[-1] if curve else 0] * (self.curve_length - len(curve))
+        escaped_at_exit = list(escaped_at_exit) + [0] * (self.num_of_exits - len(escaped_at_exit))
+        start = row * self.row_size
+        self.values[start:start + self.row_size] = array.array(
+            RESULT_TYPECODE, [1, gen_count, people_at_seed] + escaped_at_exit + curve)
+
+    def __iter_rows__(self, params):
+        """ yields the start offset of the row of every finished run of a parameter combination """
+        for run in range(0, self.runs):
+            start = self.get_row_index(params, run) * self.row_size
+            if self.values[start + COL_FINISHED]:
+                yield start
+
+    def get_column(self, params, col):
+        """ returns a list of a column's value in every finished run of a parameter combination """
+        values = self.values
+        return [values[start + col] for start in self.__iter_rows__(params)]
+
+    def get_gen_counts(self, params):
+        return self.get_column(params, COL_GEN_COUNT)
+
+    def get_escaped_at_exit(self, params, exit_idx):
+        """ returns a list of the number of people escaped at an exit (by index) in every finished run """
+        return self.get_column(params, HEADER_COLS + exit_idx)
+
+    def get_curves(self, params):
+        """ returns a list of the escape curves (lists) of every finished run of a parameter combination """
+        curve_start = HEADER_COLS + self.num_of_exits
+        return [self.values[start + curve_start:start + self.row_size].tolist() for start in self.__iter_rows__(params)]
+
+    def summarize_gen_count(self, params, quantiles=DEFAULT_QUANTILES, z=Z_95):
+        """ returns a Summary of the number of generations until termination of a parameter combination """
+        return summarize(self.get_gen_counts(params), quantiles, z)
+
+    def summarize_escaped_at_exit(self, params, exit_idx, quantiles=DEFAULT_QUANTILES, z=Z_95):
+        """ returns a Summary of the number of people escaped at an exit (by index) of a parameter combination """
+        return summarize(self.get_escaped_at_exit(params, exit_idx), quantiles, z)
+
+    def summarize_curve(self, params, quantiles=DEFAULT_QUANTILES, z=Z_95):
+        """ returns a list of the Summary of the cumulative number of escaped people at each curve generation """
+        return [summarize(values, quantiles, z) for values in zip(*self.get_curves(params))]
+
+    def view(self):
+        """ zero copy (rows x row size) view of the whole array, e.g numpy.asarray(results.view()) """
+        return self.values.cast("B").cast(RESULT_TYPECODE, [self.num_of_rows, self.row_size])
+
+
+def _init_shared_worker(buffer, params_list, runs, num_of_exits, curve_length, automaton_cls, automaton_kwargs):
+    """ worker process initializer - attaches to the shared results and keeps the automaton of the sweep """
+    _worker_run["results"] = SweepResults(params_list, runs, num_of_exits, curve_length, buffer)
+    _worker_run["automaton"] = (automaton_cls, automaton_kwargs)
+
+
+def _run_shared_task(task):
+    """ worker process entry point - runs a simulation to its end and writes its row, returns only the row index """
+    row, params, seed = task
+    results = _worker_run["results"]
+    automaton_cls, automaton_kwargs = _worker_run["automaton"]
+    automaton = automaton_cls(**automaton_kwargs, **params, rng_seed=seed).run()
+    people_at_seed = automaton.get_num_of_people_at_seed()
+    curve = ()
+    if results.curve_length:
+        curve = [people_at_seed - people
+                 for people in automaton.get_stats().get_state_column(automaton.STATE_PERSON)[:results.curve_length]]
+    results.write(row, automaton.get_gen_count(), people_at_seed,
+                  [automaton.get_exit_esc_total(exit_pos) for exit_pos in automaton.exits], curve)
+    return row
+
+
+def run_shared_sweep(automaton_cls, params_list, runs, curve_length=0, workers=None, seed=0, progress=True,
+                     **automaton_kwargs):
+    """
+        Runs each parameter combination `runs` times and returns a SweepResults of all runs - workers write the results
+        into shared memory, so there's no per run serialization. Runs are seeded as in sweep (same seeds, same results).
+        :param curve_length: number of generations of the escape curve kept for each run - 0 doesn't keep the curves
+        :param progress: print the number of finished runs
+        see sweep for the other parameters
+    """
+    results = SweepResults(params_list, runs, _num_of_exits(params_list, automaton_kwargs), curve_length)
+    tasks = [(results.get_row_index(params, run), params, run_seed(seed, params, run))
+             for run in range(0, runs) for params in params_list]
+    init_args = (results.buffer, params_list, runs, results.num_of_exits, curve_length, automaton_cls, automaton_kwargs)
+    if workers == 1:
+        _init_shared_worker(*init_args)
+        finished = map(_run_shared_task, tasks)
+        pool = None
+    else:
+        workers = workers or os.cpu_count() or 1
+        pool = Pool(workers, _init_shared_worker, init_args)
+        chunk_size = max(1, len(tasks) // (16 * workers))  # a few task batches per worker - fewer messages
+        finished = pool.imap_unordered(_run_shared_task, tasks, chunk_size)
+    try:
+        for finished_runs, _ in enumerate(finished, 1):
+            if progress:
+                print("\rruns finished: %s/%s" % (finished_runs, len(tasks)), end="", flush=True)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    if progress:
+        print()
+    return results
@@ -0,0 +1,22 @@
+""" shared helpers of the test suite - a small seeded floor and a way to run an automaton to its end """
+
+from automata.mmn11_automata import EmergencyEscapeAutomaton
+
+HEIGHT = 30
+WIDTH = 30
+EXITS = [(0, 0), (29, 29)]
+SEED = 11
+
+
+def make_automaton(automaton_cls, seed=SEED, height=HEIGHT, width=WIDTH, **kwargs):
+    """ returns a seeded automaton of the test floor - evacuation automata get the test exits unless given """
+    if issubclass(automaton_cls, EmergencyEscapeAutomaton):
+        kwargs.setdefault("exits", EXITS)
+    return automaton_cls(height, width, rng_seed=seed, **kwargs)
+
+
+def run_to_end(automaton):
+    """ runs an automaton until it terminates and returns its statistics rows, final grid and generation count """
+    automaton.run()
+    assert automaton.is_terminal()
+    return list(automaton.get_stats().iter_rows()), automaton.get_flat_grid(), automaton.get_gen_count()
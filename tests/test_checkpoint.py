@@ -0,0 +1,68 @@
+""" a run resumed from a checkpoint must go on bit identically, and checkpoints of another automaton are rejected """
+
+import pytest
+from automata.checkpoint import CheckpointWriter, load_checkpoint
+from automata.mmn11_automata import EmergencyEscapeAutomaton, ArrayEmergencyEscapeAutomaton
+from automata.tiled import TiledEmergencyEscapeAutomaton
+from tests import HEIGHT, WIDTH, make_automaton, run_to_end
+
+WALLS = bytes(int(not (x == 15 and y < 20)) for y in range(0, HEIGHT) for x in range(0, WIDTH))
+
+
+@pytest.mark.parametrize("automaton_cls", [EmergencyEscapeAutomaton, ArrayEmergencyEscapeAutomaton])
+@pytest.mark.parametrize("generations", [0, 1, 7, 25])
+def test_resume_is_bit_identical(tmp_path, automaton_cls, generations):
+    expected = run_to_end(make_automaton(automaton_cls))
+    path = str(tmp_path / "run.ckpt")
+    make_automaton(automaton_cls).run(max_generations=generations).save_checkpoint(path)
+    assert run_to_end(make_automaton(automaton_cls).restore_checkpoint(path)) == expected
+
+
+def test_resume_with_walls(tmp_path):
+    expected = run_to_end(make_automaton(ArrayEmergencyEscapeAutomaton, passable=WALLS))
+    path = str(tmp_path / "run.ckpt")
+    make_automaton(ArrayEmergencyEscapeAutomaton, passable=WALLS).run(max_generations=10).save_checkpoint(path)
+    restored = make_automaton(ArrayEmergencyEscapeAutomaton, passable=WALLS).restore_checkpoint(path)
+    assert run_to_end(restored) == expected
+
+
+def test_resume_tiled(tmp_path):
+    with make_automaton(TiledEmergencyEscapeAutomaton, tile_size=16, workers=1) as automaton:
+        expected = run_to_end(automaton)
+    path = str(tmp_path / "run.ckpt")
+    with make_automaton(TiledEmergencyEscapeAutomaton, tile_size=16, workers=1) as automaton:
+        automaton.run(max_generations=10).save_checkpoint(path)
+    with make_automaton(TiledEmergencyEscapeAutomaton, tile_size=16, workers=1) as automaton:
+        assert run_to_end(automaton.restore_checkpoint(path)) == expected
+
+
+def test_checkpoint_writer(tmp_path):
+    expected = run_to_end(make_automaton(ArrayEmergencyEscapeAutomaton))
+    path = str(tmp_path / "run.ckpt")
+    writer = CheckpointWriter(path, every=5, on_end=False)
+    make_automaton(ArrayEmergencyEscapeAutomaton).run([writer], max_generations=12)
+    assert writer.written == 2
+    assert load_checkpoint(path)[0]["generation_count"] == 10
+    assert run_to_end(make_automaton(ArrayEmergencyEscapeAutomaton).restore_checkpoint(path)) == expected
+
+
+def test_rejects_another_floor_plan(tmp_path):
+    path = str(tmp_path / "run.ckpt")
+    make_automaton(ArrayEmergencyEscapeAutomaton, passable=WALLS).run(max_generations=3).save_checkpoint(path)
+    other_walls = bytes(int(not (x == 10 and y > 5)) for y in range(0, HEIGHT) for x in range(0, WIDTH))
+    with pytest.raises(ValueError, match="floor field"):
+        make_automaton(ArrayEmergencyEscapeAutomaton, passable=other_walls).restore_checkpoint(path)
+
+
+def test_rejects_another_metric(tmp_path):
+    path = str(tmp_path / "run.ckpt")
+    make_automaton(EmergencyEscapeAutomaton).run(max_generations=3).save_checkpoint(path)
+    with pytest.raises(ValueError, match="floor field"):
+        make_automaton(EmergencyEscapeAutomaton, metric="bfs").restore_checkpoint(path)
+
+
+def test_rejects_another_automaton(tmp_path):
+    path = str(tmp_path / "run.ckpt")
+    make_automaton(EmergencyEscapeAutomaton).run(max_generations=3).save_checkpoint(path)
+    with pytest.raises(ValueError, match="doesn't match"):
+        make_automaton(ArrayEmergencyEscapeAutomaton).restore_checkpoint(path)
@@ -0,0 +1,67 @@
+""" the evacuation engines and crowd modes must give the same runs for the same seed """
+
+import pytest
+from automata.mmn11_automata import EmergencyEscapeAutomaton, ArrayEmergencyEscapeAutomaton, \
+    BatchEmergencyEscapeAutomaton, CROWD_MODES, AGENTS_DENSE, AGENTS_SPARSE, AGENTS_AUTO
+from tests import HEIGHT, WIDTH, make_automaton, run_to_end
+
+EXITS = [(0, 0), (29, 29), (0, 15)]
+WALLS = bytes(int(not (x == 15 and y < 22)) for y in range(0, HEIGHT) for x in range(0, WIDTH))
+
+
+@pytest.fixture(scope="module")
+def reference():
+    return run_to_end(make_automaton(EmergencyEscapeAutomaton, exits=EXITS, crowd_mode="scan"))
+
+
+@pytest.mark.parametrize("crowd_mode", CROWD_MODES)
+def test_list_engine_crowd_modes(reference, crowd_mode):
+    assert run_to_end(make_automaton(EmergencyEscapeAutomaton, exits=EXITS, crowd_mode=crowd_mode)) == reference
+
+
+@pytest.mark.parametrize("crowd_mode", CROWD_MODES)
+@pytest.mark.parametrize("agent_mode", [AGENTS_DENSE, AGENTS_SPARSE, AGENTS_AUTO])
+def test_array_engine(reference, crowd_mode, agent_mode):
+    automaton = make_automaton(ArrayEmergencyEscapeAutomaton, exits=EXITS, crowd_mode=crowd_mode, agent_mode=agent_mode)
+    assert run_to_end(automaton) == reference
+
+
+def test_engines_with_walls():
+    runs = [run_to_end(make_automaton(automaton_cls, exits=EXITS, passable=WALLS, crowd_mode=crowd_mode))
+            for automaton_cls in (EmergencyEscapeAutomaton, ArrayEmergencyEscapeAutomaton)
+            for crowd_mode in CROWD_MODES]
+    assert all(run == runs[0] for run in runs)
+
+
+def test_seed_reproducibility():
+    first = make_automaton(EmergencyEscapeAutomaton)
+    assert first.get_flat_grid() == make_automaton(EmergencyEscapeAutomaton).get_flat_grid()
+    assert first.get_flat_grid() != make_automaton(EmergencyEscapeAutomaton, seed=12).get_flat_grid()
+
+
+@pytest.mark.parametrize("walls", [False, True])
+def test_batch_matches_separate_runs(walls):
+    passable = WALLS if walls else None
+    batch = BatchEmergencyEscapeAutomaton(5, HEIGHT, WIDTH, EXITS, rng_seed=3, passable=passable).run()
+    assert batch.is_terminal() and batch.get_gen_count() == max(batch.get_gen_counts())
+    for i in range(0, batch.get_num_of_replicates()):
+        automaton = make_automaton(ArrayEmergencyEscapeAutomaton, seed=batch.get_replicate_seed(i), exits=EXITS,
+                                   passable=passable)
+        rows, grid, gen_count = run_to_end(automaton)
+        replicate = batch.get_replicate(i)
+        assert list(replicate.get_stats().iter_rows()) == rows
+        assert batch.get_replicate_grid(i) == grid
+        assert replicate.get_gen_count() == gen_count
+
+
+def test_batch_masks_finished_replicates():
+    batch = BatchEmergencyEscapeAutomaton(4, HEIGHT, WIDTH, EXITS, rng_seed=3)
+    while not any(batch.get_terminal_mask()):
+        batch.update_world_state()
+    finished = batch.get_terminal_mask().index(True)
+    grid, gen_count = batch.get_replicate_grid(finished), batch.get_gen_counts()[finished]
+    batch.run()
+    assert batch.get_replicate_grid(finished) == grid  # no longer stepped
+    assert batch.get_gen_counts()[finished] == gen_count
+    assert all(curve[-1] == batch.get_replicate(i).get_num_of_people_at_seed()  # everyone escaped
+               for i, curve in enumerate(batch.get_escape_curves()))
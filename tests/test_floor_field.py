@@ -0,0 +1,27 @@
+""" floor field tables and their in memory cache """
+
+import math
+from automata import floor_field
+from automata.floor_field import FloorField, METRIC_BFS
+
+
+def test_cache_key_normalizes_exits():
+    assert (floor_field._cache_key(5, 5, [[0, 0], [4, 4]], "cheb", None) ==
+            floor_field._cache_key(5, 5, ((0, 0), (4, 4)), "cheb", None))
+
+
+def test_memory_cache_is_bounded():
+    floor_field.clear_memory_cache()
+    for size in range(3, 3 + 2 * floor_field.MAX_FIELDS_IN_MEMORY):
+        FloorField(size, size, [(0, 0)]).get_cell_powers(2)
+    assert len(floor_field._fields_in_memory.items) == floor_field.MAX_FIELDS_IN_MEMORY
+    assert len(floor_field._powers_in_memory.items) == floor_field.MAX_POWERS_IN_MEMORY
+
+
+def test_bfs_goes_around_walls(tmp_path):
+    # a wall in the middle column except the bottom row - the way from the left to the right side goes around it
+    passable = [int(x != 1 or y == 2) for y in range(0, 3) for x in range(0, 3)]
+    field = FloorField(3, 3, [(0, 2)], METRIC_BFS, passable, cache_dir=str(tmp_path))
+    assert field.dist((0, 2), (0, 0)) == 4
+    assert math.isinf(field.dist((0, 2), (0, 1)))
+    assert list(tmp_path.iterdir())  # obstacle aware fields are cached on disk
@@ -0,0 +1,73 @@
+""" headless image export - png encoding, pixel scaling and the export command """
+
+import os
+import struct
+import zlib
+import pytest
+import main
+from automata.mmn11_automata import ArrayEmergencyEscapeAutomaton
+from automata.trajectory import TrajectoryReader
+from gui import pixel_buffer
+from gui.image_export import encode_png, scale_pixels, export_run
+from tests import make_automaton
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def read_png_chunks(data):
+    """ returns a list of (tag, data) of the chunks of png file data - checks the signature and every crc """
+    assert data[:8] == PNG_SIGNATURE
+    chunks, offset = [], 8
+    while offset < len(data):
+        length, = struct.unpack_from(">I", data, offset)
+        tag, chunk = data[offset + 4:offset + 8], data[offset + 8:offset + 8 + length]
+        crc, = struct.unpack_from(">I", data, offset + 8 + length)
+        assert crc == zlib.crc32(tag + chunk) & 0xffffffff
+        chunks.append((tag, chunk))
+        offset += 12 + length
+    return chunks
+
+
+def test_encode_png():
+    grid = bytes([0, 1, 2, 1, 0, 2])  # 3x2 grid of states
+    pixels = pixel_buffer.grid_to_rgb(grid, pixel_buffer.make_state_tables(3))
+    chunks = read_png_chunks(encode_png(pixels, 3, 2))
+    assert [tag for tag, _ in chunks] == [b"IHDR", b"IDAT", b"IEND"]
+    assert struct.unpack(">IIBBBBB", chunks[0][1]) == (3, 2, 8, 2, 0, 0, 0)
+    raw = zlib.decompress(chunks[1][1])
+    assert raw == b"\x00" + bytes(pixels[:9]) + b"\x00" + bytes(pixels[9:])  # filter byte 0 before each row
+
+
+def test_scale_pixels():
+    pixels = bytes(range(0, 12))  # 2x2 rgb pixels
+    scaled = scale_pixels(pixels, 2, 2, 2, 3)
+    row = bytes(range(0, 3)) * 2 + bytes(range(3, 6)) * 2
+    assert scaled == row * 3 + (bytes(range(6, 9)) * 2 + bytes(range(9, 12)) * 2) * 3
+    assert scale_pixels(pixels, 2, 2, 1, 1) == pixels
+
+
+def test_export_run(tmp_path):
+    automaton = export_run(make_automaton(ArrayEmergencyEscapeAutomaton), str(tmp_path), every=10, scale=2)
+    frames = sorted(name for name in os.listdir(str(tmp_path)) if name.startswith("frame_"))
+    assert frames[0] == "frame_000000.png"
+    assert len(frames) == automaton.get_gen_count() // 10 + 1
+    with open(str(tmp_path / frames[0]), "rb") as frame_file:
+        ihdr = read_png_chunks(frame_file.read())[0][1]
+    assert struct.unpack_from(">II", ihdr) == (60, 60)
+    assert (tmp_path / "exit_curves.png").exists()
+
+
+def test_show_closes_the_recording_when_export_fails(tmp_path, monkeypatch):
+    def failing_export(automaton, *args, **kwargs):
+        automaton.run(max_generations=5)
+        raise RuntimeError("export failed")
+
+    monkeypatch.setattr(main, "export_run", failing_export)
+    output = main.Output(str(tmp_path), str(tmp_path), 1, False, None)
+    with pytest.raises(RuntimeError):
+        main.show(make_automaton(ArrayEmergencyEscapeAutomaton), "failed", output)
+    reader = TrajectoryReader(str(tmp_path / "failed.traj"))  # complete - the trailer was written
+    try:
+        assert len(reader) == 6
+    finally:
+        reader.close()
@@ -0,0 +1,58 @@
+""" the flat neighborhood index against the per cell neighbor lists it replaced (get_cells_in_radius) """
+
+import random
+import pytest
+from automata.simple_automata import RandomWalkAutomaton
+
+HEIGHT = 7
+WIDTH = 11  # not square - rows and columns are clipped by different edges
+
+
+def make_floor(radius):
+    """ returns a walk automaton of a non-square floor with a neighborhood index of the given radius """
+    automaton = RandomWalkAutomaton(HEIGHT, WIDTH, rng_seed=5)
+    automaton.radius = radius
+    automaton.__build_neighborhood__()
+    return automaton
+
+
+@pytest.mark.parametrize("pos, size", [((0, 0), 4), ((0, 10), 4), ((6, 0), 4), ((6, 10), 4),  # corners
+                                       ((0, 5), 6), ((6, 5), 6), ((3, 0), 6), ((3, 10), 6),  # edges
+                                       ((3, 5), 9), ((1, 1), 9), ((5, 9), 9)])  # interior
+def test_corner_edge_and_interior_cells(pos, size):
+    automaton = make_floor(1)
+    neighbors = automaton.__get_neighbors_at__(pos)
+    assert len(neighbors) == size
+    # before the first permutation the order is the order of the old lists
+    assert neighbors == automaton.get_cells_in_radius(pos, 1)
+
+
+@pytest.mark.parametrize("radius", [1, 2, 3])
+def test_every_cell_matches_the_dict_neighborhood(radius):
+    automaton = make_floor(radius)
+    for _ in range(0, 3):
+        automaton.__permute_neighborhood__()
+        for y in range(0, HEIGHT):
+            for x in range(0, WIDTH):
+                neighbors = automaton.__get_neighbors_at__((y, x))
+                assert len(neighbors) == len(set(neighbors))
+                assert set(neighbors) == set(automaton.get_cells_in_radius((y, x), radius))
+                assert automaton.__get_flat_neighbors_at__(y * WIDTH + x) == [n_y * WIDTH + n_x
+                                                                             for n_y, n_x in neighbors]
+
+
+def test_permutation_is_shared_by_all_cells():
+    automaton = make_floor(2)
+    for _ in range(0, 3):
+        # the generation's order is a single shuffle of the offset table by the neighbor stream
+        expected = list(range(0, len(automaton.neighbor_offsets)))
+        shadow = random.Random()
+        shadow.setstate(automaton.neighbor_rng.getstate())
+        shadow.shuffle(expected)
+        automaton.__permute_neighborhood__()
+        order = [automaton.neighbor_offsets[i] for i in expected]
+        for y in range(0, HEIGHT):
+            for x in range(0, WIDTH):
+                offsets = [(n_y - y, n_x - x) for n_y, n_x in automaton.__get_neighbors_at__((y, x))]
+                # clipped cells keep the relative order of the in-grid offsets
+                assert offsets == [offset for offset in order if offset in offsets]
@@ -0,0 +1,78 @@
+""" the generation iterator, run() and the observer hooks """
+
+import io
+import pytest
+from automata.mmn11_automata import ArrayEmergencyEscapeAutomaton
+from automata.observers import Observer, CsvStreamObserver
+from automata.simple_automata import RandomWalkAutomaton
+from tests import make_automaton
+
+
+class RecordingObserver(Observer):
+    """ records the hooks it was called with """
+
+    def __init__(self):
+        self.calls = []
+
+    def on_start(self, automaton):
+        self.calls.append(("start", automaton.get_gen_count()))
+
+    def on_generation(self, automaton, snapshot):
+        assert snapshot.generation == automaton.get_gen_count()
+        self.calls.append(("generation", snapshot.generation))
+
+    def on_end(self, automaton):
+        self.calls.append(("end", automaton.get_gen_count()))
+
+
+def test_hook_order_until_terminal():
+    observer = RecordingObserver()
+    automaton = make_automaton(ArrayEmergencyEscapeAutomaton).run([observer])
+    end = automaton.get_gen_count()
+    assert automaton.is_terminal()
+    assert observer.calls == [("start", 0)] + [("generation", gen) for gen in range(1, end + 1)] + [("end", end)]
+    assert automaton.observers == []  # detached at the end of the run
+    automaton.run([observer])  # a terminal automaton doesn't step
+    assert observer.calls[-2:] == [("start", end), ("end", end)]
+
+
+def test_max_generations_and_until():
+    observer = RecordingObserver()
+    automaton = make_automaton(RandomWalkAutomaton).run([observer], max_generations=7)
+    assert automaton.get_gen_count() == 7
+    assert observer.calls[-1] == ("end", 7) and len(observer.calls) == 9
+    automaton.run(until=lambda live, snapshot: snapshot.generation == 10)
+    assert automaton.get_gen_count() == 10
+    snapshots = list(automaton.iter_generations(max_generations=3))
+    assert [snapshot.generation for snapshot in snapshots] == [11, 12, 13]
+
+
+def test_snapshots_match_stats():
+    automaton = make_automaton(ArrayEmergencyEscapeAutomaton)
+    snapshots = list(automaton.iter_generations())
+    rows = list(automaton.get_stats().iter_rows())[1:]  # the seed row has no snapshot
+    assert [(snapshot.generation, tuple(snapshot.state_counts), tuple(snapshot.events)) for snapshot in snapshots] \
+        == rows
+    assert all(snapshot.moves is not None for snapshot in snapshots)
+
+
+def test_observer_ends_when_the_run_raises():
+    class Failing(Observer):
+        def on_generation(self, automaton, snapshot):
+            raise RuntimeError("observer failed")
+
+    observer = RecordingObserver()
+    automaton = make_automaton(RandomWalkAutomaton)
+    with pytest.raises(RuntimeError):
+        automaton.run([observer, Failing()], max_generations=5)
+    assert observer.calls == [("start", 0), ("generation", 1), ("end", 1)]
+    assert automaton.observers == []
+
+
+def test_csv_stream():
+    stream = io.StringIO()
+    automaton = make_automaton(ArrayEmergencyEscapeAutomaton).run([CsvStreamObserver(stream)], max_generations=4)
+    lines = stream.getvalue().splitlines()
+    assert lines[0] == "generation,state_0,state_1,state_2,event_0,event_1"
+    assert len(lines) == 5
+    assert lines[-1].split(",")[:4] == [str(value) for value in [4] + list(automaton.state_counts)]
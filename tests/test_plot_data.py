@@ -0,0 +1,62 @@
+""" plot data from automaton statistics - escape curves and min/max downsampling """
+
+import random
+import pytest
+from automata.mmn11_automata import ArrayEmergencyEscapeAutomaton
+from automata.stats_store import StatsStore
+from gui.plot_data import escape_curves, downsample_min_max
+from tests import make_automaton
+
+
+def run_with_store(**store_kwargs):
+    return make_automaton(ArrayEmergencyEscapeAutomaton, stats_store=StatsStore(**store_kwargs)).run()
+
+
+@pytest.mark.parametrize("store_kwargs", [{"every": 4}, {"every": 4, "ring_size": 5}])
+def test_escape_curves_dont_change_the_store(store_kwargs):
+    automaton = run_with_store(**store_kwargs)
+    stats = automaton.get_stats()
+    assert stats.get_pending_row() is not None or automaton.get_gen_count() % 4 == 0
+    rows = list(stats.iter_rows())
+    curves = escape_curves(automaton)
+    assert list(stats.iter_rows()) == rows and len(stats) == len(rows)  # nothing was flushed
+    flushed = run_with_store(**store_kwargs)
+    flushed.get_stats().flush()
+    for exit_pos, (generations, escaped) in escape_curves(flushed).items():
+        # the same points - a flushed ring buffer evicts its oldest row for the flushed one
+        assert curves[exit_pos][0][-len(generations):] == generations
+        assert curves[exit_pos][1][-len(escaped):] == escaped
+    for exit_pos, (generations, escaped) in curves.items():
+        assert generations[-1] == automaton.get_gen_count() - 1
+        assert escaped[-1] == automaton.get_exit_esc_total(exit_pos)
+
+
+def test_escape_curves_of_every_generation():
+    automaton = run_with_store()
+    escapes = automaton.get_exit_esc_count()
+    for exit_pos, (generations, escaped) in escape_curves(automaton).items():
+        assert generations == [0] + list(range(0, automaton.get_gen_count()))  # the seed point, then every row
+        assert escaped[-1] == sum(escapes[exit_pos].values())
+
+
+def test_downsample_keeps_min_max_and_endpoints():
+    rng = random.Random(1)
+    xs = sorted(rng.uniform(0, 1000) for _ in range(0, 20000))
+    ys = [rng.randint(-500, 500) for _ in xs]
+    columns = 100
+    out_xs, out_ys = downsample_min_max(xs, ys, 0, 1000, columns)
+    assert len(out_xs) <= 4 * (columns + 1)
+    assert (out_xs[0], out_ys[0]) == (xs[0], ys[0]) and (out_xs[-1], out_ys[-1]) == (xs[-1], ys[-1])
+    assert out_xs == sorted(out_xs)
+    points = set(zip(xs, ys))
+    assert all(point in points for point in zip(out_xs, out_ys))
+    for column in range(0, columns):
+        bucket = [y for x, y in zip(xs, ys) if column * 10 <= x < (column + 1) * 10]
+        kept = [y for x, y in zip(out_xs, out_ys) if column * 10 <= x < (column + 1) * 10]
+        if bucket:
+            assert min(kept) == min(bucket) and max(kept) == max(bucket)
+
+
+def test_downsample_short_input_is_unchanged():
+    xs, ys = [0, 1, 2], [5, 3, 4]
+    assert downsample_min_max(xs, ys, 0, 2, 10) == (xs, ys)
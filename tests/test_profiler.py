@@ -0,0 +1,82 @@
+""" the phase profiler - the reported phases and that they account for the whole generation """
+
+import io
+import json
+import pytest
+from automata.mmn11_automata import EmergencyEscapeAutomaton, ArrayEmergencyEscapeAutomaton
+from automata.observers import Observer
+from automata.profiler import PhaseProfiler
+from tests import make_automaton
+
+TRANSITION_PHASES = ["permute", "crowd", "allocate", "first_pass.exit_choice", "first_pass.neighbors", "second_pass",
+                     "transition", "stats"]
+
+
+class LoggingClock:
+    """ a fake clock which ticks by a growing step on every read and logs the times it returned """
+
+    def __init__(self):
+        self.readings = []
+
+    def __call__(self):
+        self.readings.append((self.readings[-1] if self.readings else 0.0) + 0.25 * (len(self.readings) + 1))
+        return self.readings[-1]
+
+
+def profile(automaton_cls, generations, observers=()):
+    """ runs a profiled automaton and returns its profiler, clock and the generations written to the stream """
+    clock = LoggingClock()
+    stream = io.StringIO()
+    automaton = make_automaton(automaton_cls)
+    for observer in observers:
+        automaton.add_observer(observer)
+    profiler = automaton.enable_profiling(PhaseProfiler(stream, clock))
+    for _ in range(0, generations):
+        automaton.update_world_state()
+    return profiler, clock, [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+@pytest.mark.parametrize("automaton_cls", [EmergencyEscapeAutomaton, ArrayEmergencyEscapeAutomaton])
+def test_reported_phases(automaton_cls):
+    profiler, _, records = profile(automaton_cls, 3)
+    assert profiler.phase_order == TRANSITION_PHASES
+    assert [record["generation"] for record in records] == [1, 2, 3]
+    for record in records:
+        # every phase is lapped once per generation - the permutation isn't counted in another phase
+        assert list(record["phases"]) == TRANSITION_PHASES
+        assert all(calls == 1 for _, calls in record["phases"].values())
+
+
+def test_observers_phase():
+    profiler, _, records = profile(ArrayEmergencyEscapeAutomaton, 2, [Observer()])
+    assert profiler.phase_order == TRANSITION_PHASES + ["observers"]
+    assert all(list(record["phases"])[-1] == "observers" for record in records)
+
+
+@pytest.mark.parametrize("automaton_cls", [EmergencyEscapeAutomaton, ArrayEmergencyEscapeAutomaton])
+def test_generation_totals_add_up(automaton_cls):
+    profiler, clock, records = profile(automaton_cls, 4)
+    start = 0
+    for record in records:
+        # a clock read on the generation start and one per lap - the phases cover the span between them exactly
+        end = start + sum(calls for _, calls in record["phases"].values())
+        span = clock.readings[end] - clock.readings[start]
+        assert sum(seconds for seconds, _ in record["phases"].values()) == pytest.approx(span)
+        start = end + 1
+    assert start == len(clock.readings)
+    summary = profiler.get_summary()
+    assert sum(seconds for _, seconds, _, _, _ in summary) == pytest.approx(
+        sum(sum(seconds for seconds, _ in record["phases"].values()) for record in records))
+    assert sum(share for _, _, _, _, share in summary) == pytest.approx(1.0)
+    assert all(calls == 4 for _, _, calls, _, _ in summary)
+
+
+def test_disabled_profiler_records_nothing():
+    automaton = make_automaton(ArrayEmergencyEscapeAutomaton)
+    profiler = automaton.enable_profiling()
+    automaton.update_world_state()
+    assert automaton.disable_profiling() is profiler
+    automaton.update_world_state()
+    assert profiler.generations == 1
+    profiler.reset()
+    assert profiler.get_summary() == [] and profiler.generations == 0
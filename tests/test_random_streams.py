@@ -0,0 +1,75 @@
+""" per automaton random streams - the same seed must give the same run """
+
+import itertools
+import random
+import pytest
+from automata.simple_automata import RandomWalkAutomaton, FoodHierarchyAutomaton
+from tests import make_automaton
+
+
+@pytest.mark.parametrize("automaton_cls", [RandomWalkAutomaton, FoodHierarchyAutomaton])
+def test_same_seed_same_run(automaton_cls):
+    first, second = make_automaton(automaton_cls, seed=5), make_automaton(automaton_cls, seed=5)
+    first.run(max_generations=20)
+    second.run(max_generations=20)
+    assert first.get_flat_grid() == second.get_flat_grid()
+    assert list(first.get_stats().iter_rows()) == list(second.get_stats().iter_rows())
+    assert first.get_flat_grid() != make_automaton(automaton_cls, seed=6).run(max_generations=20).get_flat_grid()
+
+
+@pytest.mark.parametrize("min_state, max_state", [(0, 1), (1, 9), (0, 255), (3, 3)])
+def test_rand_states(min_state, max_state):
+    automaton = make_automaton(FoodHierarchyAutomaton, seed=1)
+    automaton.rng = random.Random(2)
+    states = automaton.rand_states(20000, min_state, max_state)
+    assert len(states) == 20000
+    assert min(states) == min_state and max(states) == max_state
+    automaton.rng = random.Random(2)
+    assert automaton.rand_states(20000, min_state, max_state) == states
+
+
+@pytest.mark.parametrize("min_state, max_state", [(0, 256), (5, 4), (-1, 3)])
+def test_rand_states_invalid(min_state, max_state):
+    with pytest.raises(ValueError):
+        make_automaton(FoodHierarchyAutomaton, seed=1).rand_states(10, min_state, max_state)
+
+
+def test_rand_states_uniform():
+    automaton = make_automaton(FoodHierarchyAutomaton, seed=1)
+    states = automaton.rand_states(90000, 1, 9)
+    counts = [states.count(state) for state in range(1, 10)]
+    assert all(abs(count - 10000) < 500 for count in counts)  # ~5 standard deviations
+
+
+def test_rand_weighted_index_distribution():
+    automaton = make_automaton(FoodHierarchyAutomaton, seed=1)
+    weights = [1, 2, 0, 3, 4]
+    cum_weights = list(itertools.accumulate(weights))
+    draws = [automaton.rand_weighted_index(cum_weights) for _ in range(0, 100000)]
+    for index, weight in enumerate(weights):
+        expected = 100000 * weight / 10
+        assert abs(draws.count(index) - expected) <= 5 * (expected * (1 - weight / 10)) ** 0.5  # ~5 standard deviations
+
+
+@pytest.mark.parametrize("weights", [[0, 3, 0, 2], [0, 0, 1], [4, 0, 0], [0, 1, 0]])
+def test_rand_weighted_index_zero_weights(weights):
+    automaton = make_automaton(FoodHierarchyAutomaton, seed=1)
+    cum_weights = list(itertools.accumulate(weights))
+    # the edges of the draw range included - a zero weight item is never chosen, not even on a tie
+    rand_probs = [0.0, 0.5, 1 - 2 ** -53] + automaton.rand_uniforms(1000)
+    chosen = {automaton.rand_weighted_index(cum_weights, rand_prob) for rand_prob in rand_probs}
+    assert chosen == {index for index, weight in enumerate(weights) if weight}
+
+
+def test_rand_weighted_index_single_item():
+    automaton = make_automaton(FoodHierarchyAutomaton, seed=1)
+    assert {automaton.rand_weighted_index([0.7]) for _ in range(0, 100)} == {0}
+    assert automaton.rand_weighted_index([0.7], 0.0) == 0
+
+
+def test_rand_weighted_index_given_draw():
+    # a given draw is the same as the one drawn from the automaton's stream
+    cum_weights = [0.5, 1.75, 2.0, 4.5]
+    first, second = make_automaton(FoodHierarchyAutomaton, seed=3), make_automaton(FoodHierarchyAutomaton, seed=3)
+    assert [first.rand_weighted_index(cum_weights) for _ in range(0, 200)] == [
+        second.rand_weighted_index(cum_weights, rand_prob) for rand_prob in second.rand_uniforms(200)]
@@ -0,0 +1,120 @@
+""" scenario images and files - round trips through the formats and malformed input """
+
+import random
+import struct
+import zlib
+import pytest
+from automata.mmn11_automata import ArrayEmergencyEscapeAutomaton
+from automata.scenario import (Scenario, MAGIC, HEADER_FORMAT, STATE_EMPTY, STATE_PERSON, STATE_EXIT, STATE_WALL,
+                               parse_raster, parse_scenario, encode_scenario, load_scenario, save_scenario,
+                               density_occupancy, build_automaton)
+
+# a 4x5 floor - '#' wall, 'p' person, 'e' exit, '.' floor
+FLOOR = ["#e###",
+         "#.p.#",
+         "#p..e",
+         "#####"]
+HEIGHT, WIDTH = len(FLOOR), len(FLOOR[0])
+CELL_STATES = {"#": STATE_WALL, "p": STATE_PERSON, "e": STATE_EXIT, ".": STATE_EMPTY}
+PIXELS = {"#": b"\x00\x00\x00", "p": b"\xc8\x10\x10", "e": b"\x00\xff\x00", ".": b"\xff\xff\xff"}
+
+
+def floor_cells():
+    """ returns the floor as a flat string of cell characters """
+    return "".join(FLOOR)
+
+
+def floor_scenario(params=None):
+    """ returns the Scenario of the test floor """
+    cells = floor_cells()
+    exits = [divmod(i, WIDTH) for i, cell in enumerate(cells) if cell == "e"]
+    return Scenario(HEIGHT, WIDTH, exits, bytes(int(cell != "#") for cell in cells),
+                    bytes(int(cell == "p") for cell in cells), dict(params or {}))
+
+
+def ppm(header=None):
+    """ returns the test floor as a binary ppm image """
+    header = header if header is not None else b"P6\n%d %d\n255\n" % (WIDTH, HEIGHT)
+    return header + b"".join(PIXELS[cell] for cell in floor_cells())
+
+
+def test_ppm_round_trip():
+    scenario = parse_raster(ppm(), params={"exit_rad": 2})
+    assert scenario == floor_scenario({"exit_rad": 2})
+    assert parse_scenario(encode_scenario(scenario)) == scenario
+
+
+def test_pgm_with_comments_and_given_exits():
+    gray = bytes(0 if cell == "#" else 200 for cell in floor_cells())
+    data = b"P5 # a floor\n# of a test\n%d %d 255\n" % (WIDTH, HEIGHT) + gray
+    scenario = parse_raster(data, exits=[[0, 1]])
+    assert scenario.exits == [(0, 1)]
+    assert scenario.passable == floor_scenario().passable
+    assert scenario.occupancy is None  # people are seeded by the automaton or a density
+
+
+def test_scenario_file_round_trip(tmp_path):
+    path = str(tmp_path / "floor.scn")
+    save_scenario(path, floor_scenario({"dist_mod": 2, "density": 0.5}))
+    scenario = load_scenario(path, params={"crowd_mod": 4})
+    assert scenario == floor_scenario({"dist_mod": 2, "density": 0.5, "crowd_mod": 4})
+    with open(path, "rb") as scenario_file:
+        data = scenario_file.read()
+    json_length = struct.unpack_from(HEADER_FORMAT, data)[3]
+    states = zlib.decompress(data[struct.calcsize(HEADER_FORMAT) + json_length:])
+    assert list(states) == [CELL_STATES[cell] for cell in floor_cells()]
+
+
+def test_scenario_without_walls_or_people():
+    scenario = Scenario(3, 4, [(0, 0)], None, None, {})
+    assert parse_scenario(encode_scenario(scenario)) == scenario
+    assert parse_raster(b"P5 4 3 255\n" + bytes([255] * 12), exits=[(0, 0)]) == scenario
+
+
+@pytest.mark.parametrize("header", [b"P6\n%d\n" % WIDTH,  # missing fields
+                                    b"P6\n%d four\n255\n" % WIDTH,
+                                    b"P6\n%d -%d\n255\n" % (WIDTH, HEIGHT),
+                                    b"P6\n# a comment with no end",
+                                    b"P3\n%d %d\n255\n" % (WIDTH, HEIGHT),  # ascii pixels
+                                    b"P6\n%d %d\n65535\n" % (WIDTH, HEIGHT),  # 16 bit channels
+                                    b"P6\n%d %d\n255\n" % (WIDTH, HEIGHT + 1)])  # truncated pixels
+def test_malformed_raster(header):
+    with pytest.raises(ValueError):
+        parse_raster(ppm(header))
+
+
+@pytest.mark.parametrize("data", [b"", MAGIC, b"CASCEN99" + encode_scenario(floor_scenario())[8:],
+                                  encode_scenario(floor_scenario())[:30],  # truncated json
+                                  struct.pack(HEADER_FORMAT, MAGIC, HEIGHT, WIDTH + 1, 2) + b"{}" +
+                                  zlib.compress(bytes(HEIGHT * WIDTH))])  # wrong cell count
+def test_malformed_scenario_file(data):
+    with pytest.raises(ValueError):
+        parse_scenario(data)
+
+
+class OldRandom(random.Random):
+    """ getrandbits as before python 3.9 - zero bits are an error """
+
+    def getrandbits(self, k):
+        if k <= 0:
+            raise ValueError("number of bits must be greater than zero")
+        return random.Random.getrandbits(self, k)
+
+
+@pytest.mark.parametrize("height, width", [(0, 0), (0, 7), (7, 0)])
+def test_density_of_an_empty_floor(height, width):
+    assert density_occupancy(height, width, 0.5, OldRandom(1)) == b""
+
+
+def test_density_occupancy():
+    passable = floor_scenario().passable
+    assert density_occupancy(HEIGHT, WIDTH, 0.0, OldRandom(1)) == bytes(HEIGHT * WIDTH)
+    assert density_occupancy(HEIGHT, WIDTH, 1.0, OldRandom(1), passable) == passable
+    occupancy = density_occupancy(200, 200, 0.25, OldRandom(1))
+    assert abs(occupancy.count(1) - 10000) < 500  # ~5 standard deviations
+    assert occupancy == density_occupancy(200, 200, 0.25, OldRandom(1))
+
+
+def test_build_automaton():
+    automaton = build_automaton(floor_scenario(), ArrayEmergencyEscapeAutomaton, rng_seed=3)
+    assert list(automaton.get_flat_grid()) == [CELL_STATES[cell] for cell in floor_cells()]
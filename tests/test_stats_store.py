@@ -0,0 +1,31 @@
+""" the columnar statistics buffer """
+
+import pytest
+from automata.stats_store import StatsStore
+
+
+@pytest.mark.parametrize("kwargs", [{"ring_size": 0}, {"ring_size": -3}, {"every": 0}])
+def test_invalid_parameters(kwargs):
+    with pytest.raises(ValueError):
+        StatsStore(**kwargs)
+
+
+def test_ring_buffer_keeps_last_rows():
+    store = StatsStore(ring_size=3)
+    store.allocate(2, 1)
+    for generation in range(0, 10):
+        store.record(generation, (generation, 10 - generation), (1,))
+    assert store.get_generations() == [7, 8, 9]
+    assert store.get_state_column(1) == [3, 2, 1]
+    assert store.get_initial_counts() == (0, 10)
+    assert store.get_event_totals() == [10]
+
+
+def test_decimation_sums_skipped_events():
+    store = StatsStore(every=4)
+    store.allocate(1, 1)
+    for generation in range(0, 10):
+        store.record(generation, (generation,), (1,))
+    store.flush()
+    assert store.get_generations() == [0, 4, 8, 9]
+    assert store.get_event_column(0) == [1, 4, 4, 1]
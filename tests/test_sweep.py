@@ -0,0 +1,53 @@
+""" sweep results depend only on the sweep seed - not on the number of workers or the order runs finish in """
+
+import pytest
+from automata.mmn11_automata import ArrayEmergencyEscapeAutomaton
+from stats.sweep import param_grid, run_sweep, run_shared_sweep
+
+AUTOMATON_KWARGS = {"height": 20, "width": 20, "exits": [(0, 0), (19, 19)]}
+PARAMS_LIST = param_grid(dist_mod=[1, 3], crowd_mod=[0, 2])
+RUNS = 3
+CURVE_LENGTH = 40
+
+
+def shared_sweep(workers, seed=5):
+    return run_shared_sweep(ArrayEmergencyEscapeAutomaton, PARAMS_LIST, RUNS, CURVE_LENGTH, workers=workers,
+                            seed=seed, progress=False, **AUTOMATON_KWARGS)
+
+
+@pytest.fixture(scope="module")
+def single_worker():
+    return shared_sweep(workers=1)
+
+
+def test_shared_sweep_workers(single_worker):
+    results = shared_sweep(workers=2)
+    assert results.view().tobytes() == single_worker.view().tobytes()
+    for params in PARAMS_LIST:
+        assert len(results.get_gen_counts(params)) == RUNS
+
+
+def test_shared_sweep_matches_run_sweep(single_worker):
+    for workers in (1, 2):
+        aggregate = run_sweep(ArrayEmergencyEscapeAutomaton, PARAMS_LIST, RUNS, workers=workers, seed=5,
+                              progress=False, **AUTOMATON_KWARGS)
+        for params in PARAMS_LIST:
+            assert aggregate.avg_gen_count(params) == pytest.approx(single_worker.summarize_gen_count(params).mean)
+            avg_escaped = aggregate.avg_escaped_at_exit(params)
+            for exit_idx, exit_pos in enumerate(AUTOMATON_KWARGS["exits"]):
+                assert avg_escaped.get(exit_pos, 0) == pytest.approx(
+                    single_worker.summarize_escaped_at_exit(params, exit_idx).mean)
+
+
+def test_shared_sweep_seed(single_worker):
+    assert shared_sweep(workers=1).view().tobytes() == single_worker.view().tobytes()
+    assert shared_sweep(workers=1, seed=6).view().tobytes() != single_worker.view().tobytes()
+
+
+def test_escape_curves(single_worker):
+    for params in PARAMS_LIST:
+        for gen_count, curve in zip(single_worker.get_gen_counts(params), single_worker.get_curves(params)):
+            assert len(curve) == CURVE_LENGTH
+            assert curve == sorted(curve)  # cumulative
+            if gen_count < CURVE_LENGTH:
+                assert curve[gen_count:] == [curve[-1]] * (CURVE_LENGTH - gen_count)
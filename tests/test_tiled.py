@@ -0,0 +1,28 @@
+""" tiled engines - runs don't depend on the number of workers and the worker pool is always stopped """
+
+import multiprocessing
+from automata.tiled import TiledEmergencyEscapeAutomaton, TiledRandomWalkAutomaton
+
+EXITS = [(0, 0), (47, 47)]
+
+
+def test_evacuation_workers_give_the_same_run():
+    runs = []
+    for workers in (1, 2):
+        automaton = TiledEmergencyEscapeAutomaton(48, 48, EXITS, tile_size=16, workers=workers, rng_seed=4).run()
+        assert automaton.is_terminal() and automaton.tile_pool is None
+        runs.append(list(automaton.get_stats().iter_rows()))
+    assert runs[0] == runs[1]
+
+
+def test_random_walk_pool_is_stopped():
+    automaton = TiledRandomWalkAutomaton(32, 32, tile_size=8, workers=2, rng_seed=4)
+    automaton.run(max_generations=5)
+    assert automaton.tile_pool is None
+    with TiledRandomWalkAutomaton(32, 32, tile_size=8, workers=2, rng_seed=4) as stepped:
+        for _ in range(0, 5):
+            stepped.update_world_state()
+        assert stepped.tile_pool is not None
+    assert stepped.tile_pool is None
+    assert stepped.get_flat_grid() == automaton.get_flat_grid()
+    assert not multiprocessing.active_children()
@@ -0,0 +1,65 @@
+""" trajectory recording and replay """
+
+import pytest
+from automata.mmn11_automata import ArrayEmergencyEscapeAutomaton
+from automata.observers import CallbackObserver
+from automata.trajectory import TrajectoryRecorder, TrajectoryReader, ReplayAutomaton
+from tests import make_automaton
+
+
+@pytest.fixture
+def recorded_run(tmp_path):
+    """ returns (trajectory path, live flat grid of every generation, the finished automaton) """
+    path = str(tmp_path / "run.traj")
+    automaton = make_automaton(ArrayEmergencyEscapeAutomaton, seed=3)
+    grids = [automaton.get_flat_grid()]
+    observer = CallbackObserver(lambda live, snapshot: grids.append(live.get_flat_grid()))
+    automaton.run([TrajectoryRecorder(path, keyframe_interval=8), observer])
+    return path, grids, automaton
+
+
+def test_frames_match_live_grids(recorded_run):
+    path, grids, _ = recorded_run
+    reader = TrajectoryReader(path)
+    try:
+        assert len(reader) == len(grids)
+        assert all(reader.get_frame(generation) == grid for generation, grid in enumerate(grids))
+        assert [bytes(frame) for frame in reader.iter_frames(5)] == grids[5:]
+    finally:
+        reader.close()
+
+
+def test_replay_matches_run(recorded_run):
+    path, grids, automaton = recorded_run
+    replay = ReplayAutomaton(path)
+    replay.run()
+    assert replay.reader.data.closed  # closed at the last recorded generation
+    assert replay.get_flat_grid() == grids[-1]
+    assert list(replay.get_stats().iter_rows()) == list(automaton.get_stats().iter_rows())
+    assert replay.get_exit_esc_count() == automaton.get_exit_esc_count()
+    assert replay.boundary_class is None  # no neighborhood index for recorded generations
+
+
+def test_replay_numbers_generations_from_the_first_recorded(tmp_path):
+    path = str(tmp_path / "resumed.traj")
+    automaton = make_automaton(ArrayEmergencyEscapeAutomaton, seed=3).run(max_generations=10)
+    live_rows = []
+    observer = CallbackObserver(lambda live, snapshot: live_rows.append(
+        (snapshot.generation, tuple(snapshot.state_counts), tuple(snapshot.events))))
+    automaton.run([TrajectoryRecorder(path, keyframe_interval=8), observer])
+    reader = TrajectoryReader(path)
+    try:
+        assert reader.first_generation == 10
+        assert len(reader) == automaton.get_gen_count() - 10 + 1
+    finally:
+        reader.close()
+    replay = ReplayAutomaton(path)
+    assert replay.get_gen_count() == 10
+    replay.run()
+    assert replay.get_gen_count() == automaton.get_gen_count()
+    assert list(replay.get_stats().iter_rows())[1:] == live_rows
+    # escapes are keyed by the generation people escaped from - the first recorded row holds the escapes from 9
+    recorded = {exit_pos: {generation: count for generation, count in counts.items() if generation >= 9}
+                for exit_pos, counts in automaton.get_exit_esc_count().items()}
+    assert {exit_pos: {generation: count for generation, count in counts.items() if generation}
+            for exit_pos, counts in replay.get_exit_esc_count().items()} == recorded